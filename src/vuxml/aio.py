@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML asyncio API
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+These coroutines let asyncio programs load and query the VuXML database
+without blocking their event loop:
+    vuxml = await load_vuxml_async()
+    vids = await search_vulns_async(vuxml, Package("openssl", "3.0.1"))
+
+The database is downloaded in the event loop default executor, like the
+synchronous functions do it, while its parsing and queries are run in an
+executor (the event loop default one, unless another one is given).
+Concurrent calls to load_vuxml_async() with the same arguments share the
+same load, which is not cancelled when one of its callers is.
+"""
+
+import functools
+
+from .library import _download_vuxml # pylint: disable=W0212
+from .library import CACHE_MAX_AGE, LATEST_VUXML, load_vuxml, audit_packages, resolve_references
+from .query import search_vulns
+
+# Loads in progress, by event loop and arguments
+_loads = {}
+
+
+####################################################################################################
+def _get_running_loop():
+    """ Return the running event loop """
+    import asyncio # pylint: disable=C0415
+
+    # asyncio.get_running_loop() is only available since Python 3.7
+    if hasattr(asyncio, "get_running_loop"):
+        return asyncio.get_running_loop()
+    return asyncio.get_event_loop()
+
+
+####################################################################################################
+async def _download_vuxml_async(url=LATEST_VUXML, max_age=CACHE_MAX_AGE, offline=False):
+    """ Download and cache the latest FreeBSD VuXML version without blocking """
+    # The download is streamed to disk, holding the cache lock, in the default executor
+    return await _get_running_loop().run_in_executor(
+        None,
+        _download_vuxml,
+        url,
+        max_age,
+        offline
+    )
+
+
+####################################################################################################
+async def _load_vuxml_async(url, filename, max_age, offline, executor, **kwargs):
+    """ Download the VuXML file if no filename is given, and load it in an executor """
+    if not filename:
+        filename = await _download_vuxml_async(url, max_age, offline)
+        if not filename:
+            return {}
+
+    return await _get_running_loop().run_in_executor(
+        executor,
+        functools.partial(load_vuxml, filename=filename, **kwargs)
+    )
+
+
+####################################################################################################
+async def load_vuxml_async(
+    use_cache=True,
+    filename="",
+    max_age=CACHE_MAX_AGE,
+    offline=False,
+    lazy_descriptions=False,
+    compact=False,
+    jobs=1,
+    url=LATEST_VUXML,
+    executor=None
+):
+    """ Return a VuXMLDatabase from a FreeBSD VuXML file without blocking the event loop,
+    sharing the load in progress with the same arguments, if any """
+    import asyncio # pylint: disable=C0415
+
+    loop = _get_running_loop()
+    key = (loop, use_cache, filename, max_age, offline, lazy_descriptions, compact, jobs, url)
+    task = _loads.get(key)
+    if task is None:
+        task = asyncio.ensure_future(
+            _load_vuxml_async(
+                url,
+                filename,
+                max_age,
+                offline,
+                executor,
+                use_cache=use_cache,
+                lazy_descriptions=lazy_descriptions,
+                compact=compact,
+                jobs=jobs
+            )
+        )
+        _loads[key] = task
+        task.add_done_callback(lambda _: _loads.pop(key, None))
+
+    # A cancelled caller doesn't cancel the load shared with the other ones
+    return await asyncio.shield(task)
+
+
+####################################################################################################
+async def _run_async(executor, function, *args):
+    """ Return the result of a function called in an executor """
+    return await _get_running_loop().run_in_executor(executor, function, *args)
+
+
+####################################################################################################
+async def search_vulns_async(vuxml, query, executor=None):
+    """ Return a list of VID matching a query, in the VuXML data structure order,
+    without blocking the event loop """
+    return await _run_async(executor, search_vulns, vuxml, query)
+
+
+####################################################################################################
+async def audit_packages_async(vuxml, packages, executor=None):
+    """ Return a dictionary of VID lists by "name-version" from a list of (name, version),
+    without blocking the event loop """
+    return await _run_async(executor, audit_packages, vuxml, packages)
+
+
+####################################################################################################
+async def resolve_references_async(vuxml, references, executor=None):
+    """ Return a dictionary of VID lists by reference from a list of "identifier"
+    or "source~identifier" strings, without blocking the event loop """
+    return await _run_async(executor, resolve_references, vuxml, references)
@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML library benchmarks
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+Usage: python -m vuxml.benchmark [--count N] [--seed N] [--file FILE] [--generate FILE]
+                                 [--json] [--no-memory] [--help]
+
+Times the loading, indexing, search and printing functions of the library on a
+synthetic VuXML file of --count vulnerabilities (10000 by default), generated
+in a temporary directory, or on a copy of an existing VuXML --file. Nothing is
+downloaded. The startup of new Python processes importing the library, or
+running the vuxml command without queries, is also timed.
+
+Each benchmark reports its number of operations, duration, throughput and,
+unless --no-memory is used, the peak memory allocated by Python during a
+second run traced with tracemalloc. The --json option prints these results
+as a JSON object, for regression tracking.
+
+The --generate option only writes a synthetic VuXML file.
+"""
+
+import contextlib
+import getopt
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from .library import load_vuxml, get_vulns_by_topics, get_vulns_by_packages, \
+                     get_vulns_by_references, get_vuxml_sources, get_vulns_by_discovery_dates, \
+                     get_vulns_by_entry_dates, get_vulns_by_modified_dates, search_vulns_by_regex, \
+                     search_vulns_by_words, search_vulns_by_reference, resolve_references, \
+                     search_vulns_by_package, audit_packages, search_vulns_by_discovery_date, \
+                     search_vulns_by_entry_date, search_vulns_by_modified_date, \
+                     search_vulns_by_date_range, print_vuln, VuXMLDatabase
+from .stats import get_peak_memory
+
+# Default number of vulnerabilities of the synthetic VuXML file
+DEFAULT_COUNT = 10000
+
+# Number of queries of the search benchmarks
+QUERIES_COUNT = 1000
+
+# Number of processes started by the startup benchmarks
+STARTUP_COUNT = 10
+
+_PACKAGE_PREFIXES = ("", "", "", "py39-", "py311-", "p5-", "php82-", "rubygem-", "linux-rl9-", "")
+_PACKAGE_NAMES = (
+    "openssl", "curl", "nginx", "apache24", "firefox", "chromium", "gnutls", "samba419", "sudo",
+    "postgresql15-server", "mysql80-server", "redis", "go", "rust", "node", "python311", "perl5",
+    "php82", "ruby", "git", "subversion", "xorg-server", "libxml2", "expat", "zlib", "jenkins",
+    "wordpress", "django", "gitlab-ce", "mongodb60", "bind918", "unbound", "openssh-portable",
+    "wireshark", "vim", "emacs", "qemu", "xen-kernel", "libressl", "mutt", "dovecot", "postfix",
+)
+_REFERENCE_SOURCES = (
+    "cvename", "cvename", "cvename", "url", "url", "freebsdsa", "freebsdpr", "bid", "mlist",
+    "certvu",
+)
+_WORDS = (
+    "buffer", "overflow", "remote", "attacker", "denial", "service", "code", "execution",
+    "cross", "site", "scripting", "injection", "memory", "corruption", "heap", "stack", "use",
+    "after", "free", "null", "pointer", "dereference", "information", "disclosure", "privilege",
+    "escalation", "authentication", "bypass", "crafted", "request", "response", "header", "file",
+    "path", "traversal", "integer", "race", "condition", "certificate", "validation", "server",
+    "client", "library", "parser", "the", "a", "of", "in", "to", "and", "could", "allow", "via",
+)
+_TOPIC_KINDS = (
+    "multiple vulnerabilities", "denial of service", "remote code execution", "buffer overflow",
+    "cross-site scripting", "information disclosure", "privilege escalation", "SQL injection",
+)
+
+
+####################################################################################################
+def _get_version(generator):
+    """ Return a random FreeBSD port version """
+    version = ".".join(str(generator.randint(0, 30)) for _ in range(generator.randint(1, 4)))
+    dice = generator.random()
+    if dice < 0.05:
+        version += f".b{generator.randint(1, 5)}"
+    elif dice < 0.1:
+        version += f"p{generator.randint(1, 9)}"
+    elif dice < 0.15:
+        version += generator.choice("abcdefghijk")
+    if generator.random() < 0.3:
+        version += f"_{generator.randint(1, 12)}"
+    if generator.random() < 0.1:
+        version += f",{generator.randint(1, 3)}"
+
+    return version
+
+
+####################################################################################################
+def _get_range(generator):
+    """ Return the XML of a random versions range """
+    dice = generator.random()
+    if dice < 0.55:
+        return f"<range><lt>{_get_version(generator)}</lt></range>"
+    if dice < 0.8:
+        lower, upper = sorted((_get_version(generator), _get_version(generator)))
+        return f"<range><ge>{lower}</ge><lt>{upper}</lt></range>"
+    if dice < 0.88:
+        return f"<range><le>{_get_version(generator)}</le></range>"
+    if dice < 0.95:
+        return f"<range><eq>{_get_version(generator)}</eq></range>"
+    if dice < 0.98:
+        return f"<range><gt>{_get_version(generator)}</gt></range>"
+    return "<range><ge>0</ge></range>"
+
+
+####################################################################################################
+def _get_sentence(generator):
+    """ Return a random sentence """
+    words = [generator.choice(_WORDS) for _ in range(generator.randint(5, 25))]
+    return " ".join(words).capitalize() + "."
+
+
+####################################################################################################
+def _get_description(generator, package_name):
+    """ Return the XML of a random description, most of them short and a few very long """
+    paragraphs_count = min(int(generator.paretovariate(1.5)), 40)
+    lines = [
+        '<body xmlns="http://www.w3.org/1999/xhtml">',
+        f"\t<p>The {package_name} project reports:</p>",
+        f'\t<blockquote cite="https://www.example.org/{package_name}/advisory.html">',
+    ]
+    for _ in range(paragraphs_count):
+        lines.append(
+            "\t  <p>" + " ".join(
+                _get_sentence(generator) for _ in range(generator.randint(1, 5))
+            ) + "</p>"
+        )
+    if generator.random() < 0.3:
+        lines.append("\t  <ul>")
+        for _ in range(generator.randint(2, 6)):
+            lines.append(f"\t    <li>{_get_sentence(generator)}</li>")
+        lines.append("\t  </ul>")
+    lines.append("\t</blockquote>")
+    lines.append("      </body>")
+
+    return "\n      ".join(lines)
+
+
+####################################################################################################
+def _get_reference(generator, year, package_name):
+    """ Return the XML of a random reference """
+    source = generator.choice(_REFERENCE_SOURCES)
+    if source == "cvename":
+        identifier = f"CVE-{year}-{generator.randint(1000, 49999)}"
+    elif source == "freebsdsa":
+        identifier = f"SA-{year % 100:02d}:{generator.randint(1, 20):02d}.{package_name}"
+    elif source == "freebsdpr":
+        identifier = f"ports/{generator.randint(100000, 280000)}"
+    elif source == "bid":
+        identifier = str(generator.randint(10000, 99999))
+    elif source == "certvu":
+        identifier = str(generator.randint(100000, 999999))
+    else:
+        identifier = f"https://www.example.org/{package_name}/{generator.randint(1, 10 ** 6)}"
+
+    return f"<{source}>{identifier}</{source}>"
+
+
+####################################################################################################
+def _get_date(generator, year):
+    """ Return a random date of a year """
+    return f"{year:04d}-{generator.randint(1, 12):02d}-{generator.randint(1, 28):02d}"
+
+
+####################################################################################################
+def _get_vuln(generator, package_names):
+    """ Return the XML of a random vuln element """
+    vid = uuid.UUID(int=generator.getrandbits(128), version=4)
+    package_name = generator.choice(package_names)
+    year = generator.randint(2003, 2024)
+    lines = [
+        f'  <vuln vid="{vid}">',
+        f"    <topic>{package_name} -- {generator.choice(_TOPIC_KINDS)}</topic>",
+        "    <affects>",
+    ]
+    for package_number in range(generator.choice((1, 1, 1, 1, 2, 2, 3, 5))):
+        lines.append("      <package>")
+        if package_number:
+            names = generator.sample(package_names, generator.choice((1, 1, 1, 2, 4)))
+        else:
+            names = [package_name]
+        for name in names:
+            lines.append(f"\t<name>{name}</name>")
+        for _ in range(generator.choice((1, 1, 1, 2, 2, 3, 6))):
+            lines.append(f"\t{_get_range(generator)}")
+        lines.append("      </package>")
+    lines.append("    </affects>")
+    lines.append("    <description>")
+    lines.append(f"      {_get_description(generator, package_name)}")
+    lines.append("    </description>")
+    lines.append("    <references>")
+    for _ in range(generator.choice((0, 1, 1, 2, 2, 3, 5, 12))):
+        lines.append(f"      {_get_reference(generator, year, package_name)}")
+    lines.append("    </references>")
+    lines.append("    <dates>")
+    entry_year = min(year + generator.randint(0, 1), 2024)
+    lines.append(f"      <discovery>{_get_date(generator, year)}</discovery>")
+    lines.append(f"      <entry>{_get_date(generator, entry_year)}</entry>")
+    if generator.random() < 0.3:
+        modified_year = min(entry_year + 1, 2024)
+        lines.append(f"      <modified>{_get_date(generator, modified_year)}</modified>")
+    lines.append("    </dates>")
+    if generator.random() < 0.005:
+        superseded = uuid.UUID(int=generator.getrandbits(128), version=4)
+        lines.append(f'    <cancelled superseded="{superseded}"/>')
+    lines.append("  </vuln>")
+
+    return "\n".join(lines) + "\n"
+
+
+####################################################################################################
+def generate_vuxml(filename, count=DEFAULT_COUNT, seed=0):
+    """ Write a synthetic FreeBSD VuXML file of count vulnerabilities (the same for the same seed),
+    with varied affected versions ranges, references and descriptions sizes """
+    generator = random.Random(seed)
+
+    # The number of packages grows with the number of vulnerabilities, like in the real database
+    package_names = [
+        prefix + name for prefix in sorted(set(_PACKAGE_PREFIXES)) for name in _PACKAGE_NAMES
+    ]
+    package_names += [
+        f"{generator.choice(_PACKAGE_PREFIXES)}package{number}"
+        for number in range(max(count // 4 - len(package_names), 0))
+    ]
+
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        file.write('<vuxml xmlns="http://www.vuxml.org/apps/vuxml-1">\n')
+        for _ in range(count):
+            file.write(_get_vuln(generator, package_names))
+        file.write("</vuxml>\n")
+
+
+####################################################################################################
+def _measure(function, setup=None, memory=True):
+    """ Return the duration of a function call, and the peak memory it allocated (if asked to,
+    during a second traced call), the result of setup() being given to the function """
+    argument = None
+    if setup is not None:
+        argument = setup()
+    start = time.perf_counter()
+    function(argument)
+    seconds = time.perf_counter() - start
+
+    peak_memory = None
+    if memory:
+        if setup is not None:
+            argument = setup()
+        tracemalloc.start()
+        try:
+            function(argument)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return seconds, peak_memory
+
+
+####################################################################################################
+def _get_queries(vuxml, generator):
+    """ Return a dictionary of lists of queries sampled from a VuXML data structure """
+    vids = list(vuxml)
+    sampled_vids = [generator.choice(vids) for _ in range(QUERIES_COUNT)]
+
+    packages = []
+    identifiers = []
+    dates = []
+    for vid in sampled_vids:
+        vuln_data = vuxml[vid]
+        package_name = generator.choice(list(vuln_data["affects"]))
+        packages.append((package_name, generator.choice(("", _get_version(generator)))))
+        if vuln_data["references"]:
+            identifiers += list(generator.choice(vuln_data["references"]).values())
+        dates.append(vuln_data["dates"]["discovery"][:generator.choice((4, 7, 10))])
+
+    return {
+        "vids": sampled_vids,
+        "packages": packages,
+        "identifiers": identifiers,
+        "dates": dates,
+        "words": [
+            " ".join(generator.sample(_WORDS, generator.randint(1, 3)))
+            for _ in range(QUERIES_COUNT)
+        ],
+    }
+
+
+####################################################################################################
+def _get_index_benchmarks(vuxml):
+    """ Return a list of (name, operations, function, setup) index building benchmarks """
+    def get_database():
+        return VuXMLDatabase(vuxml)
+
+    return [
+        (function.__name__, len(vuxml), function, get_database)
+        for function in (
+            get_vulns_by_topics,
+            get_vulns_by_packages,
+            get_vulns_by_references,
+            get_vulns_by_discovery_dates,
+            get_vulns_by_entry_dates,
+            get_vulns_by_modified_dates,
+        )
+    ] + [
+        ("build_indexes", len(vuxml), lambda database: database.build_indexes(), get_database),
+    ]
+
+
+####################################################################################################
+def _get_search_benchmarks(database, queries):
+    """ Return a list of (name, operations, function, setup) search benchmarks """
+    regexes = ["overflow", "^package1[0-9]* ", "(?i)denial of service", "code execution$"]
+    sources = sorted(set(_REFERENCE_SOURCES))
+    packages = queries["packages"]
+    identifiers = queries["identifiers"]
+    dates = queries["dates"]
+
+    benchmarks = [
+        (
+            "search_vulns_by_regex (topics)",
+            len(regexes),
+            lambda _: [search_vulns_by_regex(database, regex, True, False) for regex in regexes],
+        ),
+        (
+            "search_vulns_by_regex (descriptions)",
+            len(regexes),
+            lambda _: [search_vulns_by_regex(database, regex) for regex in regexes],
+        ),
+        (
+            "search_vulns_by_words",
+            len(queries["words"]),
+            lambda _: [search_vulns_by_words(database, words) for words in queries["words"]],
+        ),
+        (
+            "search_vulns_by_reference",
+            len(identifiers),
+            lambda _: [search_vulns_by_reference(database, "", ident) for ident in identifiers],
+        ),
+        (
+            "search_vulns_by_reference (sources)",
+            len(sources),
+            lambda _: [search_vulns_by_reference(database, source, "") for source in sources],
+        ),
+        (
+            "resolve_references",
+            len(identifiers),
+            lambda _: resolve_references(database, identifiers),
+        ),
+        (
+            "search_vulns_by_package",
+            len(packages),
+            lambda _: [search_vulns_by_package(database, name, ver) for name, ver in packages],
+        ),
+        (
+            "search_vulns_by_package (regex names)",
+            len(packages[:20]),
+            lambda _: [
+                search_vulns_by_package(database, f"^{name[:4]}", ver, regex_names=True)
+                for name, ver in packages[:20]
+            ],
+        ),
+        (
+            "audit_packages",
+            len(packages),
+            lambda _: audit_packages(database, packages),
+        ),
+    ]
+    for function in (
+        search_vulns_by_discovery_date,
+        search_vulns_by_entry_date,
+        search_vulns_by_modified_date,
+    ):
+        benchmarks.append((
+            function.__name__,
+            len(dates),
+            # The default argument binds the function of this iteration
+            lambda _, function=function: [function(database, date) for date in dates],
+        ))
+    benchmarks.append((
+        "search_vulns_by_date_range",
+        len(dates),
+        lambda _: [
+            search_vulns_by_date_range(database, "entry", date, date[:4] + "-12-31")
+            for date in dates
+        ],
+    ))
+
+    return [(name, operations, function, None) for name, operations, function in benchmarks]
+
+
+####################################################################################################
+def _print_vulns(database, vids, show_description):
+    """ Print vulnerabilities to a memory buffer """
+    with contextlib.redirect_stdout(io.StringIO()):
+        for vid in vids:
+            print_vuln(vid, database[vid], show_description=show_description)
+
+
+####################################################################################################
+def _run_processes(code):
+    """ Run Python code in STARTUP_COUNT new processes importing the library from this directory,
+    without ever downloading the database """
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+        + [path for path in environment.get("PYTHONPATH", "").split(os.pathsep) if path]
+    )
+    environment["VUXML_OFFLINE"] = "1"
+    for _ in range(STARTUP_COUNT):
+        subprocess.run(
+            [sys.executable, "-c", code],
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False
+        )
+
+
+####################################################################################################
+def _get_startup_benchmarks():
+    """ Return a list of (name, operations, function, setup) processes startup benchmarks """
+    return [
+        ("python (startup)", STARTUP_COUNT, lambda _: _run_processes("pass"), None),
+        ("import vuxml", STARTUP_COUNT, lambda _: _run_processes("import vuxml"), None),
+        (
+            "vuxml (no query)",
+            STARTUP_COUNT,
+            lambda _: _run_processes("import sys, vuxml; sys.argv = ['vuxml']; vuxml.main()"),
+            None
+        ),
+    ]
+
+
+####################################################################################################
+def _remove_caches(filename):
+    """ Remove the cache files of a VuXML file """
+    for extension in (
+        ".cache", ".descriptions", ".hashes", ".changes", ".identifiers.cache", ".words.cache",
+        ".sources.cache"
+    ):
+        if os.path.exists(filename + extension):
+            os.remove(filename + extension)
+
+
+####################################################################################################
+def run_benchmarks(filename, memory=True, seed=0):
+    """ Return a list of benchmarks results dictionaries, with their name, number of operations,
+    duration in seconds, throughput in operations per second and peak memory in bytes (or None),
+    for a VuXML file. Cache files are written, and removed, next to this file """
+    results = []
+
+    def add_result(name, operations, function, setup=None, traced=True):
+        seconds, peak_memory = _measure(function, setup, memory and traced)
+        results.append({
+            "name": name,
+            "operations": operations,
+            "seconds": seconds,
+            "throughput": operations / seconds if seconds else None,
+            "peak_memory": peak_memory,
+        })
+
+    _remove_caches(filename)
+    vuxml = load_vuxml(use_cache=False, filename=filename)
+    add_result(
+        "load_vuxml (no cache)",
+        len(vuxml),
+        lambda _: load_vuxml(use_cache=False, filename=filename)
+    )
+    add_result(
+        "load_vuxml (cache write)",
+        len(vuxml),
+        lambda _: load_vuxml(filename=filename),
+        lambda: _remove_caches(filename)
+    )
+    add_result("load_vuxml (cached)", len(vuxml), lambda _: load_vuxml(filename=filename))
+    add_result(
+        "load_vuxml (cached, lazy descriptions)",
+        len(vuxml),
+        lambda _: load_vuxml(filename=filename, lazy_descriptions=True)
+    )
+
+    for name, operations, function, setup in _get_index_benchmarks(vuxml):
+        add_result(name, operations, function, setup)
+
+    database = VuXMLDatabase(vuxml)
+    database.build_indexes()
+    queries = _get_queries(database, random.Random(seed))
+    for name, operations, function, setup in _get_search_benchmarks(database, queries):
+        add_result(name, operations, function, setup)
+
+    add_result(
+        "print_vuln",
+        len(queries["vids"]),
+        lambda _: _print_vulns(database, queries["vids"], False)
+    )
+    add_result(
+        "print_vuln (descriptions)",
+        len(queries["vids"][:100]),
+        lambda _: _print_vulns(database, queries["vids"][:100], True)
+    )
+    add_result(
+        "get_vuxml_sources (saved)",
+        1,
+        lambda _: get_vuxml_sources(filename=filename),
+        lambda: get_vuxml_sources(filename=filename)
+    )
+
+    # The memory allocated by other processes is not traced
+    for name, operations, function, setup in _get_startup_benchmarks():
+        add_result(name, operations, function, setup, traced=False)
+
+    return results
+
+
+####################################################################################################
+def _print_results(report):
+    """ Print benchmarks results as a text table """
+    print(
+        f"{report['vulns']} vulnerabilities, {report['file_size'] / 2 ** 20:.1f} MiB, "
+        f"Python {report['python']} on {report['platform']}"
+    )
+    print(f"{'Benchmark':<40} {'Operations':>10} {'Seconds':>10} {'Op/s':>12} {'Peak MiB':>9}")
+    for result in report["results"]:
+        throughput = "-"
+        if result["throughput"] is not None:
+            throughput = f"{result['throughput']:.1f}"
+        peak_memory = "-"
+        if result["peak_memory"] is not None:
+            peak_memory = f"{result['peak_memory'] / 2 ** 20:.1f}"
+        print(
+            f"{result['name']:<40} {result['operations']:>10} {result['seconds']:>10.4f} "
+            f"{throughput:>12} {peak_memory:>9}"
+        )
+    if report["max_rss"] is not None:
+        print(f"Process peak resident set size: {report['max_rss'] / 2 ** 20:.1f} MiB")
+
+
+####################################################################################################
+def main():
+    """ The benchmarks entry point """
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+    try:
+        options, _ = getopt.getopt(
+            sys.argv[1:],
+            "?",
+            ["count=", "file=", "generate=", "help", "json", "no-memory", "seed="]
+        )
+    except getopt.GetoptError as error:
+        logging.critical("Syntax error: %s", error)
+        sys.exit(1)
+
+    count = DEFAULT_COUNT
+    seed = 0
+    filename = ""
+    generate_filename = ""
+    json_output = False
+    memory = True
+    for option, argument in options:
+        if option in ("--count", "--seed"):
+            try:
+                value = int(argument)
+            except ValueError:
+                logging.critical("%s argument is not a valid number", option)
+                sys.exit(1)
+            if option == "--count":
+                count = value
+            else:
+                seed = value
+        elif option == "--file":
+            filename = argument
+        elif option == "--generate":
+            generate_filename = argument
+        elif option in ("--help", "-?"):
+            print(__doc__.split("\n\n", 1)[1], file=sys.stderr)
+            sys.exit(0)
+        elif option == "--json":
+            json_output = True
+        elif option == "--no-memory":
+            memory = False
+
+    if generate_filename:
+        generate_vuxml(generate_filename, count, seed)
+        sys.exit(0)
+
+    if filename and not os.path.isfile(filename):
+        logging.critical("--file argument is not an existing file")
+        sys.exit(1)
+
+    # The benchmarked file is in a temporary directory, so that existing caches are left untouched
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark_filename = os.path.join(directory, "vuln.xml")
+        if filename:
+            shutil.copyfile(filename, benchmark_filename)
+        else:
+            generate_vuxml(benchmark_filename, count, seed)
+
+        results = run_benchmarks(benchmark_filename, memory, seed)
+        report = {
+            "vulns": results[0]["operations"],
+            "file_size": os.path.getsize(benchmark_filename),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+            "max_rss": get_peak_memory(),
+        }
+
+    if json_output:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_results(report)
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
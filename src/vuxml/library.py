@@ -4,26 +4,226 @@ License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
 Author: Hubert Tournier
 """
 
+import bisect
+import codecs
+import collections.abc
 import datetime
+import itertools
+import json
 import logging
-import lzma
+import marshal
 import os
 import re
+import sys
+import threading
 import time
-import urllib.request
 
-import colorama
-import defusedxml.ElementTree
-import html2text
+try:
+    import fcntl
+except ImportError: # Not available under Windows
+    fcntl = None
+
+try:
+    import re._parser as sre_parse # Python >= 3.11
+except ImportError:
+    import sre_parse
+
 import libpnu
-import packaging.version
+
+from .pkgversion import get_version_key, get_cached_version_key
+from .renderer import VulnRenderer
+from .stats import _count, _phase # pylint: disable=W0212
 
 LATEST_VUXML = "https://www.vuxml.org/freebsd/vuln.xml.xz"
 
+# Time in seconds after which the downloaded database is checked for updates
+CACHE_MAX_AGE = 24 * 60 * 60
+
+# Size of the blocks read when downloading the database
+_CHUNK_SIZE = 64 * 1024
+
+# Number of seconds without an answer from the server after which a download is abandoned,
+# so that the processes waiting for the cache lock aren't blocked forever
+DOWNLOAD_TIMEOUT = 5 * 60
+
+# Pre-parsed data caches are only valid for the same format and Python version
+_CACHE_VERSION = (2, marshal.version, sys.version_info[0], sys.version_info[1])
+
+# XML namespaces prefixes of tags, and description text spacing
+_NAMESPACE_REGEX = re.compile(r"{[^}]*}")
+_NEWLINE_INDENT_REGEX = re.compile(r"\n[ \t]*")
+_TABS_REGEX = re.compile(r"\t+")
+
+# Words are indexed as Unicode word characters sequences, descriptions being stripped of their tags
+_WORD_REGEX = re.compile(r"\w+")
+_MARKUP_REGEX = re.compile(r"<[^>]*>")
+
+# Root and vuln elements of a VuXML file, located without parsing it
+_ROOT_START_REGEX = re.compile(rb"<([A-Za-z_][\w:.-]*)[^>]*>")
+_VULN_REGEX = re.compile(rb"""<vuln\s+vid=["']([^"']*)["'][^>]*>.*?</vuln>""", re.DOTALL)
+_VULN_START_REGEX = re.compile(rb"<vuln[\s>]")
+
+# Minimum number of vuln elements per process for a parallel parse to be worth it
+_PARALLEL_MIN_VULNS = 1000
+
+# Number of chunks parsed by each process of a parallel parse, for load balancing
+_CHUNKS_PER_JOB = 4
+
+# The modules used to download, hash and parse the database are only imported when needed,
+# so that short-lived programs reusing the cached data start faster
+
 
 ####################################################################################################
-def _download_vuxml():
-    """ Download and cache the latest FreeBSD VuXML version """
+def _uncompress_vuxml(source, destination):
+    """ Uncompress a xz VuXML stream into a text file, removing the DOCTYPE and ENTITY lines """
+    import lzma # pylint: disable=C0415
+
+    decompressor = lzma.LZMADecompressor()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    pending = ""
+    while True:
+        xz_data = source.read(_CHUNK_SIZE)
+        if not xz_data:
+            text = decoder.decode(b"", final=True)
+        else:
+            data = decompressor.decompress(xz_data)
+            # Handle concatenated xz streams like lzma.decompress() does
+            while decompressor.eof and decompressor.unused_data:
+                unused_data = decompressor.unused_data
+                decompressor = lzma.LZMADecompressor()
+                data += decompressor.decompress(unused_data)
+            text = decoder.decode(data)
+
+        # The last line can be incomplete until the end of data
+        lines = (pending + text).split('\n')
+        if xz_data:
+            pending = lines.pop()
+        for line in lines:
+            if not(line.startswith("<!DOCTYPE") \
+            or line.startswith("<!ENTITY") \
+            or line.startswith("]>")):
+                destination.write(line + '\n')
+
+        if not xz_data:
+            break
+
+
+####################################################################################################
+def _get_temporary_filename(filename):
+    """ Return the name of a file to be written, then renamed to filename,
+    which is unique to the calling process and thread """
+    return f"{filename}.{os.getpid()}.{threading.get_ident()}"
+
+
+####################################################################################################
+class _CacheLock:
+    """ An exclusive lock on a lock file, shared by the processes using the same cached file """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.release()
+
+    ################################################################################################
+    def acquire(self):
+        """ Wait for the lock. Proceed without it if the lock file can't be used """
+        try:
+            self._file = open(self.filename, "a+b") # pylint: disable=R1732
+        except OSError as error:
+            logging.debug("Unable to open lock file '%s': %s", self.filename, error)
+            return
+
+        try:
+            with _phase("download lock wait"):
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    import errno # pylint: disable=C0415
+                    import msvcrt # pylint: disable=C0415,E0401
+
+                    # LK_LOCK only retries for 10 seconds
+                    self._file.seek(0)
+                    while True:
+                        try:
+                            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError as error:
+                            if error.errno != errno.EDEADLOCK:
+                                raise
+        except OSError as error:
+            logging.debug("Unable to lock file '%s': %s", self.filename, error)
+            self._file.close()
+            self._file = None
+
+    ################################################################################################
+    def release(self):
+        """ Release the lock, if held """
+        if self._file is None:
+            return
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                import msvcrt # pylint: disable=C0415,E0401
+
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        except OSError as error:
+            logging.debug("Unable to unlock file '%s': %s", self.filename, error)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+####################################################################################################
+def _load_validators(filename):
+    """ Return the HTTP validators saved for a downloaded file """
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            validators = json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(validators, dict):
+        return {}
+    return validators
+
+
+####################################################################################################
+def _save_validators(filename, headers, validators=None):
+    """ Save the HTTP validators of a downloaded file, marking it as checked now,
+    updating the previous validators, if given, with the ones in headers """
+    validators = dict(validators) if validators is not None else {}
+    if headers is not None:
+        if headers.get("ETag"):
+            validators["ETag"] = headers.get("ETag")
+        if headers.get("Last-Modified"):
+            validators["Last-Modified"] = headers.get("Last-Modified")
+
+    temporary_filename = _get_temporary_filename(filename)
+    try:
+        with open(temporary_filename, "w", encoding="utf-8") as file:
+            json.dump(validators, file)
+        os.replace(temporary_filename, filename)
+    except OSError as error:
+        logging.debug("Unable to write validators file '%s': %s", filename, error)
+        try:
+            os.remove(temporary_filename)
+        except OSError:
+            pass
+
+
+####################################################################################################
+def _check_cached_vuxml(max_age=CACHE_MAX_AGE, offline=False):
+    """ Return the name of the cached FreeBSD VuXML file (or "" if it's not available in offline
+    mode), and the HTTP validators to check for its update with, or None if it's recent enough """
     # Where do we want to cache the file
     filename = ""
     directory = libpnu.get_caching_directory("vuxml")
@@ -31,136 +231,1694 @@ def _download_vuxml():
         filename = directory + os.sep + "vuln.xml"
     else:
         filename = "vuln.xml"
+    validators_filename = filename + ".validators"
+
+    # If there's a caching file checked less than max_age seconds ago, use it
+    if os.path.isfile(filename):
+        if offline:
+            return filename, None
+
+        if os.path.isfile(validators_filename):
+            last_check = os.path.getmtime(validators_filename)
+        else:
+            last_check = os.path.getmtime(filename)
+        if (time.time() - last_check) < max_age:
+            _count("download checks skipped")
+            return filename, None
+
+        # Otherwise ask the server if it has been updated
+        return filename, _load_validators(validators_filename)
+
+    if offline:
+        logging.error("No cached VuXML database available in offline mode")
+        return "", None
+
+    return filename, {}
+
 
-    # If there's a caching file of less than 1 day, use it
-    if filename \
-    and os.path.isfile(filename) \
-    and (time.time() - os.path.getmtime(filename)) < 24 * 60 * 60:
+####################################################################################################
+def _get_outdated_vuxml(filename):
+    """ Return the name of the cached FreeBSD VuXML file after a failed update, or "" """
+    if os.path.isfile(filename):
+        logging.warning("Using the outdated cached VuXML database")
         return filename
+    return ""
 
-    # Download the latest version
-    try:
-        with urllib.request.urlopen(LATEST_VUXML) as http:
-            xz_data = http.read()
-    except urllib.error.HTTPError as error:
-        logging.error("Error while fetching '%s': %s", LATEST_VUXML, error)
-        return ""
 
-    # Uncompress the data
-    data = lzma.decompress(xz_data)
-    with open(filename, "w", encoding="utf-8") as file:
-        for line in data.decode("utf-8", errors="ignore").split('\n'):
-            if not(line.startswith("<!DOCTYPE") \
-            or line.startswith("<!ENTITY") \
-            or line.startswith("]>")):
-                file.write(line + '\n')
+####################################################################################################
+def _download_vuxml(url=LATEST_VUXML, max_age=CACHE_MAX_AGE, offline=False):
+    """ Download and cache the latest FreeBSD VuXML version """
+    filename, validators = _check_cached_vuxml(max_age, offline)
+    if validators is None:
+        return filename
 
-    return filename
+    # Only one process updates the cached file, the other ones reusing its result
+    with _CacheLock(filename + ".lock"):
+        filename, validators = _check_cached_vuxml(max_age, offline)
+        if validators is None:
+            return filename
+        return _fetch_vuxml(url, filename, validators)
 
 
 ####################################################################################################
-def _get_sub_description(node):
-    """ Concatenate the current and sub levels description tags in a single string """
-    description = ""
+def _fetch_vuxml(url, filename, validators):
+    """ Download the latest FreeBSD VuXML version if it changed since the cached one """
+    import urllib.request # pylint: disable=C0415
+
+    validators_filename = filename + ".validators"
+    temporary_filename = _get_temporary_filename(filename)
 
+    request = urllib.request.Request(url)
+    if "ETag" in validators:
+        request.add_header("If-None-Match", validators["ETag"])
+    if "Last-Modified" in validators:
+        request.add_header("If-Modified-Since", validators["Last-Modified"])
+
+    # Download and uncompress the latest version, one block at a time
+    _count("download checks")
+    try:
+        with _phase("download check"), \
+        urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as http:
+            # Readers of the cached file never see a partly written one
+            with open(temporary_filename, "w", encoding="utf-8") as file:
+                _uncompress_vuxml(http, file)
+            os.replace(temporary_filename, filename)
+            _save_validators(validators_filename, http.headers)
+            _count("downloads")
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            # Not modified: keep the cached file as is, and its validators, which a 304 answer
+            # doesn't have to repeat
+            _save_validators(validators_filename, error.headers, validators)
+            return filename
+
+        logging.error("Error while fetching '%s': %s", url, error)
+    except urllib.error.URLError as error:
+        logging.error("Error while fetching '%s': %s", url, error.reason)
+    except OSError as error:
+        # Including timeouts while reading the answer
+        logging.error("Error while fetching '%s': %s", url, error)
+    else:
+        return filename
+    finally:
+        try:
+            os.remove(temporary_filename)
+        except OSError:
+            pass
+
+    # Fall back to the cached file, if any
+    return _get_outdated_vuxml(filename)
+
+
+####################################################################################################
+def _add_sub_description(node, parts):
+    """ Add the current and sub levels description tags to a list of strings """
     for element in node:
-        tag = re.sub(r"{[^}]*}", "", element.tag)
+        tag = _NAMESPACE_REGEX.sub("", element.tag)
         if element.attrib:
-            description += f"<{tag}"
+            parts.append(f"<{tag}")
             for key, value in element.attrib.items():
-                description += f' {key}="{value}"'
-            description += '>'
+                parts.append(f' {key}="{value}"')
+            parts.append('>')
         else:
-            description += f"<{tag}>"
+            parts.append(f"<{tag}>")
 
         if element.text is not None:
-            text = re.sub(r"\n[ \t]*", " ", element.text)
-            text = re.sub(r"\t+", " ", text)
-            description += text
+            text = _NEWLINE_INDENT_REGEX.sub(" ", element.text)
+            text = _TABS_REGEX.sub(" ", text)
+            parts.append(text)
+
+        _add_sub_description(element, parts)
+        parts.append(f"</{tag}>")
+
 
-        description += _get_sub_description(element) + f"</{tag}>"
+####################################################################################################
+def _get_sub_description(node):
+    """ Concatenate the current and sub levels description tags in a single string """
+    parts = []
+    _add_sub_description(node, parts)
 
-    return description
+    return "".join(parts)
 
 
 ####################################################################################################
-def load_vuxml():
-    """ Return a Python data structure from a FreeBSD VuXML file """
-    filename = _download_vuxml()
+def _hash_file(filename):
+    """ Return the SHA-256 hex digest of a file """
+    import hashlib # pylint: disable=C0415
 
-    tree = defusedxml.ElementTree.parse(filename)
-    root = tree.getroot()
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+####################################################################################################
+def _get_file_key(filename):
+    """ Return a (size, mtime, hash) tuple identifying a file contents """
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime_ns, _hash_file(filename))
+
+
+####################################################################################################
+def _write_cache(cache_filename, key, data):
+    """ Save data pre-parsed from a source file identified by key """
+    temporary_filename = _get_temporary_filename(cache_filename)
+    try:
+        with open(temporary_filename, "wb") as file:
+            marshal.dump((_CACHE_VERSION,) + key, file)
+            marshal.dump(data, file)
+        os.replace(temporary_filename, cache_filename)
+    except (OSError, ValueError) as error:
+        logging.debug("Unable to write cache file '%s': %s", cache_filename, error)
+        try:
+            os.remove(temporary_filename)
+        except OSError:
+            pass
+
+
+####################################################################################################
+def _read_cache(cache_filename, source_filename):
+    """ Return the key of a source file and the data pre-parsed from it,
+    or (None, None) if it's missing or outdated """
+    try:
+        with open(cache_filename, "rb") as file:
+            header = marshal.load(file)
+            if header[0] != _CACHE_VERSION:
+                return None, None
+
+            stat = os.stat(source_filename)
+            if header[1] != stat.st_size:
+                return None, None
+
+            if header[2] == stat.st_mtime_ns:
+                return tuple(header[1:4]), marshal.loads(file.read())
+
+            # The source file was rewritten. Check if its contents really changed
+            key = _get_file_key(source_filename)
+            if header[3] != key[2]:
+                return None, None
+            data = marshal.loads(file.read())
+    except (OSError, EOFError, ValueError, TypeError, IndexError):
+        return None, None
+
+    _write_cache(cache_filename, key, data)
+    return key, data
+
+
+####################################################################################################
+def _read_previous_cache(cache_filename):
+    """ Return the key of the source file a cache was built from and the data pre-parsed from it,
+    whatever the current version of this file, or (None, None) if it's missing """
+    try:
+        with open(cache_filename, "rb") as file:
+            header = marshal.load(file)
+            if header[0] != _CACHE_VERSION:
+                return None, None
+
+            return tuple(header[1:4]), marshal.loads(file.read())
+    except (OSError, EOFError, ValueError, TypeError, IndexError):
+        return None, None
+
+
+####################################################################################################
+def _read_index_cache(cache_filename, key):
+    """ Return the data pre-parsed from a source file identified by key, or None if it's missing
+    or was built from another version of this file """
+    try:
+        with open(cache_filename, "rb") as file:
+            header = marshal.load(file)
+            if header[0] != _CACHE_VERSION or header[3] != key[2]:
+                return None
+
+            return marshal.loads(file.read())
+    except (OSError, EOFError, ValueError, TypeError, IndexError):
+        return None
+
+
+####################################################################################################
+def _write_descriptions(descriptions_filename, key, vuxml):
+    """ Save the descriptions of a VuXML data structure from a source file identified by key,
+    and return their (offset, length) positions by VID, or None if they couldn't be saved """
+    positions = {}
+    temporary_filename = _get_temporary_filename(descriptions_filename)
+    try:
+        with open(temporary_filename, "wb") as file:
+            marshal.dump((_CACHE_VERSION,) + key, file)
+            for vuln_vid, vuln_data in vuxml.items():
+                if "description" in vuln_data:
+                    description = vuln_data["description"].encode("utf-8")
+                    positions[vuln_vid] = (file.tell(), len(description))
+                    file.write(description)
+        os.replace(temporary_filename, descriptions_filename)
+    except (OSError, ValueError) as error:
+        logging.debug("Unable to write descriptions file '%s': %s", descriptions_filename, error)
+        try:
+            os.remove(temporary_filename)
+        except OSError:
+            pass
+        return None
+
+    return positions
+
+
+####################################################################################################
+class _DescriptionsFile:
+    """ A descriptions file, kept open to read descriptions on demand """
+
+    def __init__(self, file):
+        self._file = file
+        # Also held by the records reading their description, so that threads read it once
+        self.lock = threading.RLock()
+
+    def read(self, position):
+        """ Return the description at an (offset, length) position """
+        offset, length = position
+        with self.lock:
+            self._file.seek(offset)
+            return self._file.read(length).decode("utf-8")
+
+    def read_all(self):
+        """ Return the whole file contents """
+        with self.lock:
+            self._file.seek(0)
+            return self._file.read()
+
+    def close(self):
+        """ Close the file """
+        self._file.close()
+
+
+####################################################################################################
+def _open_descriptions(descriptions_filename, key):
+    """ Return a _DescriptionsFile from a source file identified by key,
+    or None if it's missing or was built from another version of this file """
+    try:
+        file = open(descriptions_filename, "rb") # pylint: disable=R1732
+    except OSError:
+        return None
+
+    try:
+        header = marshal.load(file)
+        if header[0] == _CACHE_VERSION and header[3] == key[2]:
+            return _DescriptionsFile(file)
+    except (EOFError, ValueError, TypeError, IndexError):
+        pass
+    file.close()
+
+    return None
+
+
+####################################################################################################
+class _LazyVuln(dict):
+    """ A vulnerability data dictionary whose description is only read when it's needed """
+    __slots__ = ("_descriptions", "_position")
+
+    def __init__(self, vuln_data, descriptions):
+        super().__init__(vuln_data)
+        self._descriptions = descriptions
+        self._position = super().pop("description", None)
+
+    def _load(self):
+        """ Read the description if it's not already done """
+        if self._position is not None:
+            with self._descriptions.lock:
+                # Another thread may have read it meanwhile
+                if self._position is not None:
+                    super().__setitem__("description", self._descriptions.read(self._position))
+                    self._position = None
+
+    def __missing__(self, key):
+        if key == "description" and self._position is not None:
+            self._load()
+            return super().__getitem__(key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key == "description" and self._position is not None:
+            return True
+        return super().__contains__(key)
+
+    def __reduce__(self):
+        self._load()
+        return (dict, (dict(self),))
+
+    def __repr__(self):
+        self._load()
+        return super().__repr__()
+
+    def __eq__(self, other):
+        self._load()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        self._load()
+        return super().__ne__(other)
+
+    def __iter__(self):
+        self._load()
+        return super().__iter__()
+
+    def __len__(self):
+        self._load()
+        return super().__len__()
+
+    def __setitem__(self, key, value):
+        if key == "description":
+            self._position = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._load()
+        super().__delitem__(key)
+
+    def get(self, key, default=None):
+        if key == "description":
+            self._load()
+        return super().get(key, default)
+
+    def keys(self):
+        self._load()
+        return super().keys()
+
+    def items(self):
+        self._load()
+        return super().items()
+
+    def values(self):
+        self._load()
+        return super().values()
+
+    def copy(self):
+        self._load()
+        return dict(self)
+
+    def pop(self, *args):
+        self._load()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._load()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self._load()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._load()
+        super().update(*args, **kwargs)
+
+    __hash__ = None
+
+
+####################################################################################################
+class _CompactVuln(collections.abc.Mapping):
+    """ A compact read-only vulnerability data record, with the interface of a dictionary """
+    __slots__ = ("topic", "affects", "references", "dates", "_description", "_descriptions")
+    _KEYS = ("topic", "affects", "description", "references", "dates")
+
+    def __init__(self, vuln_data, description=None, descriptions=None):
+        # Ranges are tuples of (operator, version) tuples, references (source, identifier) tuples,
+        # and operators, packages names, references sources and dates kinds are interned
+        self.topic = vuln_data.get("topic")
+        self.affects = None
+        if "affects" in vuln_data:
+            self.affects = {
+                sys.intern(name): tuple(
+                    tuple((sys.intern(operator), version) for operator, version in version_range)
+                    for version_range in version_ranges
+                )
+                for name, version_ranges in vuln_data["affects"].items()
+            }
+        self.references = None
+        if "references" in vuln_data:
+            self.references = tuple(
+                (sys.intern(source), identifier)
+                for reference in vuln_data["references"]
+                for source, identifier in reference.items()
+            )
+        self.dates = None
+        if "dates" in vuln_data:
+            self.dates = {sys.intern(kind): date for kind, date in vuln_data["dates"].items()}
+
+        # The description is a string, or its position in a descriptions file to be read on demand
+        self._description = description
+        self._descriptions = descriptions if description is not None else None
+
+    def __getitem__(self, key):
+        if key == "description":
+            descriptions = self._descriptions
+            if descriptions is not None:
+                with descriptions.lock:
+                    # Another thread may have read it meanwhile
+                    if self._descriptions is not None:
+                        self._description = descriptions.read(self._description)
+                        self._descriptions = None
+            value = self._description
+        elif key == "references":
+            value = self.references
+            if value is not None:
+                value = [{source: identifier} for source, identifier in value]
+        elif key in self._KEYS:
+            value = getattr(self, key)
+        else:
+            value = None
+        if value is None:
+            raise KeyError(key)
+
+        return value
+
+    def __contains__(self, key):
+        if key == "description":
+            return self._description is not None
+        if key in self._KEYS:
+            return getattr(self, key) is not None
+        return False
+
+    def __iter__(self):
+        for key in self._KEYS:
+            if key in self:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+####################################################################################################
+def _get_compact_vulns(vuxml, descriptions=None, lazy_descriptions=False):
+    """ Return a VuXML data structure made of _CompactVuln records, from one with descriptions,
+    or with descriptions positions and its descriptions file """
+    contents = None
+    if descriptions is not None and not lazy_descriptions:
+        contents = descriptions.read_all()
+        descriptions.close()
+        descriptions = None
+
+    compact_vulns = {}
+    for vuln_vid, vuln_data in vuxml.items():
+        description = vuln_data.get("description")
+        if contents is not None and description is not None:
+            offset, length = description
+            description = contents[offset:offset + length].decode("utf-8")
+        compact_vulns[vuln_vid] = _CompactVuln(vuln_data, description, descriptions)
+
+    return compact_vulns
+
+
+####################################################################################################
+def _get_positioned_descriptions(vuxml, positions):
+    """ Return a copy of a VuXML data structure with descriptions replaced by their positions """
+    return {
+        vuln_vid: dict(vuln_data, description=positions[vuln_vid])
+        if vuln_vid in positions else vuln_data
+        for vuln_vid, vuln_data in vuxml.items()
+    }
+
+
+####################################################################################################
+def _get_described_vulns(vuxml, descriptions, lazy_descriptions=False):
+    """ Return a VuXML data structure from one with descriptions positions and its descriptions file """
+    if lazy_descriptions:
+        return {
+            vuln_vid: _LazyVuln(vuln_data, descriptions) for vuln_vid, vuln_data in vuxml.items()
+        }
+
+    contents = descriptions.read_all()
+    descriptions.close()
+    for vuln_data in vuxml.values():
+        if "description" in vuln_data:
+            offset, length = vuln_data["description"]
+            vuln_data["description"] = contents[offset:offset + length].decode("utf-8")
+
+    return vuxml
+
+
+####################################################################################################
+def _parse_vuln(vuln):
+    """ Return a Python data structure from a VuXML vuln element, or None if it was cancelled """
+    vuln_data = {}
+
+    for element1 in vuln:
+        tag1 = _NAMESPACE_REGEX.sub("", element1.tag)
+        if tag1 == "topic":
+            vuln_data["topic"] = element1.text.strip()
+            continue
+        if tag1 == "affects":
+            vuln_data["affects"] = {}
+        elif tag1 == "description":
+            vuln_data["description"] = ""
+        elif tag1 == "references":
+            vuln_data["references"] = []
+        elif tag1 == "dates":
+            vuln_data["dates"] = {}
+        elif tag1 == "cancelled":
+            return None
+        else:
+            logging.warning("Unknown tag: %s", tag1)
+
+        description = ""
+        for element2 in element1:
+            tag2 = _NAMESPACE_REGEX.sub("", element2.tag)
+            if element2.text is not None:
+                text = element2.text.strip()
+            else:
+                text = ""
 
-    vuxml = {}
-    for vuln in root:
-        vuln_vid = vuln.attrib["vid"]
-        vuxml[vuln_vid] = {}
-
-        for element1 in vuln:
-            tag1 = re.sub(r"{[^}]*}", "", element1.tag)
-            if tag1 == "topic":
-                vuxml[vuln_vid]["topic"] = element1.text.strip()
-                continue
             if tag1 == "affects":
-                vuxml[vuln_vid]["affects"] = {}
+                names = []
+                ranges = []
+                for element3 in element2:
+                    tag3 = _NAMESPACE_REGEX.sub("", element3.tag)
+                    if tag3 == "name":
+                        names.append(element3.text)
+                    elif tag3 == "range":
+                        version = []
+                        for element4 in element3:
+                            tag4 = _NAMESPACE_REGEX.sub("", element4.tag)
+                            if tag4 == 'lt':
+                                version.append(["<", f"{element4.text}"])
+                            elif tag4 == "le":
+                                version.append(['<=', f"{element4.text}"])
+                            elif tag4 == "eq":
+                                version.append(['==', f"{element4.text}"])
+                            elif tag4 == "ge":
+                                version.append(['>=', f"{element4.text}"])
+                            elif tag4 == "gt":
+                                version.append(['>', f"{element4.text}"])
+                        ranges.append(version)
+                for name in names:
+                    vuln_data["affects"][name] = ranges
+
             elif tag1 == "description":
-                vuxml[vuln_vid]["description"] = ""
+                description += _get_sub_description(element2)
+
             elif tag1 == "references":
-                vuxml[vuln_vid]["references"] = []
+                vuln_data["references"].append({tag2: text})
+
             elif tag1 == "dates":
-                vuxml[vuln_vid]["dates"] = {}
-            elif tag1 == "cancelled":
-                del vuxml[vuln_vid]
+                vuln_data["dates"][tag2] = text
+
+        if description:
+            vuln_data["description"] = description
+
+    return vuln_data
+
+
+####################################################################################################
+def _iter_vulns(filename):
+    """ Yield (VID, data) pairs from a FreeBSD VuXML file, parsing one vuln element at a time """
+    import defusedxml.ElementTree # pylint: disable=C0415
+
+    context = defusedxml.ElementTree.iterparse(filename, events=("start", "end"))
+    root = None
+    depth = 0
+    for event, element in context:
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            vuln_vid = element.attrib["vid"]
+            vuln_data = _parse_vuln(element)
+
+            # Free the already processed elements
+            root.clear()
+
+            yield vuln_vid, vuln_data
+
+
+####################################################################################################
+def iter_vuxml(filename=""):
+    """ Yield (VID, data) pairs from a FreeBSD VuXML file, skipping cancelled vulnerabilities """
+    if not filename:
+        filename = _download_vuxml()
+        if not filename:
+            return
+
+    for vuln_vid, vuln_data in _iter_vulns(filename):
+        if vuln_data is not None:
+            yield vuln_vid, vuln_data
+
+
+####################################################################################################
+def _get_jobs(jobs):
+    """ Return a number of processes to use, 0 or None meaning the number of CPU """
+    if not jobs:
+        return os.cpu_count() or 1
+
+    return max(jobs, 1)
+
+
+####################################################################################################
+def _parse_vulns_chunk(root_start_tag, root_end_tag, chunk):
+    """ Return a marshalled list of (VID, data) pairs from the text of consecutive VuXML vuln
+    elements, with None data for cancelled vulnerabilities """
+    import defusedxml.ElementTree # pylint: disable=C0415
+
+    root = defusedxml.ElementTree.fromstring(root_start_tag + chunk + root_end_tag)
+
+    # marshal is faster than the pickle used to return results from the processes
+    return marshal.dumps([(vuln.attrib["vid"], _parse_vuln(vuln)) for vuln in root])
+
+
+####################################################################################################
+def _get_chunks(contents, elements, chunks_count):
+    """ Return a list of texts of consecutive vuln elements of similar sizes """
+    chunk_size = (elements[-1][2] - elements[0][1]) // chunks_count + 1
+    chunks = []
+    chunk_start = None
+    for _, start, end in elements:
+        if chunk_start is None:
+            chunk_start = start
+        if end - chunk_start >= chunk_size:
+            chunks.append(contents[chunk_start:end])
+            chunk_start = None
+    if chunk_start is not None:
+        chunks.append(contents[chunk_start:elements[-1][2]])
+
+    return chunks
+
+
+####################################################################################################
+def _parse_vuxml_parallel(filename, jobs):
+    """ Return a Python data structure from a FreeBSD VuXML file, parsing chunks of its vuln
+    elements in a pool of processes, or None if the file is too small or can't be split """
+    import concurrent.futures # pylint: disable=C0415
+    import defusedxml.ElementTree # pylint: disable=C0415
+
+    try:
+        with open(filename, "rb") as file:
+            contents = file.read()
+    except OSError:
+        return None
+
+    root_start_tag, root_end_tag, elements = _get_vuln_elements(contents)
+    if elements is None:
+        return None
+    jobs = min(jobs, len(elements) // _PARALLEL_MIN_VULNS)
+    if jobs < 2:
+        return None
+
+    chunks = _get_chunks(contents, elements, jobs * _CHUNKS_PER_JOB)
+    vuxml = {}
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(
+                _parse_vulns_chunk,
+                itertools.repeat(root_start_tag),
+                itertools.repeat(root_end_tag),
+                chunks
+            )
+            # Chunks results are merged in the file order, like a serial parse
+            for vulns in results:
+                for vuln_vid, vuln_data in marshal.loads(vulns):
+                    if vuln_data is None:
+                        vuxml.pop(vuln_vid, None)
+                    else:
+                        vuxml[vuln_vid] = vuln_data
+    except (
+        OSError,
+        ImportError,
+        NotImplementedError,
+        KeyError,
+        defusedxml.ElementTree.ParseError,
+        concurrent.futures.process.BrokenProcessPool
+    ) as error:
+        logging.debug("Parallel parsing failed, parsing serially: %s", error)
+        return None
+    _count("vulns parsed", len(elements))
+
+    return vuxml
+
+
+####################################################################################################
+def _parse_vuxml(filename, jobs=1):
+    """ Return a Python data structure from a FreeBSD VuXML file,
+    using up to jobs processes (0 or None for the number of CPU) """
+    with _phase("parse"):
+        jobs = _get_jobs(jobs)
+        if jobs > 1:
+            vuxml = _parse_vuxml_parallel(filename, jobs)
+            if vuxml is not None:
+                return vuxml
+
+        vuxml = {}
+        parsed_count = 0
+        for vuln_vid, vuln_data in _iter_vulns(filename):
+            if vuln_data is None:
+                vuxml.pop(vuln_vid, None)
+            else:
+                vuxml[vuln_vid] = vuln_data
+            parsed_count += 1
+        _count("vulns parsed", parsed_count)
+
+    return vuxml
+
+
+####################################################################################################
+def _get_vuln_elements(contents):
+    """ Return the root element start and end tags, and a list of (VID, start, end) positions
+    of the vuln elements of a VuXML file contents, or (None, None, None) if they can't be
+    reliably located without parsing the file """
+    root_start = _ROOT_START_REGEX.search(contents, contents.find(b"<vuxml"))
+    if root_start is None or b"<![CDATA[" in contents:
+        return None, None, None
+
+    elements = [
+        (match.group(1).decode("utf-8"), match.start(), match.end())
+        for match in _VULN_REGEX.finditer(contents, root_start.end())
+    ]
+    if len(elements) != contents.count(b"</vuln>") \
+    or len(elements) != len(_VULN_START_REGEX.findall(contents)):
+        return None, None, None
+
+    return root_start.group(0), b"</" + root_start.group(1) + b">", elements
+
+
+####################################################################################################
+def _parse_vuln_element(root_start_tag, root_end_tag, element):
+    """ Return a Python data structure from the text of a VuXML vuln element,
+    or None if it was cancelled """
+    import defusedxml.ElementTree # pylint: disable=C0415
+
+    root = defusedxml.ElementTree.fromstring(root_start_tag + element + root_end_tag)
+    return _parse_vuln(root[0])
+
+
+####################################################################################################
+def _read_snapshot(filename):
+    """ Return the key, VuXML data structure, vuln elements hashes and descriptions file
+    of the previous version of a cached VuXML file, or (None, None, None, None) if it's not
+    available. Descriptions are only read when they're needed, and the descriptions file
+    is to be closed by the caller """
+    previous_key, vuxml = _read_previous_cache(filename + ".cache")
+    if vuxml is None:
+        return None, None, None, None
+
+    hashes = _read_index_cache(filename + ".hashes", previous_key)
+    if hashes is None:
+        return None, None, None, None
+
+    descriptions = _open_descriptions(filename + ".descriptions", previous_key)
+    if descriptions is None:
+        return None, None, None, None
+
+    return previous_key, _get_described_vulns(vuxml, descriptions, True), hashes, descriptions
+
+
+####################################################################################################
+def _update_vuxml(filename, key, jobs=1):
+    """ Return a Python data structure from a cached FreeBSD VuXML file, only parsing the vuln
+    elements which changed since the previous version. Save the changes and the vuln elements
+    hashes, and update the saved indexes of the previous version """
+    import defusedxml.ElementTree # pylint: disable=C0415
+    import hashlib # pylint: disable=C0415
+
+    try:
+        with open(filename, "rb") as file:
+            contents = file.read()
+    except OSError:
+        return _parse_vuxml(filename, jobs)
+
+    root_start_tag, root_end_tag, elements = _get_vuln_elements(contents)
+    if elements is None:
+        return _parse_vuxml(filename, jobs)
+
+    digests = [
+        hashlib.blake2b(contents[start:end], digest_size=16).digest()
+        for _, start, end in elements
+    ]
+    hashes = {vuln_vid: digest for (vuln_vid, _, _), digest in zip(elements, digests)}
+
+    # Without a previous version, or with the same one, the file is parsed as a whole
+    previous_key, previous_vuxml, previous_hashes, descriptions = _read_snapshot(filename)
+    if previous_vuxml is None or previous_key[2] == key[2]:
+        if descriptions is not None:
+            descriptions.close()
+        _write_cache(filename + ".hashes", key, hashes)
+        return _parse_vuxml(filename, jobs)
+
+    try:
+        vuxml = {}
+        parsed_vids = set()
+        for (vuln_vid, start, end), digest in zip(elements, digests):
+            # An unchanged vuln element gives the same data (None if it was cancelled),
+            # whose description is only read now. For a VID appearing several times,
+            # the hash and data are the ones of its last element
+            if previous_hashes.get(vuln_vid) == digest:
+                vuln_data = previous_vuxml.get(vuln_vid)
+                if vuln_data is not None:
+                    vuln_data = dict(vuln_data)
+            else:
+                try:
+                    vuln_data = _parse_vuln_element(
+                        root_start_tag, root_end_tag, contents[start:end]
+                    )
+                except defusedxml.ElementTree.ParseError:
+                    return _parse_vuxml(filename, jobs)
+                parsed_vids.add(vuln_vid)
+
+            if vuln_data is None:
+                vuxml.pop(vuln_vid, None)
+            else:
+                vuxml[vuln_vid] = vuln_data
+        del contents
+        _write_cache(filename + ".hashes", key, hashes)
+        _count("vulns parsed", len(parsed_vids))
+        _count("vulns reused", len(elements) - len(parsed_vids))
+
+        # Vulnerabilities which were parsed again may not have changed.
+        # Only their previous descriptions are read to compare them
+        changes = {
+            "added": [vuln_vid for vuln_vid in vuxml if vuln_vid not in previous_vuxml],
+            "modified": [
+                vuln_vid
+                for vuln_vid in vuxml
+                if vuln_vid in parsed_vids
+                and vuln_vid in previous_vuxml
+                and previous_vuxml[vuln_vid] != vuxml[vuln_vid]
+            ],
+            "removed": [vuln_vid for vuln_vid in previous_vuxml if vuln_vid not in vuxml],
+        }
+    finally:
+        # The descriptions file is replaced afterwards, which may fail while it's open
+        descriptions.close()
+    _write_cache(filename + ".changes", key, changes)
+
+    changed_vids = set(changes["added"]) | set(changes["modified"]) | set(changes["removed"])
+    for name, update_function in (
+        ("words", _update_words_index),
+        ("identifiers", _update_identifiers_index),
+    ):
+        cache_filename = f"{filename}.{name}.cache"
+        index = _read_index_cache(cache_filename, previous_key)
+        if index is not None:
+            _write_cache(cache_filename, key, update_function(index, vuxml, changed_vids))
+
+    return vuxml
+
+
+####################################################################################################
+def load_vuxml(
+    use_cache=True,
+    filename="",
+    max_age=CACHE_MAX_AGE,
+    offline=False,
+    lazy_descriptions=False,
+    compact=False,
+    jobs=1
+):
+    """ Return a VuXMLDatabase from a FreeBSD VuXML file """
+    if not filename:
+        filename = _download_vuxml(max_age=max_age, offline=offline)
+        if not filename:
+            return {}
+
+    # Reuse the already parsed data if the VuXML file didn't change.
+    # Descriptions are kept apart, to be read only when needed if lazy_descriptions is True
+    cache_filename = filename + ".cache"
+    descriptions_filename = filename + ".descriptions"
+    if use_cache:
+        with _phase("cache read"):
+            key, vuxml = _read_cache(cache_filename, filename)
+            descriptions = None
+            if vuxml is not None:
+                descriptions = _open_descriptions(descriptions_filename, key)
+        if descriptions is not None:
+            _count("cache hits")
+            if compact:
+                vuxml = _get_compact_vulns(vuxml, descriptions, lazy_descriptions)
+            else:
+                vuxml = _get_described_vulns(vuxml, descriptions, lazy_descriptions)
+            database = VuXMLDatabase(vuxml)
+            database._set_source(filename, key) # pylint: disable=W0212
+            return database
+        _count("cache misses")
+
+    key = _get_file_key(filename)
+    if use_cache:
+        with _phase("update"):
+            vuxml = _update_vuxml(filename, key, jobs)
+        with _phase("cache write"):
+            positions = _write_descriptions(descriptions_filename, key, vuxml)
+            if positions is not None:
+                _write_cache(cache_filename, key, _get_positioned_descriptions(vuxml, positions))
+    else:
+        vuxml = _parse_vuxml(filename, jobs)
+    if compact:
+        vuxml = _get_compact_vulns(vuxml)
+    database = VuXMLDatabase(vuxml)
+    if use_cache:
+        database._set_source(filename, key) # pylint: disable=W0212
+
+    return database
+
+
+####################################################################################################
+class VuXMLDatabase(dict):
+    """ A VuXML data structure whose indexes are built on first use and reused afterwards """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._indexes = {}
+        self._source_filename = ""
+        self._source_key = None
+
+    ################################################################################################
+    def clear_indexes(self):
+        """ Forget the indexes built so far (to be called after modifying vulnerabilities data) """
+        self._indexes = {}
+        self._source_filename = ""
+        self._source_key = None
+
+    ################################################################################################
+    def _set_source(self, filename, key):
+        """ Remember the VuXML file the data was loaded from, to save the costliest indexes with it """
+        self._source_filename = filename
+        self._source_key = key
+
+    def __setitem__(self, key, value):
+        self.clear_indexes()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.clear_indexes()
+        super().__delitem__(key)
+
+    def clear(self):
+        self.clear_indexes()
+        super().clear()
+
+    def pop(self, *args):
+        self.clear_indexes()
+        return super().pop(*args)
+
+    def popitem(self):
+        self.clear_indexes()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.clear_indexes()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self.clear_indexes()
+        super().update(*args, **kwargs)
+
+    ################################################################################################
+    def get_vulns_by_topics(self):
+        """ Return a dictionary of VID by topics """
+        if "topics" not in self._indexes:
+            with _phase("index building"):
+                topics = {}
+                for vuln_vid, vuln_data in self.items():
+                    if vuln_data["topic"] in topics:
+                        topics[vuln_data["topic"]].append(vuln_vid)
+                    else:
+                        topics[vuln_data["topic"]] = [vuln_vid]
+                self._indexes["topics"] = topics
+
+        return self._indexes["topics"]
+
+    ################################################################################################
+    def get_vulns_by_packages(self):
+        """ Return a dictionary of VID by packages/versions """
+        if "packages" not in self._indexes:
+            with _phase("index building"):
+                packages = {}
+                for vuln_vid, vuln_data in self.items():
+                    for package, version_ranges in vuln_data["affects"].items():
+                        for version_range in version_ranges:
+                            if package in packages:
+                                packages[package].append([version_range, vuln_vid])
+                            else:
+                                packages[package] = [[version_range, vuln_vid]]
+                self._indexes["packages"] = packages
+
+        return self._indexes["packages"]
+
+    ################################################################################################
+    def get_vulns_by_references(self):
+        """ Return a dictionary of VID by category/reference """
+        if "references" not in self._indexes:
+            with _phase("index building"):
+                references = {}
+                for vuln_vid, vuln_data in self.items():
+                    for reference in vuln_data["references"]:
+                        for key, value in reference.items():
+                            if key in references:
+                                if value in references[key]:
+                                    references[key][value].append(vuln_vid)
+                                else:
+                                    references[key][value] = [vuln_vid]
+                            else:
+                                references[key] = {}
+                                references[key][value] = [vuln_vid]
+                self._indexes["references"] = references
+
+        return self._indexes["references"]
+
+    ################################################################################################
+    def get_vulns_by_dates(self, kind):
+        """ Return a dictionary of VID by discovery, entry or modified dates """
+        index_name = kind + " dates"
+        if index_name not in self._indexes:
+            with _phase("index building"):
+                dates = {}
+                for vuln_vid, vuln_data in self.items():
+                    if kind in vuln_data["dates"]:
+                        if vuln_data["dates"][kind] in dates:
+                            dates[vuln_data["dates"][kind]].append(vuln_vid)
+                        else:
+                            dates[vuln_data["dates"][kind]] = [vuln_vid]
+                self._indexes[index_name] = dates
+
+        return self._indexes[index_name]
+
+    ################################################################################################
+    def _get_saved_index(self, name, build_function):
+        """ Return an index, reusing the one saved next to the VuXML file the data was loaded from """
+        if name not in self._indexes:
+            index = None
+            if self._source_filename:
+                cache_filename = f"{self._source_filename}.{name}.cache"
+                with _phase("cache read"):
+                    index = _read_index_cache(cache_filename, self._source_key)
+                if index is None:
+                    _count("saved index misses")
+                    with _phase("index building"):
+                        index = build_function()
+                    with _phase("cache write"):
+                        _write_cache(cache_filename, self._source_key, index)
+                else:
+                    _count("saved index hits")
+            else:
+                with _phase("index building"):
+                    index = build_function()
+            self._indexes[name] = index
+
+        return self._indexes[name]
+
+    ################################################################################################
+    def _build_words_index(self):
+        """ Return a dictionary of VID numbers by words, for topics, descriptions text and markup """
+        index = {"vids": list(self), "topic": {}, "description": {}, "markup": {}}
+        for number, vuln_data in enumerate(self.values()):
+            _add_vuln_words(index, number, vuln_data)
+
+        return index
+
+    ################################################################################################
+    def get_words_index(self):
+        """ Return a dictionary of VID numbers by words in topics, descriptions text and markup """
+        return self._get_saved_index("words", self._build_words_index)
+
+    ################################################################################################
+    def _get_sorted_words(self, field):
+        """ Return the sorted list of words of a words index field """
+        if "sorted words" not in self._indexes:
+            self._indexes["sorted words"] = {}
+        sorted_words = self._indexes["sorted words"]
+        if field not in sorted_words:
+            words = self.get_words_index()[field]
+            with _phase("index building"):
+                sorted_words[field] = sorted(words)
+
+        return sorted_words[field]
+
+    ################################################################################################
+    def _search_word(self, word, fields, prefix=False):
+        """ Return a set of VID numbers by word, or word prefix, in words index fields """
+        index = self.get_words_index()
+        numbers = set()
+        for field in fields:
+            if prefix:
+                sorted_words = self._get_sorted_words(field)
+                position = bisect.bisect_left(sorted_words, word)
+                while position < len(sorted_words) and sorted_words[position].startswith(word):
+                    numbers.update(index[field][sorted_words[position]])
+                    position += 1
+            elif word in index[field]:
+                numbers.update(index[field][word])
+
+        return numbers
+
+    ################################################################################################
+    def search_vulns_by_words(self, words, in_topics=True, in_descriptions=True):
+        """ Return a list of VID by words, or words prefixes ending with '*',
+        all present in topics and/or descriptions """
+        fields = []
+        if in_topics:
+            fields.append("topic")
+        if in_descriptions:
+            fields.append("description")
+        if isinstance(words, str):
+            words = words.split()
+
+        numbers = None
+        for word in words:
+            prefix = word.endswith("*")
+            parts = [part.casefold() for part in _WORD_REGEX.findall(word)]
+            for part_number, part in enumerate(parts):
+                part_prefix = prefix and part_number == len(parts) - 1
+                part_numbers = self._search_word(part, fields, prefix=part_prefix)
+                if numbers is None:
+                    numbers = part_numbers
+                else:
+                    numbers &= part_numbers
+
+        if not numbers:
+            return []
+
+        vids = self.get_words_index()["vids"]
+        return [vids[number] for number in sorted(numbers)]
+
+    ################################################################################################
+    def _get_regex_candidates(self, regex, in_topics=True, in_descriptions=True):
+        """ Return a list of the VID which can match a regex, or None if it has no required literal """
+        fields = []
+        if in_topics:
+            fields.append("topic")
+        if in_descriptions:
+            fields += ["description", "markup"]
+
+        index = None
+        numbers = None
+        for literal in _get_required_literals(regex.pattern):
+            parts = [part.casefold() for part in _WORD_REGEX.findall(literal)]
+            if not parts:
                 continue
+
+            # Any match contains the literal's longest part inside one of the indexed words
+            part = max(parts, key=len)
+            if index is None:
+                index = self.get_words_index()
+            part_numbers = set()
+            for field in fields:
+                for word, word_numbers in index[field].items():
+                    if part in word:
+                        part_numbers.update(word_numbers)
+            if numbers is None:
+                numbers = part_numbers
             else:
-                logging.warning("Unknown tag: %s", tag1)
+                numbers &= part_numbers
+
+        if numbers is None:
+            return None
+
+        return [index["vids"][number] for number in sorted(numbers)]
 
-            description = ""
-            for element2 in element1:
-                tag2 = re.sub(r"{[^}]*}", "", element2.tag)
-                if element2.text is not None:
-                    text = element2.text.strip()
+    ################################################################################################
+    def search_vulns_by_regex(self, regex_string, in_topics=True, in_descriptions=True):
+        """ Return a list of VID by regex in topics and/or descriptions """
+        try:
+            regex = re.compile(regex_string)
+        except re.error as error:
+            logging.error(
+                "search_vulns_by_regex() argument is not a valid regular expression: %s",
+                error
+            )
+            return []
+
+        # Only check the vulnerabilities containing the words required by the regex
+        candidates = self._get_regex_candidates(regex, in_topics, in_descriptions)
+        if candidates is None:
+            items = self.items()
+        else:
+            items = [(vuln_vid, self[vuln_vid]) for vuln_vid in candidates]
+
+        vulns = []
+        for vuln_vid, vuln_data in items:
+            if in_topics and "topic" in vuln_data:
+                if regex.search(vuln_data["topic"]):
+                    vulns.append(vuln_vid)
+                    continue
+            if in_descriptions and "description" in vuln_data:
+                if regex.search(vuln_data["description"]):
+                    vulns.append(vuln_vid)
+
+        return vulns
+
+    ################################################################################################
+    def _build_identifiers_index(self):
+        """ Return a dictionary of (source, VID) lists by reference identifier """
+        identifiers = {}
+        for vuln_vid, vuln_data in self.items():
+            _add_vuln_identifiers(identifiers, vuln_vid, vuln_data)
+
+        return identifiers
+
+    ################################################################################################
+    def get_vulns_by_identifiers(self):
+        """ Return a dictionary of (source, VID) lists by reference identifier """
+        return self._get_saved_index("identifiers", self._build_identifiers_index)
+
+    ################################################################################################
+    def _build_sources_index(self):
+        """ Return the list of references sources, in order of first use """
+        sources = {}
+        for vuln_data in self.values():
+            for reference in vuln_data["references"]:
+                sources.update(dict.fromkeys(reference))
+
+        return list(sources)
+
+    ################################################################################################
+    def get_references_sources(self):
+        """ Return the list of references sources """
+        return self._get_saved_index("sources", self._build_sources_index)
+
+    ################################################################################################
+    def search_vulns_by_reference(self, source, identifier):
+        """ Return a list of VID by source & identifier in references """
+        if identifier:
+            return [
+                vid
+                for key, vid in self.get_vulns_by_identifiers().get(identifier, [])
+                if not source or source == key
+            ]
+
+        vulns = []
+        references = self.get_vulns_by_references()
+        for key, value in references.items():
+            if not source or source == key:
+                for subvalue in value.values():
+                    vulns += subvalue
+
+        return vulns
+
+    ################################################################################################
+    def resolve_references(self, references):
+        """ Return a dictionary of VID lists by reference from a list of "identifier"
+        or "source~identifier" strings """
+        identifiers = self.get_vulns_by_identifiers()
+        results = {}
+        for reference in references:
+            source, separator, identifier = reference.partition("~")
+            if not separator or not re.fullmatch(r"\w*", source):
+                source = ""
+                identifier = reference
+            vulns = []
+            seen = set()
+            for key, vid in identifiers.get(identifier, []):
+                if (not source or source == key) and vid not in seen:
+                    vulns.append(vid)
+                    seen.add(vid)
+            results[reference] = vulns
+
+        return results
+
+    ################################################################################################
+    def _get_package_index(self, name):
+        """ Return the versions intervals index of a package, building it on first use """
+        if "package intervals" not in self._indexes:
+            self._indexes["package intervals"] = {}
+        package_intervals = self._indexes["package intervals"]
+        if name not in package_intervals:
+            version_ranges = self.get_vulns_by_packages()[name]
+            with _phase("index building"):
+                package_intervals[name] = _index_version_ranges(version_ranges)
+
+        return package_intervals[name]
+
+    ################################################################################################
+    def search_vulns_by_package(self, package_name, package_version, regex_names=False):
+        """ Return a list of VID by name & version in affects """
+        packages = self.get_vulns_by_packages()
+        if regex_names:
+            names = [
+                name for name in packages if re.search(package_name, name) or name == package_name
+            ]
+        elif package_name in packages:
+            names = [package_name]
+        else:
+            names = []
+
+        version_key = None
+        if package_version:
+            with _phase("version parsing"):
+                version_key = get_cached_version_key(package_version)
+
+        vulns = []
+        seen = set()
+        for name in names:
+            boundaries, segments, all_vids = self._get_package_index(name)
+            # If no version is specified, we return all the VID for the name
+            if version_key is None:
+                vids = all_vids
+            else:
+                position = bisect.bisect_left(boundaries, version_key)
+                if position < len(boundaries) and boundaries[position] == version_key:
+                    vids = segments[2 * position + 1]
                 else:
-                    text = ""
-
-                if tag1 == "affects":
-                    names = []
-                    ranges = []
-                    for element3 in element2:
-                        tag3 = re.sub(r"{[^}]*}", "", element3.tag)
-                        if tag3 == "name":
-                            names.append(element3.text)
-                        elif tag3 == "range":
-                            version = []
-                            for element4 in element3:
-                                tag4 = re.sub(r"{[^}]*}", "", element4.tag)
-                                if tag4 == 'lt':
-                                    version.append(["<", f"{element4.text}"])
-                                elif tag4 == "le":
-                                    version.append(['<=', f"{element4.text}"])
-                                elif tag4 == "eq":
-                                    version.append(['==', f"{element4.text}"])
-                                elif tag4 == "ge":
-                                    version.append(['>=', f"{element4.text}"])
-                                elif tag4 == "gt":
-                                    version.append(['>', f"{element4.text}"])
-                            ranges.append(version)
-                    for name in names:
-                        vuxml[vuln_vid]["affects"][name] = ranges
-
-                elif tag1 == "description":
-                    description += _get_sub_description(element2)
-
-                elif tag1 == "references":
-                    vuxml[vuln_vid]["references"].append({tag2: text})
-
-                elif tag1 == "dates":
-                    vuxml[vuln_vid]["dates"][tag2] = text
-
-            if description:
-                vuxml[vuln_vid]["description"] = description
+                    vids = segments[2 * position]
 
-    return vuxml
+            for vid in vids:
+                if vid not in seen:
+                    vulns.append(vid)
+                    seen.add(vid)
+
+        return vulns
+
+    ################################################################################################
+    def audit_packages(self, packages):
+        """ Return a dictionary of VID lists by "name-version" from a list of (name, version) """
+        results = {}
+        for name, version in packages:
+            if version:
+                results[f"{name}-{version}"] = self.search_vulns_by_package(name, version)
+            else:
+                results[name] = self.search_vulns_by_package(name, version)
+
+        return results
+
+    ################################################################################################
+    def _get_sorted_dates(self, kind):
+        """ Return the sorted list of discovery, entry or modified dates, and the matching lists
+        of VID and of their positions in the data structure """
+        index_name = kind + " sorted dates"
+        if index_name not in self._indexes:
+            with _phase("index building"):
+                # The sort is stable, so VID with the same date stay in the data structure order
+                dates = [
+                    (vuln_data["dates"][kind], vuln_vid, number)
+                    for number, (vuln_vid, vuln_data) in enumerate(self.items())
+                    if kind in vuln_data["dates"]
+                ]
+                dates.sort(key=lambda item: item[0])
+                self._indexes[index_name] = (
+                    [date for date, _, _ in dates],
+                    [vid for _, vid, _ in dates],
+                    [number for _, _, number in dates],
+                )
+
+        return self._indexes[index_name]
+
+    ################################################################################################
+    def search_vulns_by_date(self, kind, date):
+        """ Return a list of VID by date in discovery, entry or modified dates,
+        in the data structure order """
+        if not is_valid_date(date):
+            return []
+
+        # All the dates starting with date sort between date and date followed by the last character
+        dates, vids, numbers = self._get_sorted_dates(kind)
+        start = bisect.bisect_left(dates, date)
+        end = bisect.bisect_left(dates, date + chr(sys.maxunicode), start)
+
+        return [vid for _, vid in sorted(zip(numbers[start:end], vids[start:end]))]
+
+    ################################################################################################
+    def search_vulns_by_date_range(self, kind, since="", until=""):
+        """ Return a list of VID by discovery, entry or modified dates in the [since, until) range,
+        in chronological order """
+        if (since and not is_valid_date(since)) or (until and not is_valid_date(until)):
+            return []
+
+        # As dates are compared as strings, "YYYY" and "YYYY-MM" stand for their first day
+        dates, vids, _ = self._get_sorted_dates(kind)
+        start = 0
+        if since:
+            start = bisect.bisect_left(dates, since)
+        end = len(dates)
+        if until:
+            end = bisect.bisect_left(dates, until, start)
+
+        return vids[start:end]
+
+    ################################################################################################
+    def build_indexes(self):
+        """ Build all the indexes now, rather than on first use """
+        self.get_vulns_by_topics()
+        for name in self.get_vulns_by_packages():
+            self._get_package_index(name)
+        self.get_vulns_by_references()
+        self.get_vulns_by_identifiers()
+        self.get_references_sources()
+        for field in ("topic", "description", "markup"):
+            self._get_sorted_words(field)
+        for kind in ("discovery", "entry", "modified"):
+            self.get_vulns_by_dates(kind)
+            self._get_sorted_dates(kind)
+
+    ################################################################################################
+    def get_changes(self):
+        """ Return a dictionary of the VID lists "added", "modified" and "removed" (including the
+        cancelled ones) by the last update of the VuXML file the data was loaded from """
+        changes = None
+        if self._source_filename:
+            changes = _read_index_cache(f"{self._source_filename}.changes", self._source_key)
+        if changes is None:
+            return {"added": [], "modified": [], "removed": []}
+
+        return changes
+
+
+####################################################################################################
+def _get_words(text):
+    """ Return the set of case folded words in a text """
+    return {word.casefold() for word in _WORD_REGEX.findall(text)}
+
+
+####################################################################################################
+def _add_vuln_words(index, number, vuln_data):
+    """ Add a vulnerability VID number to a words index, for the words of its topic,
+    description text and description markup """
+    description = vuln_data.get("description", "")
+    texts = {
+        "topic": vuln_data.get("topic", ""),
+        "description": _MARKUP_REGEX.sub(" ", description),
+        "markup": " ".join(_MARKUP_REGEX.findall(description)),
+    }
+    for field, text in texts.items():
+        words = index[field]
+        for word in _get_words(text):
+            if word in words:
+                words[word].append(number)
+            else:
+                words[word] = [number]
+
+
+####################################################################################################
+def _update_words_index(index, vuxml, changed_vids):
+    """ Return a words index for a VuXML data structure from the one of its previous version,
+    only indexing again the changed vulnerabilities """
+    vids = list(vuxml)
+    numbers = {vuln_vid: number for number, vuln_vid in enumerate(vids)}
+    renumbering = [
+        None if vuln_vid in changed_vids else numbers.get(vuln_vid)
+        for vuln_vid in index["vids"]
+    ]
+
+    new_index = {"vids": vids}
+    for field in ("topic", "description", "markup"):
+        words = {}
+        for word, old_numbers in index[field].items():
+            new_numbers = [
+                renumbering[number] for number in old_numbers if renumbering[number] is not None
+            ]
+            if new_numbers:
+                words[word] = new_numbers
+        new_index[field] = words
+
+    for vuln_vid in changed_vids:
+        if vuln_vid in numbers:
+            _add_vuln_words(new_index, numbers[vuln_vid], vuxml[vuln_vid])
+
+    # Keep the VID numbers in the data structure order, like a full indexing would
+    for field in ("topic", "description", "markup"):
+        for numbers_list in new_index[field].values():
+            numbers_list.sort()
+
+    return new_index
+
+
+####################################################################################################
+def _add_vuln_identifiers(identifiers, vuln_vid, vuln_data):
+    """ Add a vulnerability (source, VID) to an index of references identifiers """
+    for reference in vuln_data["references"]:
+        for key, value in reference.items():
+            if value in identifiers:
+                identifiers[value].append((key, vuln_vid))
+            else:
+                identifiers[value] = [(key, vuln_vid)]
+
+
+####################################################################################################
+def _update_identifiers_index(identifiers, vuxml, changed_vids):
+    """ Return an index of references identifiers for a VuXML data structure from the one of its
+    previous version, only indexing again the changed vulnerabilities """
+    new_identifiers = {}
+    for identifier, references in identifiers.items():
+        references = [
+            (key, vuln_vid)
+            for key, vuln_vid in references
+            if vuln_vid not in changed_vids and vuln_vid in vuxml
+        ]
+        if references:
+            new_identifiers[identifier] = references
+
+    for vuln_vid in changed_vids:
+        if vuln_vid in vuxml:
+            _add_vuln_identifiers(new_identifiers, vuln_vid, vuxml[vuln_vid])
+
+    # Keep the VID in the data structure order, like a full indexing would
+    numbers = {vuln_vid: number for number, vuln_vid in enumerate(vuxml)}
+    for references in new_identifiers.values():
+        references.sort(key=lambda reference: numbers[reference[1]])
+
+    return new_identifiers
+
+
+####################################################################################################
+def _add_required_literals(subpattern, literals):
+    """ Add the strings which any match of a parsed regex must contain to a list """
+    literal = ""
+    for operator, argument in subpattern:
+        if operator == sre_parse.LITERAL:
+            literal += chr(argument)
+            continue
+
+        if literal:
+            literals.append(literal)
+            literal = ""
+
+        if operator == sre_parse.SUBPATTERN:
+            _add_required_literals(argument[-1], literals)
+        elif operator in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and argument[0] >= 1:
+            _add_required_literals(argument[2], literals)
+
+    if literal:
+        literals.append(literal)
+
+
+####################################################################################################
+def _get_required_literals(regex_string):
+    """ Return the strings which any match of a regex must contain """
+    literals = []
+    try:
+        _add_required_literals(sre_parse.parse(regex_string), literals)
+    except (re.error, TypeError, IndexError, RecursionError):
+        return []
+
+    return literals
+
+
+####################################################################################################
+def _get_version_interval(conditions):
+    """ Return the (lower key, lower included, upper key, upper included) interval of versions
+    matching all the conditions of a range (with None keys when unbounded), or None if empty """
+    lower_key = None
+    lower_included = True
+    upper_key = None
+    upper_included = True
+    for operator, affected_version in conditions:
+        key = get_version_key(affected_version)
+        if operator in (">", ">=", "=="):
+            included = operator != ">"
+            if lower_key is None \
+            or key > lower_key \
+            or (key == lower_key and not included):
+                lower_key = key
+                lower_included = included
+        if operator in ("<", "<=", "=="):
+            included = operator != "<"
+            if upper_key is None \
+            or key < upper_key \
+            or (key == upper_key and not included):
+                upper_key = key
+                upper_included = included
+        if operator not in (">", ">=", "==", "<", "<="):
+            logging.warning("Unknown operator: %s", operator)
+            _count("invalid version ranges")
+            return None
+
+    if lower_key is not None and upper_key is not None:
+        if lower_key > upper_key \
+        or (lower_key == upper_key and not (lower_included and upper_included)):
+            return None
+
+    return lower_key, lower_included, upper_key, upper_included
+
+
+####################################################################################################
+def _index_version_ranges(version_ranges):
+    """ Return a (boundaries, segments, all VID) index from a package [range, VID] list
+
+    The sorted boundaries are the affected versions keys. They split versions in segments:
+    segments[2 * i] holds the VID affecting the versions between boundaries[i - 1] and
+    boundaries[i], and segments[2 * i + 1] the VID affecting boundaries[i] itself """
+    intervals = []
+    for version_range, vid in version_ranges:
+        interval = _get_version_interval(version_range)
+        if interval is not None:
+            intervals.append((interval, vid))
+
+    boundaries = set()
+    for (lower_key, _, upper_key, _), _ in intervals:
+        if lower_key is not None:
+            boundaries.add(lower_key)
+        if upper_key is not None:
+            boundaries.add(upper_key)
+    boundaries = sorted(boundaries)
+    positions = {key: position for position, key in enumerate(boundaries)}
+
+    # Find the first and last segments of each interval
+    starts = [[] for _ in range(2 * len(boundaries) + 1)]
+    ends = [[] for _ in range(2 * len(boundaries) + 1)]
+    for ordinal, ((lower_key, lower_included, upper_key, upper_included), _) in enumerate(intervals):
+        if lower_key is None:
+            first = 0
+        elif lower_included:
+            first = 2 * positions[lower_key] + 1
+        else:
+            first = 2 * positions[lower_key] + 2
+        if upper_key is None:
+            last = 2 * len(boundaries)
+        elif upper_included:
+            last = 2 * positions[upper_key] + 1
+        else:
+            last = 2 * positions[upper_key]
+        starts[first].append(ordinal)
+        ends[last].append(ordinal)
+
+    # Sweep the segments, keeping the VID in the order of the version ranges
+    segments = []
+    active = []
+    for position in range(2 * len(boundaries) + 1):
+        for ordinal in starts[position]:
+            bisect.insort(active, ordinal)
+        vids = tuple(dict.fromkeys(intervals[ordinal][1] for ordinal in active))
+        if segments and segments[-1] == vids:
+            vids = segments[-1]
+        segments.append(vids)
+        for ordinal in ends[position]:
+            active.remove(ordinal)
+
+    all_vids = tuple(dict.fromkeys(vid for _, vid in version_ranges))
+
+    return boundaries, segments, all_vids
+
+
+####################################################################################################
+def _get_database(vuxml):
+    """ Return a VuXMLDatabase from a VuXML data structure, reusing it if it's already one
+    (or another database with the same search methods, such as a SQLiteDatabase) """
+    if isinstance(vuxml, VuXMLDatabase) or hasattr(vuxml, "search_vulns_by_package"):
+        return vuxml
+
+    return VuXMLDatabase(vuxml)
 
 
 ####################################################################################################
@@ -169,14 +1927,7 @@ def get_vulns_by_topics(vuxml):
     if not vuxml:
         return {}
 
-    topics = {}
-    for vuln_vid, vuln_data in vuxml.items():
-        if vuln_data["topic"] in topics:
-            topics[vuln_data["topic"]].append(vuln_vid)
-        else:
-            topics[vuln_data["topic"]] = [vuln_vid]
-
-    return topics
+    return _get_database(vuxml).get_vulns_by_topics()
 
 
 ####################################################################################################
@@ -185,16 +1936,7 @@ def get_vulns_by_packages(vuxml):
     if not vuxml:
         return {}
 
-    packages = {}
-    for vuln_vid, vuln_data in vuxml.items():
-        for package, version_ranges in vuln_data["affects"].items():
-            for version_range in version_ranges:
-                if package in packages:
-                    packages[package].append([version_range, vuln_vid])
-                else:
-                    packages[package] = [[version_range, vuln_vid]]
-
-    return packages
+    return _get_database(vuxml).get_vulns_by_packages()
 
 
 ####################################################################################################
@@ -203,20 +1945,25 @@ def get_vulns_by_references(vuxml):
     if not vuxml:
         return {}
 
-    references = {}
-    for vuln_vid, vuln_data in vuxml.items():
-        for reference in vuln_data["references"]:
-            for key, value in reference.items():
-                if key in references:
-                    if  value in references[key]:
-                        references[key][value].append(vuln_vid)
-                    else:
-                        references[key][value] = [vuln_vid]
-                else:
-                    references[key] = {}
-                    references[key][value] = [vuln_vid]
+    return _get_database(vuxml).get_vulns_by_references()
 
-    return references
+
+####################################################################################################
+def get_vuxml_sources(filename="", max_age=CACHE_MAX_AGE, offline=False, jobs=1):
+    """ Return the list of references sources of a FreeBSD VuXML file, which is only loaded
+    if they were not saved from its current version """
+    if not filename:
+        filename = _download_vuxml(max_age=max_age, offline=offline)
+        if not filename:
+            return []
+
+    with _phase("cache read"):
+        _, sources = _read_cache(f"{filename}.sources.cache", filename)
+    if sources is not None:
+        _count("saved index hits")
+        return sources
+
+    return load_vuxml(filename=filename, lazy_descriptions=True, jobs=jobs).get_references_sources()
 
 
 ####################################################################################################
@@ -225,15 +1972,7 @@ def get_vulns_by_discovery_dates(vuxml):
     if not vuxml:
         return {}
 
-    discovery_dates = {}
-    for vuln_vid, vuln_data in vuxml.items():
-        if "discovery" in vuln_data["dates"]:
-            if vuln_data["dates"]["discovery"] in discovery_dates:
-                discovery_dates[vuln_data["dates"]["discovery"]].append(vuln_vid)
-            else:
-                discovery_dates[vuln_data["dates"]["discovery"]] = [vuln_vid]
-
-    return discovery_dates
+    return _get_database(vuxml).get_vulns_by_dates("discovery")
 
 
 ####################################################################################################
@@ -242,15 +1981,7 @@ def get_vulns_by_entry_dates(vuxml):
     if not vuxml:
         return {}
 
-    entry_dates = {}
-    for vuln_vid, vuln_data in vuxml.items():
-        if "entry" in vuln_data["dates"]:
-            if vuln_data["dates"]["entry"] in entry_dates:
-                entry_dates[vuln_data["dates"]["entry"]].append(vuln_vid)
-            else:
-                entry_dates[vuln_data["dates"]["entry"]] = [vuln_vid]
-
-    return entry_dates
+    return _get_database(vuxml).get_vulns_by_dates("entry")
 
 
 ####################################################################################################
@@ -259,15 +1990,7 @@ def get_vulns_by_modified_dates(vuxml):
     if not vuxml:
         return {}
 
-    modified_dates = {}
-    for vuln_vid, vuln_data in vuxml.items():
-        if "modified" in vuln_data["dates"]:
-            if vuln_data["dates"]["modified"] in modified_dates:
-                modified_dates[vuln_data["dates"]["modified"]].append(vuln_vid)
-            else:
-                modified_dates[vuln_data["dates"]["modified"]] = [vuln_vid]
-
-    return modified_dates
+    return _get_database(vuxml).get_vulns_by_dates("modified")
 
 
 ####################################################################################################
@@ -276,26 +1999,19 @@ def search_vulns_by_regex(vuxml, regex_string, in_topics=True, in_descriptions=T
     if not vuxml:
         return []
 
-    try:
-        regex = re.compile(regex_string)
-    except re.error as error:
-        logging.error(
-            "search_vulns_by_regex() argument is not a valid regular expression: %s",
-            error
-        )
-        return []
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_regex(regex_string, in_topics, in_descriptions)
 
-    vulns = []
-    for vuln_vid, vuln_data in vuxml.items():
-        if in_topics and "topic" in vuln_data:
-            if re.search(regex, vuln_data["topic"]):
-                vulns.append(vuln_vid)
-        if in_descriptions and "description" in vuln_data:
-            if re.search(regex, vuln_data["description"]):
-                if vuln_vid not in vulns:
-                    vulns.append(vuln_vid)
 
-    return vulns
+####################################################################################################
+def search_vulns_by_words(vuxml, words, in_topics=True, in_descriptions=True):
+    """ Return a list of VID by words, or words prefixes ending with '*',
+    all present in topics and/or descriptions """
+    if not vuxml:
+        return []
+
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_words(words, in_topics, in_descriptions)
 
 
 ####################################################################################################
@@ -304,16 +2020,38 @@ def search_vulns_by_reference(vuxml, source, identifier):
     if not vuxml:
         return []
 
-    vulns = []
-    references = get_vulns_by_references(vuxml)
-    for key, value in references.items():
-        if not source or source == key:
-            for subkey, subvalue in value.items():
-                if not identifier or subkey == identifier:
-                    for vid in subvalue:
-                        vulns.append(vid)
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_reference(source, identifier)
 
-    return vulns
+
+####################################################################################################
+def parse_references_list(lines):
+    """ Return a list of "identifier" or "source~identifier" strings from lines of such strings
+    separated by spaces or commas """
+    references = []
+    seen = set()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        for reference in re.split(r"[\s,;]+", line):
+            if reference and reference not in seen:
+                references.append(reference)
+                seen.add(reference)
+
+    return references
+
+
+####################################################################################################
+def resolve_references(vuxml, references):
+    """ Return a dictionary of VID lists by reference from a list of "identifier"
+    or "source~identifier" strings """
+    if not vuxml:
+        return {}
+
+    with _phase("search"):
+        return _get_database(vuxml).resolve_references(references)
 
 
 ####################################################################################################
@@ -322,96 +2060,48 @@ def search_vulns_by_package(vuxml, package_name, package_version, regex_names=Fa
     if not vuxml:
         return []
 
-    vulns = []
-    packages = get_vulns_by_packages(vuxml)
-    for name, version_ranges in packages.items():
-        if (regex_names and re.search(package_name, name)) \
-        or name == package_name:
-            for version_range in version_ranges:
-                vid = version_range[1]
-                # If no version is specified, we return all the VID for the name
-                if not package_version:
-                    if vid not in vulns:
-                        vulns.append(vid)
-                else:
-                    package_version_orig = package_version
-                    # We don't handle PORTEPOCH
-                    if "," in package_version:
-                        package_version = re.sub(r",.*", "", package_version)
-                    # PORTREVISION is treated as a sub version
-                    if "_" in package_version:
-                        package_version = re.sub(r"_", ".", package_version)
-                    try:
-                        package_version2 = packaging.version.parse(package_version)
-                    except packaging.version.InvalidVersion:
-                        logging.debug(
-                            "Invalid version '%s' (translated as '%s') for specified package '%s'",
-                            package_version_orig,
-                            package_version,
-                            package_name
-                        )
-                        continue
-
-                    conditions = version_range[0]
-                    test_results = True
-                    for condition in conditions:
-                        operator = condition[0]
-                        affected_version = condition[1]
-
-                        # CAVEAT:
-                        # The packaging module doesn't know how to handle some version numbers
-                        # (it's made only for Python packages versions)
-                        # I should write my own!
-                        affected_version_orig = affected_version
-                        # We don't handle PORTEPOCH
-                        if "," in affected_version:
-                            affected_version = re.sub(r",.*", "", affected_version)
-                        # PORTREVISION is treated as a sub version
-                        if "_" in affected_version:
-                            affected_version = re.sub(r"_", ".", affected_version)
-                        # version.* is treated as version
-                        if ".*" in affected_version:
-                            affected_version = re.sub(r"\.\*", "", affected_version)
-                        try:
-                            affected_version2 = packaging.version.parse(affected_version)
-                        except packaging.version.InvalidVersion:
-                            logging.debug(
-                                "Invalid version '%s' (translated as '%s') for affected package '%s'",
-                                affected_version_orig,
-                                affected_version,
-                                name
-                            )
-                            continue
-
-                        if operator == ">":
-                            if package_version2 <= affected_version2:
-                                test_results = False
-                                break
-                        elif operator == ">=":
-                            if package_version2 < affected_version2:
-                                test_results = False
-                                break
-                        elif operator == "==":
-                            if package_version2 != affected_version2:
-                                test_results = False
-                                break
-                        elif operator == "<=":
-                            if package_version2 > affected_version2:
-                                test_results = False
-                                break
-                        elif operator == "<":
-                            if package_version2 >= affected_version2:
-                                test_results = False
-                                break
-                        else:
-                            logging.warning("Unknown operator: %s", operator)
-                            test_results = False
-                            break
-                    if test_results:
-                        if vid not in vulns:
-                            vulns.append(vid)
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_package(
+            package_name,
+            package_version,
+            regex_names
+        )
+
 
-    return vulns
+####################################################################################################
+def parse_packages_list(lines):
+    """ Return a list of (name, version) from "name version", "name~version" or "name-version" lines
+    (such as the output of "pkg query '%n %v'" or "pkg info -q") """
+    packages = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        parts = line.split()
+        if len(parts) >= 2:
+            name = parts[0]
+            version = parts[1]
+        elif "~" in line:
+            name, _, version = line.partition("~")
+        elif "-" in line:
+            name, _, version = line.rpartition("-")
+        else:
+            name = line
+            version = ""
+        packages.append((name, version))
+
+    return packages
+
+
+####################################################################################################
+def audit_packages(vuxml, packages):
+    """ Return a dictionary of VID lists by "name-version" from a list of (name, version) """
+    if not vuxml:
+        return {}
+
+    with _phase("search"):
+        return _get_database(vuxml).audit_packages(packages)
 
 
 ####################################################################################################
@@ -457,93 +2147,54 @@ def is_valid_date(string):
 ####################################################################################################
 def search_vulns_by_discovery_date(vuxml, date):
     """ Return a list of VID by date in discovery dates """
-    if not vuxml or not is_valid_date(date):
+    if not vuxml:
         return []
 
-    vulns = []
-    discovery_dates = get_vulns_by_discovery_dates(vuxml)
-    for key, value in discovery_dates.items():
-        if key.startswith(date):
-            for vid in value:
-                if vid not in vulns:
-                    vulns.append(vid)
-
-    return vulns
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_date("discovery", date)
 
 
 ####################################################################################################
 def search_vulns_by_entry_date(vuxml, date):
     """ Return a list of VID by date in entry dates """
-    if not vuxml or not is_valid_date(date):
+    if not vuxml:
         return []
 
-    vulns = []
-    entry_dates = get_vulns_by_entry_dates(vuxml)
-    for key, value in entry_dates.items():
-        if key.startswith(date):
-            for vid in value:
-                if vid not in vulns:
-                    vulns.append(vid)
-
-    return vulns
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_date("entry", date)
 
 
 ####################################################################################################
 def search_vulns_by_modified_date(vuxml, date):
     """ Return a list of VID by date in modified dates """
-    if not vuxml or not is_valid_date(date):
+    if not vuxml:
         return []
 
-    vulns = []
-    modified_dates = get_vulns_by_modified_dates(vuxml)
-    for key, value in modified_dates.items():
-        if key.startswith(date):
-            for vid in value:
-                if vid not in vulns:
-                    vulns.append(vid)
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_date("modified", date)
+
+
+####################################################################################################
+def search_vulns_by_date_range(vuxml, kind, since="", until=""):
+    """ Return a list of VID by discovery, entry or modified dates in the [since, until) range """
+    if not vuxml:
+        return []
+
+    with _phase("search"):
+        return _get_database(vuxml).search_vulns_by_date_range(kind, since, until)
+
+
+####################################################################################################
+def get_vuxml_changes(vuxml):
+    """ Return a dictionary of the VID lists "added", "modified" and "removed" by the last update
+    of the VuXML file a VuXMLDatabase (or SQLiteDatabase) was loaded from """
+    if not hasattr(vuxml, "get_changes"):
+        return {"added": [], "modified": [], "removed": []}
 
-    return vulns
+    return vuxml.get_changes()
 
 
 ####################################################################################################
 def print_vuln(vid, vuln, show_description=False):
     """ Pretty print a vulnerability """
-    colorama.init()
-    bright = colorama.Style.BRIGHT
-    red = colorama.Fore.RED
-    red_bg = colorama.Back.RED
-    normal = colorama.Style.RESET_ALL
-    print(f"{bright}Vulnerability ID:{normal} {vid}")
-    if "topic" in vuln:
-        print(f"  {bright}Topic:{normal} {red_bg}{vuln['topic']}{normal}")
-    if "affects" in vuln:
-        print(f"  {bright}Affects:{normal}")
-        for package_name, package_version_ranges in vuln["affects"].items():
-            print(f"    {bright}{red}{package_name}{normal}:")
-            for package_version_range in package_version_ranges:
-                print("      ", end="")
-                for condition in package_version_range:
-                    print(f"{condition[0]} {condition[1]} ; ", end="")
-                print()
-    if show_description and "description" in vuln:
-        print(f"  {bright}Description:{normal}")
-        text_maker = html2text.HTML2Text()
-        text_maker.ignore_links = True
-        text_maker.bypass_tables = False
-        text = text_maker.handle(vuln["description"])
-        for line in text.split('/n'):
-            print(f"    {line}")
-    if "references" in vuln:
-        if len(vuln["references"]):
-            print(f"  {bright}References:{normal}")
-            for reference in vuln["references"]:
-                for key, value in reference.items():
-                    print(f"    {key}: {value}")
-    if "dates" in vuln:
-        if "discovery" in vuln["dates"]:
-            print(f"  {bright}Discovery date:{normal} {vuln['dates']['discovery']}")
-        if "entry" in vuln["dates"]:
-            print(f"  {bright}Entry date:{normal} {vuln['dates']['entry']}")
-        if "modified" in vuln["dates"]:
-            print(f"  {bright}Modified date:{normal} {vuln['dates']['modified']}")
-    print()
+    VulnRenderer(show_description=show_description).render(vid, vuln)
@@ -4,21 +4,35 @@ License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
 Author: Hubert Tournier
 """
 
-import getopt
+import atexit
 import logging
 import os
 import re
+import signal
 import sys
 import uuid
 
 import libpnu
 
-from .library import load_vuxml, get_vulns_by_topics, get_vulns_by_packages, \
-                     get_vulns_by_references, get_vulns_by_discovery_dates, \
+from .library import CACHE_MAX_AGE, load_vuxml, iter_vuxml, get_vulns_by_topics, get_vulns_by_packages, \
+                     get_vulns_by_references, get_vuxml_sources, get_vulns_by_discovery_dates, \
                      get_vulns_by_entry_dates, get_vulns_by_modified_dates, search_vulns_by_regex, \
-                     search_vulns_by_reference, search_vulns_by_package, is_valid_date, \
+                     search_vulns_by_words, search_vulns_by_reference, parse_references_list, \
+                     resolve_references, search_vulns_by_package, parse_packages_list, \
+                     audit_packages, get_vuxml_changes, is_valid_date, \
                      search_vulns_by_discovery_date, search_vulns_by_entry_date, \
-                     search_vulns_by_modified_date, print_vuln
+                     search_vulns_by_modified_date, search_vulns_by_date_range, print_vuln, \
+                     VuXMLDatabase
+from .pkgversion import compare_versions
+from .renderer import OUTPUT_FORMATS, VulnRenderer
+from .query import Query, Vid, Topic, Keyword, Words, Package, Reference, Date, DateRange, And, Or, \
+                   Not, get_criteria_queries, search_vulns
+from .server import serve, VuXMLClient
+from .sqlitedb import load_vuxml_sqlite, save_vuxml_sqlite, SQLiteDatabase
+from .stats import add_stats_hook, remove_stats_hook, VuXMLStats
+from .shared import SHARED_TTL, SharedVuXML, get_shared_vuxml
+from .aio import load_vuxml_async, search_vulns_async, audit_packages_async, \
+                 resolve_references_async
 
 # Version string used by the what(1) and ident(1) commands:
 ID = "@(#) $Id: vuxml - FreeBSD VuXML library and query tool v1.2.1 (March 18, 2024) by Hubert Tournier $"
@@ -28,14 +42,30 @@ parameters = {
     "Vid": [],
     "Topics": [],
     "Packages": [],
+    "Audit files": [],
     "Keywords": [],
+    "Words": [],
     "References": [],
+    "References files": [],
     "Discovery dates": [],
     "Entry dates": [],
     "Modified dates": [],
+    "Since": "",
+    "Until": "",
     "Regex names": False,
     "List references sources": False,
+    "Changes": False,
     "Print description": False,
+    "Combination": "",
+    "Output format": "text",
+    "Serve": False,
+    "Remote": False,
+    "Server address": "",
+    "SQLite": False,
+    "Jobs": 1,
+    "Stats": False,
+    "Max age": CACHE_MAX_AGE,
+    "Offline": False,
 }
 
 
@@ -43,27 +73,51 @@ parameters = {
 def _display_help():
     """ Display usage and help """
     #pylint: disable=C0301
-    print("usage: vuxml [--desc|-D] [--id|-i VID]", file=sys.stderr)
-    print("       [--topic|-t RE] [--keyword|-k]", file=sys.stderr)
+    print("usage: vuxml [--desc|-D] [--id|-i VID] [--audit|-a FILE]", file=sys.stderr)
+    print("       [--topic|-t RE] [--keyword|-k RE] [--word|-w WORDS]", file=sys.stderr)
     print("       [--package|-p PID] [--re-names|-R]", file=sys.stderr)
-    print("       [--sources|-s] [--ref|-r RID]", file=sys.stderr)
+    print("       [--sources|-s] [--ref|-r RID] [--ref-file|-f FILE] [--changes]", file=sys.stderr)
     print("       [--discovery|-d DATE] [--entry|-e DATE] [--modified|-m DATE]", file=sys.stderr)
-    print("       [--debug] [--help|-?] [--version] [--]", file=sys.stderr)
+    print("       [--since DATE] [--until DATE]", file=sys.stderr)
+    print("       [--all|--any] [--json|--ndjson] [--max-age SECONDS] [--offline|-o]", file=sys.stderr)
+    print("       [--serve|--remote] [--socket ADDRESS] [--sqlite] [--jobs|-j JOBS]", file=sys.stderr)
+    print("       [--stats] [--debug] [--help|-?] [--version] [--]", file=sys.stderr)
     print("  -------------------  --------------------------------------------------", file=sys.stderr)
+    print("  --audit|-a FILE      Search for vulnerable packages listed in FILE (- for stdin)", file=sys.stderr)
+    print("                       with \"name version\" or \"name-version\" lines", file=sys.stderr)
     print("  --desc|-D            Print description", file=sys.stderr)
     print("  --id|-i VID          Search for the specified Vulnerability ID", file=sys.stderr)
     print("  --topic|-t RE        Search for the specified regex in topics", file=sys.stderr)
     print("  --keyword|-k RE      Search for the specified regex in topics and desc.", file=sys.stderr)
+    print("  --word|-w WORDS      Search for all the specified words in topics and desc.", file=sys.stderr)
+    print("                       A word ending with '*' is a prefix", file=sys.stderr)
     print("  --package|-p PID     Search for the specified name in affected packages", file=sys.stderr)
     print("                       PID can also be name~version", file=sys.stderr)
     print("  --re-names|-R        The name part of a PID is a regex", file=sys.stderr)
     print("  --sources|-s         List references sources", file=sys.stderr)
     print("  --ref|-r RID         Search for the specified ID in references", file=sys.stderr)
     print("                       RID can also be source~, source~ID", file=sys.stderr)
+    print("  --ref-file|-f FILE   Search for the IDs listed in FILE (- for stdin) in references", file=sys.stderr)
+    print("                       IDs can also be source~ID", file=sys.stderr)
+    print("  --changes            Print the vulnerabilities changed by the last database update", file=sys.stderr)
     print("  --discovery|-d DATE  Search for the specified date in discovery dates", file=sys.stderr)
     print("  --entry|-e DATE      Search for the specified date in entry dates", file=sys.stderr)
     print("  --modified|-m DATE   Search for the specified date in modified dates", file=sys.stderr)
     print("                       DATE can be YYYY-MM-DD, YYYY-MM or YYYY", file=sys.stderr)
+    print("  --since DATE         Search for entry or modified dates from DATE", file=sys.stderr)
+    print("  --until DATE         Search for entry or modified dates before DATE", file=sys.stderr)
+    print("  --all                Print the vulnerabilities matching all the searches", file=sys.stderr)
+    print("  --any                Print the vulnerabilities matching any search, once", file=sys.stderr)
+    print("  --json               Print the vulnerabilities as a JSON array", file=sys.stderr)
+    print("  --ndjson             Print the vulnerabilities as JSON objects, one per line", file=sys.stderr)
+    print("  --max-age SECONDS    Check for database updates after SECONDS (def. 86400)", file=sys.stderr)
+    print("  --offline|-o         Never check for database updates", file=sys.stderr)
+    print("  --serve              Answer queries from --remote clients, until interrupted", file=sys.stderr)
+    print("  --remote             Send the searches to a --serve server", file=sys.stderr)
+    print("  --socket ADDRESS     Use the ADDRESS UNIX socket, or localhost TCP port number", file=sys.stderr)
+    print("  --sqlite             Query the database from a SQLite file", file=sys.stderr)
+    print("  --jobs|-j JOBS       Parse the database with JOBS processes (0 for all CPU)", file=sys.stderr)
+    print("  --stats              Print phases durations and counters at exit", file=sys.stderr)
     print("  --debug              Enable debug mode", file=sys.stderr)
     print("  --help|-?            Print usage and this help message and exit", file=sys.stderr)
     print("  --version            Print version and exit", file=sys.stderr)
@@ -82,6 +136,27 @@ def _process_environment_variables():
     if "VUXML_DEBUG" in os.environ:
         logging.disable(logging.NOTSET)
 
+    if "VUXML_MAX_AGE" in os.environ:
+        try:
+            parameters["Max age"] = int(os.environ["VUXML_MAX_AGE"])
+        except ValueError:
+            logging.error("VUXML_MAX_AGE environment variable is not a valid number of seconds")
+
+    if "VUXML_OFFLINE" in os.environ:
+        parameters["Offline"] = True
+
+    if "VUXML_SOCKET" in os.environ:
+        parameters["Server address"] = os.environ["VUXML_SOCKET"]
+
+    if "VUXML_PROFILE" in os.environ:
+        parameters["Stats"] = True
+
+    if "VUXML_JOBS" in os.environ:
+        try:
+            parameters["Jobs"] = int(os.environ["VUXML_JOBS"])
+        except ValueError:
+            logging.error("VUXML_JOBS environment variable is not a valid number of processes")
+
     logging.debug("_process_environment_variables(): parameters:")
     logging.debug(parameters)
 
@@ -89,28 +164,48 @@ def _process_environment_variables():
 ####################################################################################################
 def _process_command_line():
     """ Process command line options """
+    import getopt # pylint: disable=C0415
+
     #pylint: disable=C0103, W0602
     global parameters
     #pylint: enable=C0103, W0602
 
     # option letters followed by : expect an argument
     # same for option strings followed by =
-    character_options = "d:e:i:k:m:p:r:st:DR?"
+    character_options = "a:d:e:f:i:j:k:m:op:r:st:w:DR?"
     string_options = [
+        "all",
+        "any",
+        "audit=",
+        "changes",
         "debug",
         "description",
         "discovery=",
         "entry=",
         "help",
         "id=",
+        "jobs=",
+        "json",
         "keyword=",
+        "max-age=",
         "modified=",
+        "ndjson",
+        "offline",
         "package=",
         "ref=",
+        "ref-file=",
         "re-names",
+        "remote",
+        "serve",
+        "since=",
+        "socket=",
         "sources",
+        "sqlite",
+        "stats",
         "topic=",
+        "until=",
         "version",
+        "word=",
     ]
 
     try:
@@ -135,6 +230,22 @@ def _process_command_line():
             print(ID.replace("@(" + "#)" + " $" + "Id" + ": ", "").replace(" $", ""))
             sys.exit(0)
 
+        elif option == "--all":
+            parameters["Combination"] = "all"
+
+        elif option == "--any":
+            parameters["Combination"] = "any"
+
+        elif option in ["--audit", "-a"]:
+            if argument != "-" and not os.path.isfile(argument):
+                logging.error("--audit argument is not an existing file")
+                continue
+
+            parameters['Audit files'].append(argument)
+
+        elif option == "--changes":
+            parameters["Changes"] = True
+
         elif option in ["--desc", "-D"]:
             parameters['Print description'] = True
 
@@ -162,6 +273,16 @@ def _process_command_line():
             if argument not in parameters['Vid']:
                 parameters['Vid'].append(str(vid))
 
+        elif option in ["--jobs", "-j"]:
+            try:
+                parameters["Jobs"] = int(argument)
+            except ValueError:
+                logging.error('--jobs argument is not a valid number of processes')
+                continue
+
+        elif option in ["--json", "--ndjson"]:
+            parameters["Output format"] = option[2:]
+
         elif option in ["--keyword", "-k"]:
             try:
                 _ = re.compile(argument)
@@ -172,6 +293,13 @@ def _process_command_line():
             if argument not in parameters['Keywords']:
                 parameters['Keywords'].append(argument)
 
+        elif option == "--max-age":
+            try:
+                parameters["Max age"] = int(argument)
+            except ValueError:
+                logging.error('--max-age argument is not a valid number of seconds')
+                continue
+
         elif option in ["--modified", "-m"]:
             if not is_valid_date(argument):
                 logging.error('--modified argument is not a valid date')
@@ -179,6 +307,9 @@ def _process_command_line():
 
             parameters['Modified dates'].append(argument)
 
+        elif option in ["--offline", "-o"]:
+            parameters["Offline"] = True
+
         elif option in ["--package", "-p"]:
             if len(argument.split('~')) > 2:
                 logging.error("--package argument can contain only one '~' character")
@@ -195,12 +326,41 @@ def _process_command_line():
             if argument not in parameters['References']:
                 parameters['References'].append(argument)
 
+        elif option in ["--ref-file", "-f"]:
+            if argument != "-" and not os.path.isfile(argument):
+                logging.error("--ref-file argument is not an existing file")
+                continue
+
+            parameters['References files'].append(argument)
+
         elif option in ["--re-names", "-R"]:
             parameters["Regex names"] = True
 
+        elif option == "--remote":
+            parameters["Remote"] = True
+
+        elif option == "--serve":
+            parameters["Serve"] = True
+
+        elif option == "--since":
+            if not is_valid_date(argument):
+                logging.error('--since argument is not a valid date')
+                continue
+
+            parameters['Since'] = argument
+
+        elif option == "--socket":
+            parameters["Server address"] = argument
+
         elif option in ["--sources", "-s"]:
             parameters["List references sources"] = True
 
+        elif option == "--sqlite":
+            parameters["SQLite"] = True
+
+        elif option == "--stats":
+            parameters["Stats"] = True
+
         elif option in ["--topic", "-t"]:
             try:
                 _ = re.compile(argument)
@@ -211,6 +371,26 @@ def _process_command_line():
             if argument not in parameters['Topics']:
                 parameters['Topics'].append(argument)
 
+        elif option == "--until":
+            if not is_valid_date(argument):
+                logging.error('--until argument is not a valid date')
+                continue
+
+            parameters['Until'] = argument
+
+        elif option in ["--word", "-w"]:
+            if not re.search(r"\w", argument):
+                logging.error('--word argument contains no word')
+                continue
+
+            if argument not in parameters['Words']:
+                parameters['Words'].append(argument)
+
+    # The references sources list is text, which would be mixed with the JSON output
+    if parameters['List references sources'] and parameters["Output format"] != "text":
+        logging.critical("--sources can't be used with --json or --ndjson")
+        sys.exit(1)
+
     logging.debug("_process_command_line(): parameters:")
     logging.debug(parameters)
     logging.debug("_process_command_line(): remaining_arguments:")
@@ -220,139 +400,470 @@ def _process_command_line():
 
 
 ####################################################################################################
-def main():
-    """ The program's main entry point """
+def _get_changes_query():
+    """ Return a query for the vulnerabilities entered or modified in the --since/--until range """
+    return Or(
+        DateRange("entry", parameters['Since'], parameters['Until']),
+        DateRange("modified", parameters['Since'], parameters['Until'])
+    )
+
+
+####################################################################################################
+def _get_query():
+    """ Return a query combining the command line searches, or None if there's none """
+    queries = get_criteria_queries(
+        vids=parameters['Vid'],
+        topics=parameters['Topics'],
+        keywords=parameters['Keywords'],
+        words=parameters['Words'],
+        packages=parameters['Packages'],
+        regex_names=parameters['Regex names'],
+        references=parameters['References'],
+        discovery_dates=parameters['Discovery dates'],
+        entry_dates=parameters['Entry dates'],
+        modified_dates=parameters['Modified dates'],
+        since=parameters['Since'],
+        until=parameters['Until']
+    )
+
+    if not queries:
+        return None
+    if parameters['Combination'] == "all":
+        return And(*queries)
+    return Or(*queries)
+
+
+####################################################################################################
+def _read_packages_files():
+    """ Return a list of (name, version) from the --audit files """
+    packages = []
+    for filename in parameters['Audit files']:
+        if filename == "-":
+            packages += parse_packages_list(sys.stdin)
+        else:
+            with open(filename, "r", encoding="utf-8", errors="ignore") as file:
+                packages += parse_packages_list(file)
+
+    return packages
+
+
+####################################################################################################
+def _read_references_files():
+    """ Return a list of references from the --ref-file files """
+    references = []
+    for filename in parameters['References files']:
+        if filename == "-":
+            references += parse_references_list(sys.stdin)
+        else:
+            with open(filename, "r", encoding="utf-8", errors="ignore") as file:
+                references += parse_references_list(file)
+
+    return references
+
+
+####################################################################################################
+def _write_vulns_count(renderer, vulns_count):
+    """ Write the number of vulnerabilities found, if any """
+    if vulns_count:
+        if vulns_count == 1:
+            renderer.write_text("1 vulnerability found")
+        else:
+            renderer.write_text(f"{vulns_count} vulnerabilities found")
+
+
+####################################################################################################
+def _print_references_sources(sources):
+    """ Print a list of references sources, with their meaning """
+    print("References sources:")
+    for source in sources:
+        if source == 'bid':
+            print("  bid - SecurityFocus Bug ID")
+        elif source == 'certsa':
+            print("  certsa - US-CERT security advisory")
+        elif source == 'certvu':
+            print("  certvu - US-CERT vulnerability note")
+        elif source == 'cvename':
+            print("  cvename - Mitre CVE identifier")
+        elif source == 'freebsdpr':
+            print("  freebsdpr - FreeBSD problem report")
+        elif source == 'freebsdsa':
+            print("  freebsdsa - FreeBSD security advisory")
+        elif source == 'mlist':
+            print("  mlist - URL to an archived posting in a mailing list")
+        elif source == 'url':
+            print("  url - Generic URL")
+        elif source == 'uscertsa':
+            print("  uscertta - US-CERT cyber security alert")
+        elif source == 'uscertta':
+            print("  uscertta - US-CERT technical cyber security alert")
+        else:
+            print(f"  {source} - ?")
+    print()
+
+
+####################################################################################################
+def _print_changes(renderer, changes, vulns):
+    """ Print the vulnerabilities added, modified and removed by the last database update,
+    from a dictionary of vulnerabilities data by VID """
+    for change in ("added", "modified", "removed"):
+        if changes[change]:
+            renderer.write_text(f"Vulnerabilities {change} by the last update:")
+            for vid in changes[change]:
+                renderer.render(vid, vulns.get(vid, {}), change=change)
+    renderer.write_text(
+        f"{len(changes['added'])} added, {len(changes['modified'])} modified"
+        f" and {len(changes['removed'])} removed vulnerabilities in the last update."
+    )
+    renderer.write_text()
+
+
+####################################################################################################
+def _get_criteria():
+    """ Return a dictionary of the command line searches, by server search parameters """
+    criteria = {
+        "id": parameters['Vid'],
+        "topic": parameters['Topics'],
+        "keyword": parameters['Keywords'],
+        "word": parameters['Words'],
+        "package": parameters['Packages'],
+        "ref": parameters['References'],
+        "discovery": parameters['Discovery dates'],
+        "entry": parameters['Entry dates'],
+        "modified": parameters['Modified dates'],
+        "since": [parameters['Since']] if parameters['Since'] else [],
+        "until": [parameters['Until']] if parameters['Until'] else [],
+    }
+    criteria = {name: values for name, values in criteria.items() if values}
+    if criteria and parameters['Regex names']:
+        criteria["re-names"] = [True]
+
+    return criteria
+
+
+####################################################################################################
+def _needs_database():
+    """ Return True if the command line asks for searches or changes """
+    return bool(
+        _get_criteria()
+        or parameters['Audit files']
+        or parameters['References files']
+        or parameters['Changes']
+    )
+
+
+####################################################################################################
+def _remote_main():
+    """ Send the command line searches to a server and print its answers.
+    Return False if there was nothing to do, or None on errors """
+    done_nothing = True
+    client = VuXMLClient(parameters["Server address"])
+    renderer = VulnRenderer(
+        output_format=parameters["Output format"],
+        show_description=parameters['Print description']
+    )
+
+    criteria = _get_criteria()
+    if criteria:
+        done_nothing = False
+        vulns = client.search(criteria, parameters['Combination'], parameters['Print description'])
+        if vulns is None:
+            return None
+        for vuln in vulns:
+            renderer.render(vuln["vid"], vuln)
+        _write_vulns_count(renderer, len(vulns))
+
+    if parameters['Audit files']:
+        done_nothing = False
+        vulns = client.audit_packages(_read_packages_files(), parameters['Print description'])
+        if vulns is None:
+            return None
+        vulnerable_packages_count = 0
+        package = None
+        for vuln in vulns:
+            if vuln["package"] != package:
+                package = vuln["package"]
+                vulnerable_packages_count += 1
+                renderer.write_text(f"{package} is vulnerable:")
+            renderer.render(vuln["vid"], vuln, package=package)
+        renderer.write_text(
+            f"{len(vulns)} problem(s) in {vulnerable_packages_count} installed package(s) found."
+        )
+        renderer.write_text()
+
+    if parameters['References files']:
+        done_nothing = False
+        references = _read_references_files()
+        vulns = client.resolve_references(references, parameters['Print description'])
+        if vulns is None:
+            return None
+        found_references_count = 0
+        reference = None
+        for vuln in vulns:
+            if vuln["reference"] != reference:
+                reference = vuln["reference"]
+                found_references_count += 1
+                renderer.write_text(f"{reference} is referenced by:")
+            renderer.render(vuln["vid"], vuln, reference=reference)
+        renderer.write_text(f"{found_references_count} of {len(references)} reference(s) found.")
+        renderer.write_text()
+
+    if parameters['Changes']:
+        done_nothing = False
+        changes = client.get_changes()
+        if changes is None:
+            return None
+        vulns = client.search(
+            {"id": changes["added"] + changes["modified"]},
+            show_description=parameters['Print description']
+        )
+        if vulns is None:
+            return None
+        _print_changes(renderer, changes, {vuln["vid"]: vuln for vuln in vulns})
+
+    if not done_nothing:
+        renderer.close()
+
+    if parameters['List references sources']:
+        done_nothing = False
+        sources = client.get_sources()
+        if sources is None:
+            return None
+        _print_references_sources(sources)
+
+    return not done_nothing
+
+
+####################################################################################################
+def _main():
+    """ The program's main processing """
     program_name = os.path.basename(sys.argv[0])
 
     libpnu.initialize_debugging(program_name)
     libpnu.handle_interrupt_signals(libpnu.interrupt_handler_function)
+    if hasattr(signal, "SIGPIPE"):
+        # A closed output is not an interruption, and is handled in main()
+        signal.signal(signal.SIGPIPE, signal.SIG_IGN)
     _process_environment_variables()
     _ = _process_command_line()
 
-    done_nothing = True
-    vulns_count = 0
-
-    vuxml = load_vuxml()
+    if parameters["Stats"]:
+        stats = VuXMLStats()
+        add_stats_hook(stats)
+        atexit.register(stats.print_report)
+
+    if parameters["Serve"]:
+        serve(
+            parameters["Server address"],
+            max_age=parameters["Max age"],
+            offline=parameters["Offline"],
+            jobs=parameters["Jobs"]
+        )
+        sys.exit(0)
 
-    if parameters['Vid']:
-        done_nothing = False
-        for vid in parameters['Vid']:
-            if vid in vuxml:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
-                vulns_count += 1
+    if parameters["Remote"]:
+        result = _remote_main()
+        if result is None:
+            sys.exit(1)
+        if not result:
+            _display_help()
+        sys.exit(0)
 
-    if parameters['Topics']:
-        done_nothing = False
-        for regex_string in parameters['Topics']:
-            vulns = search_vulns_by_regex(
-                vuxml,
-                regex_string,
-                in_topics=True,
-                in_descriptions=False
+    # Listing references sources doesn't require loading the whole database
+    if not _needs_database():
+        if not parameters['List references sources']:
+            _display_help()
+        elif parameters["SQLite"]:
+            vuxml = load_vuxml_sqlite(
+                max_age=parameters["Max age"],
+                offline=parameters["Offline"],
+                jobs=parameters["Jobs"]
             )
-            for vid in vulns:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
-                vulns_count += 1
+            _print_references_sources(vuxml.get_references_sources() if vuxml else [])
+        else:
+            _print_references_sources(
+                get_vuxml_sources(
+                    max_age=parameters["Max age"],
+                    offline=parameters["Offline"],
+                    jobs=parameters["Jobs"]
+                )
+            )
+        sys.exit(0)
 
-    if parameters['Keywords']:
-        done_nothing = False
-        for regex_string in parameters['Keywords']:
-            vulns = search_vulns_by_regex(vuxml, regex_string, in_topics=True, in_descriptions=True)
-            for vid in vulns:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
-                vulns_count += 1
+    done_nothing = True
+    vulns_count = 0
 
-    if parameters['Packages']:
-        done_nothing = False
-        for package in parameters['Packages']:
-            if '~' in package:
-                name = package.split('~')[0]
-                version = package.split('~')[1]
-            else:
-                name = package
-                version = ''
-            vulns = search_vulns_by_package(
-                vuxml,
-                name,
-                version,
-                regex_names=parameters['Regex names']
-            )
-            for vid in vulns:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
+    if parameters["SQLite"]:
+        vuxml = load_vuxml_sqlite(
+            max_age=parameters["Max age"],
+            offline=parameters["Offline"],
+            jobs=parameters["Jobs"]
+        )
+    else:
+        vuxml = load_vuxml(
+            max_age=parameters["Max age"],
+            offline=parameters["Offline"],
+            lazy_descriptions=True,
+            jobs=parameters["Jobs"]
+        )
+    renderer = VulnRenderer(
+        output_format=parameters["Output format"],
+        show_description=parameters['Print description']
+    )
+
+    if parameters['Combination']:
+        query = _get_query()
+        if query is not None:
+            done_nothing = False
+            for vid in search_vulns(vuxml, query):
+                renderer.render(vid, vuxml[vid])
                 vulns_count += 1
-
-    if parameters['References']:
-        done_nothing = False
-        for reference in parameters['References']:
-            if '~' in reference:
-                source = reference.split('~')[0]
-                identifier = reference.split('~')[1]
-            else:
-                source = ''
-                identifier = reference
-            vulns = search_vulns_by_reference(vuxml, source, identifier)
-            for vid in vulns:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
+    else:
+        if parameters['Vid']:
+            done_nothing = False
+            for vid in parameters['Vid']:
+                if vid in vuxml:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Topics']:
+            done_nothing = False
+            for regex_string in parameters['Topics']:
+                vulns = search_vulns_by_regex(
+                    vuxml,
+                    regex_string,
+                    in_topics=True,
+                    in_descriptions=False
+                )
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Keywords']:
+            done_nothing = False
+            for regex_string in parameters['Keywords']:
+                vulns = search_vulns_by_regex(
+                    vuxml,
+                    regex_string,
+                    in_topics=True,
+                    in_descriptions=True
+                )
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Words']:
+            done_nothing = False
+            for words in parameters['Words']:
+                vulns = search_vulns_by_words(vuxml, words, in_topics=True, in_descriptions=True)
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Packages']:
+            done_nothing = False
+            for package in parameters['Packages']:
+                if '~' in package:
+                    name = package.split('~')[0]
+                    version = package.split('~')[1]
+                else:
+                    name = package
+                    version = ''
+                vulns = search_vulns_by_package(
+                    vuxml,
+                    name,
+                    version,
+                    regex_names=parameters['Regex names']
+                )
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['References']:
+            done_nothing = False
+            for reference in parameters['References']:
+                if '~' in reference:
+                    source = reference.split('~')[0]
+                    identifier = reference.split('~')[1]
+                else:
+                    source = ''
+                    identifier = reference
+                vulns = search_vulns_by_reference(vuxml, source, identifier)
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Discovery dates']:
+            done_nothing = False
+            for date in parameters['Discovery dates']:
+                vulns = search_vulns_by_discovery_date(vuxml, date)
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Entry dates']:
+            done_nothing = False
+            for date in parameters['Entry dates']:
+                vulns = search_vulns_by_entry_date(vuxml, date)
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Modified dates']:
+            done_nothing = False
+            for date in parameters['Modified dates']:
+                vulns = search_vulns_by_modified_date(vuxml, date)
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid])
+                    vulns_count += 1
+
+        if parameters['Since'] or parameters['Until']:
+            done_nothing = False
+            for vid in search_vulns(vuxml, _get_changes_query()):
+                renderer.render(vid, vuxml[vid])
                 vulns_count += 1
 
-    if parameters['Discovery dates']:
-        done_nothing = False
-        for date in parameters['Discovery dates']:
-            vulns = search_vulns_by_discovery_date(vuxml, date)
-            for vid in vulns:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
-                vulns_count += 1
+    _write_vulns_count(renderer, vulns_count)
 
-    if parameters['Entry dates']:
+    if parameters['Audit files']:
         done_nothing = False
-        for date in parameters['Entry dates']:
-            vulns = search_vulns_by_entry_date(vuxml, date)
-            for vid in vulns:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
-                vulns_count += 1
+        packages = _read_packages_files()
+        problems_count = 0
+        vulnerable_packages_count = 0
+        for package, vulns in audit_packages(vuxml, packages).items():
+            if vulns:
+                vulnerable_packages_count += 1
+                renderer.write_text(f"{package} is vulnerable:")
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid], package=package)
+                    problems_count += 1
+        renderer.write_text(
+            f"{problems_count} problem(s) in {vulnerable_packages_count} installed package(s) found."
+        )
+        renderer.write_text()
 
-    if parameters['Modified dates']:
+    if parameters['References files']:
         done_nothing = False
-        for date in parameters['Modified dates']:
-            vulns = search_vulns_by_modified_date(vuxml, date)
-            for vid in vulns:
-                print_vuln(vid, vuxml[vid], show_description=parameters['Print description'])
-                vulns_count += 1
+        references = _read_references_files()
+        found_references_count = 0
+        for reference, vulns in resolve_references(vuxml, references).items():
+            if vulns:
+                found_references_count += 1
+                renderer.write_text(f"{reference} is referenced by:")
+                for vid in vulns:
+                    renderer.render(vid, vuxml[vid], reference=reference)
+        renderer.write_text(f"{found_references_count} of {len(references)} reference(s) found.")
+        renderer.write_text()
+
+    if parameters['Changes']:
+        done_nothing = False
+        _print_changes(renderer, get_vuxml_changes(vuxml), vuxml)
 
-    if vulns_count:
-        if vulns_count == 1:
-            print("1 vulnerability found")
-        else:
-            print(f"{vulns_count} vulnerabilities found")
+    if not done_nothing:
+        renderer.close()
 
     if parameters['List references sources']:
         done_nothing = False
-        references = get_vulns_by_references(vuxml)
-        print("References sources:")
-        for source in references:
-            if source == 'bid':
-                print("  bid - SecurityFocus Bug ID")
-            elif source == 'certsa':
-                print("  certsa - US-CERT security advisory")
-            elif source == 'certvu':
-                print("  certvu - US-CERT vulnerability note")
-            elif source == 'cvename':
-                print("  cvename - Mitre CVE identifier")
-            elif source == 'freebsdpr':
-                print("  freebsdpr - FreeBSD problem report")
-            elif source == 'freebsdsa':
-                print("  freebsdsa - FreeBSD security advisory")
-            elif source == 'mlist':
-                print("  mlist - URL to an archived posting in a mailing list")
-            elif source == 'url':
-                print("  url - Generic URL")
-            elif source == 'uscertsa':
-                print("  uscertta - US-CERT cyber security alert")
-            elif source == 'uscertta':
-                print("  uscertta - US-CERT technical cyber security alert")
-            else:
-                print(f"  {source} - ?")
-        print()
+        _print_references_sources(get_vulns_by_references(vuxml))
 
     if done_nothing:
         _display_help()
@@ -360,5 +871,21 @@ def main():
     sys.exit(0)
 
 
+####################################################################################################
+def main():
+    """ The program's main entry point """
+    try:
+        try:
+            _main()
+        finally:
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # The output was closed early, as with "vuxml --ndjson | head": exit quietly,
+        # without Python complaining about the unflushed output
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD ports versions comparison library
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+Versions are compared like pkg(8) does:
+* PORTEPOCH (after the last ',') is compared first,
+* then PORTVERSION, component by component (the parts separated by dots
+  or other punctuation), a missing component being equal to 0,
+* then PORTREVISION (after the last '_').
+
+Each component is a number, a letter and a patch level number, compared in
+the (number, letter, patch level) order (so "1.0a2" < "1.0b1"). The "alpha",
+"beta", "pre" and "rc" strings are treated as their first letter, "pl" as no
+letter at all.
+A component starting with a letter has a -1 number (so "1.0.b1" < "1.0"),
+while a letter following a number makes it greater (so "1.0b1" > "1.0").
+A '*' component is lower than anything else, and '+' separates blocks of
+components which are compared independently.
+"""
+
+import functools
+
+# Size of the parsed versions cache used by compare_versions()
+VERSIONS_CACHE_SIZE = 4096
+
+_SPECIAL_STRINGS = (
+    ("alpha", ord("a") - ord("a") + 1),
+    ("beta", ord("b") - ord("a") + 1),
+    ("pre", ord("p") - ord("a") + 1),
+    ("rc", ord("r") - ord("a") + 1),
+    ("pl", 0),
+)
+
+# Keys of a missing component and of a missing block of components
+_NO_COMPONENT = (0, 0, 0)
+_NO_BLOCK = ((0,),)
+
+
+####################################################################################################
+def _is_digit(character):
+    """ Return True if character is an ASCII digit """
+    return "0" <= character <= "9"
+
+
+####################################################################################################
+def _is_letter(character):
+    """ Return True if character is an ASCII letter """
+    return "a" <= character <= "z" or "A" <= character <= "Z"
+
+
+####################################################################################################
+def _get_number(string, position=0):
+    """ Return the number at a string position and the position following it (0 if none) """
+    end = position
+    while end < len(string) and _is_digit(string[end]):
+        end += 1
+
+    if end == position:
+        return 0, position
+    return int(string[position:end]), end
+
+
+####################################################################################################
+def _get_component(version, position, end):
+    """ Return the (number, letter, patch level) key of the component starting at position,
+    and the position of the next component """
+    number = 0
+    patch_level = 0
+    letter = 0
+
+    # Handle the version number
+    if _is_digit(version[position]):
+        number, position = _get_number(version, position)
+    elif version[position] == "*":
+        while position < end and version[position] != "+":
+            position += 1
+        return (-2, 0, 0), position
+    else:
+        number = -1
+
+    # Handle the letter and the patch level
+    if position < end and _is_letter(version[position]):
+        lower_version = version[position:end].lower()
+        for name, value in _SPECIAL_STRINGS:
+            if lower_version.startswith(name) \
+            and not (len(lower_version) > len(name) and _is_letter(lower_version[len(name)])):
+                letter = value
+                position += len(name)
+                break
+        else:
+            letter = ord(lower_version[0]) - ord("a") + 1
+            position += 1
+
+        patch_level, position = _get_number(version[:end], position)
+
+    # Skip the trailing separators
+    while position < end \
+    and not _is_digit(version[position]) \
+    and not _is_letter(version[position]) \
+    and version[position] not in ("+", "*"):
+        position += 1
+
+    return (number, letter, patch_level), position
+
+
+####################################################################################################
+def _encode(keys, empty_key):
+    """ Return a tuple of keys which compares like keys padded with empty keys would """
+    # Each non empty key is prefixed by its sign compared to an empty key and by the number of
+    # empty keys preceding it, so that a missing key compares like an empty one
+    encoded_keys = []
+    empty_keys = 0
+    for key in keys:
+        if key == empty_key:
+            empty_keys += 1
+            continue
+
+        sign = 1 if key > empty_key else -1
+        encoded_keys.append((sign, -sign * empty_keys, key))
+        empty_keys = 0
+    encoded_keys.append((0,))
+
+    return tuple(encoded_keys)
+
+
+####################################################################################################
+def get_version_key(version):
+    """ Return a comparable key from a FreeBSD port version string """
+    # PORTREVISION is after the last '_'
+    end = len(version)
+    revision = 0
+    underscore = version.rfind("_")
+    if underscore != -1:
+        revision, _ = _get_number(version, underscore + 1)
+        end = underscore
+
+    # PORTEPOCH is after the last ',' (after the PORTREVISION if there's one)
+    epoch = 0
+    comma = version.rfind(",", underscore + 1)
+    if comma != -1:
+        epoch, _ = _get_number(version, comma + 1)
+        if underscore == -1:
+            end = comma
+
+    blocks = []
+    components = []
+    position = 0
+    while position < end:
+        if version[position] == "+":
+            blocks.append(_encode(components, _NO_COMPONENT))
+            components = []
+            position += 1
+        else:
+            component, position = _get_component(version, position, end)
+            components.append(component)
+    blocks.append(_encode(components, _NO_COMPONENT))
+
+    return (epoch, _encode(blocks, _NO_BLOCK), revision)
+
+
+get_cached_version_key = functools.lru_cache(maxsize=VERSIONS_CACHE_SIZE)(get_version_key)
+
+
+####################################################################################################
+def compare_versions(version1, version2):
+    """ Return -1, 0 or 1 if version1 is lower, equal or greater than version2 """
+    key1 = get_cached_version_key(version1)
+    key2 = get_cached_version_key(version2)
+    if key1 < key2:
+        return -1
+    if key1 > key2:
+        return 1
+    return 0
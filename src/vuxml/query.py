@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML query engine
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+Queries are built from criteria combined with the & (And), | (Or) and ~ (Not)
+operators, for example:
+    Package("openssl") & Date("discovery", "2023") & ~Reference("cvename", "")
+
+Criteria results are handled as sets of VID. Within an And, the cheapest
+criteria (VID and indexes lookups) are evaluated first, and the costliest ones
+(regular expressions) are only tried on the vulnerabilities remaining.
+"""
+
+import logging
+import re
+
+from .library import _get_database # pylint: disable=W0212
+from .stats import _phase # pylint: disable=W0212
+
+# Relative costs of the criteria, used to order their evaluation
+_VID_COST = 1
+_INDEX_COST = 10
+_REGEX_NAMES_COST = 20
+_WORDS_COST = 30
+_TOPIC_COST = 100
+_KEYWORD_COST = 1000
+_NOT_COST = 10000
+
+
+####################################################################################################
+class Query:
+    """ Base class of query criteria and combinations """
+    cost = _INDEX_COST
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    ################################################################################################
+    def get_cost(self):
+        """ Return the estimated cost of the query evaluation """
+        return self.cost
+
+    ################################################################################################
+    def evaluate(self, database):
+        """ Return the set of VID matching the query in a VuXMLDatabase """
+        raise NotImplementedError
+
+    ################################################################################################
+    def filter(self, database, candidates):
+        """ Return the subset of a set of VID matching the query in a VuXMLDatabase """
+        return self.evaluate(database) & candidates
+
+
+####################################################################################################
+class Vid(Query):
+    """ Vulnerability ID criterion """
+    cost = _VID_COST
+
+    def __init__(self, vid):
+        self.vid = vid
+
+    def __repr__(self):
+        return f"Vid({self.vid!r})"
+
+    def evaluate(self, database):
+        if self.vid in database:
+            return {self.vid}
+        return set()
+
+
+####################################################################################################
+class Topic(Query):
+    """ Regular expression in topics criterion """
+    cost = _TOPIC_COST
+    in_topics = True
+    in_descriptions = False
+
+    def __init__(self, regex_string):
+        self.regex_string = regex_string
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.regex_string!r})"
+
+    def evaluate(self, database):
+        return set(
+            database.search_vulns_by_regex(self.regex_string, self.in_topics, self.in_descriptions)
+        )
+
+    def filter(self, database, candidates):
+        # The indexed search is only worth it for a large number of candidates
+        if len(candidates) * 2 > len(database):
+            return self.evaluate(database) & candidates
+
+        try:
+            regex = re.compile(self.regex_string)
+        except re.error as error:
+            logging.error("Query argument is not a valid regular expression: %s", error)
+            return set()
+
+        vulns = set()
+        for vid in candidates:
+            vuln_data = database[vid]
+            if self.in_topics and "topic" in vuln_data and regex.search(vuln_data["topic"]):
+                vulns.add(vid)
+            elif self.in_descriptions and "description" in vuln_data \
+            and regex.search(vuln_data["description"]):
+                vulns.add(vid)
+
+        return vulns
+
+
+####################################################################################################
+class Keyword(Topic):
+    """ Regular expression in topics and descriptions criterion """
+    cost = _KEYWORD_COST
+    in_topics = True
+    in_descriptions = True
+
+
+####################################################################################################
+class Words(Query):
+    """ Words in topics and descriptions criterion """
+    cost = _WORDS_COST
+
+    def __init__(self, words):
+        self.words = words
+
+    def __repr__(self):
+        return f"Words({self.words!r})"
+
+    def evaluate(self, database):
+        return set(database.search_vulns_by_words(self.words))
+
+
+####################################################################################################
+class Package(Query):
+    """ Package name, and optional version, in affects criterion """
+
+    def __init__(self, package_name, package_version="", regex_names=False):
+        self.package_name = package_name
+        self.package_version = package_version
+        self.regex_names = regex_names
+
+    def __repr__(self):
+        return f"Package({self.package_name!r}, {self.package_version!r}, {self.regex_names!r})"
+
+    def get_cost(self):
+        if self.regex_names:
+            return _REGEX_NAMES_COST
+        return _INDEX_COST
+
+    def evaluate(self, database):
+        return set(
+            database.search_vulns_by_package(
+                self.package_name,
+                self.package_version,
+                self.regex_names
+            )
+        )
+
+
+####################################################################################################
+class Reference(Query):
+    """ Source and/or identifier in references criterion """
+
+    def __init__(self, source, identifier=""):
+        self.source = source
+        self.identifier = identifier
+
+    def __repr__(self):
+        return f"Reference({self.source!r}, {self.identifier!r})"
+
+    def evaluate(self, database):
+        return set(database.search_vulns_by_reference(self.source, self.identifier))
+
+
+####################################################################################################
+class Date(Query):
+    """ Discovery, entry or modified date criterion """
+
+    def __init__(self, kind, date):
+        self.kind = kind
+        self.date = date
+
+    def __repr__(self):
+        return f"Date({self.kind!r}, {self.date!r})"
+
+    def evaluate(self, database):
+        return set(database.search_vulns_by_date(self.kind, self.date))
+
+
+####################################################################################################
+class DateRange(Query):
+    """ Discovery, entry or modified dates in the [since, until) range criterion """
+
+    def __init__(self, kind, since="", until=""):
+        self.kind = kind
+        self.since = since
+        self.until = until
+
+    def __repr__(self):
+        return f"DateRange({self.kind!r}, {self.since!r}, {self.until!r})"
+
+    def evaluate(self, database):
+        return set(database.search_vulns_by_date_range(self.kind, self.since, self.until))
+
+
+####################################################################################################
+class And(Query):
+    """ Criteria which must all be matched """
+
+    def __init__(self, *queries):
+        self.queries = queries
+
+    def __repr__(self):
+        return f"And{self.queries!r}"
+
+    def get_cost(self):
+        return min([query.get_cost() for query in self.queries], default=0)
+
+    def evaluate(self, database):
+        queries = sorted(self.queries, key=lambda query: query.get_cost())
+        if not queries:
+            return set(database)
+
+        vulns = queries[0].evaluate(database)
+        return self._filter_queries(database, queries[1:], vulns)
+
+    def filter(self, database, candidates):
+        queries = sorted(self.queries, key=lambda query: query.get_cost())
+        return self._filter_queries(database, queries, candidates)
+
+    @staticmethod
+    def _filter_queries(database, queries, candidates):
+        """ Return the subset of a set of VID matching all the queries """
+        for query in queries:
+            if not candidates:
+                break
+            candidates = query.filter(database, candidates)
+
+        return candidates
+
+
+####################################################################################################
+class Or(Query):
+    """ Criteria of which at least one must be matched """
+
+    def __init__(self, *queries):
+        self.queries = queries
+
+    def __repr__(self):
+        return f"Or{self.queries!r}"
+
+    def get_cost(self):
+        return sum(query.get_cost() for query in self.queries)
+
+    def evaluate(self, database):
+        vulns = set()
+        for query in self.queries:
+            vulns |= query.evaluate(database)
+
+        return vulns
+
+    def filter(self, database, candidates):
+        # Candidates already matched don't need to be checked by the other criteria
+        vulns = set()
+        for query in sorted(self.queries, key=lambda query: query.get_cost()):
+            if not candidates:
+                break
+            matched = query.filter(database, candidates)
+            vulns |= matched
+            candidates = candidates - matched
+
+        return vulns
+
+
+####################################################################################################
+class Not(Query):
+    """ Criterion which must not be matched """
+
+    def __init__(self, query):
+        self.query = query
+
+    def __repr__(self):
+        return f"Not({self.query!r})"
+
+    def get_cost(self):
+        return self.query.get_cost() + _NOT_COST
+
+    def evaluate(self, database):
+        return set(database) - self.query.evaluate(database)
+
+    def filter(self, database, candidates):
+        return candidates - self.query.filter(database, candidates)
+
+
+####################################################################################################
+def get_criteria_queries(
+    vids=(),
+    topics=(),
+    keywords=(),
+    words=(),
+    packages=(),
+    regex_names=False,
+    references=(),
+    discovery_dates=(),
+    entry_dates=(),
+    modified_dates=(),
+    since="",
+    until=""
+):
+    """ Return a list of queries from command line like criteria, with packages as name~version
+    and references as source~identifier strings """
+    queries = []
+    queries += [Vid(vid) for vid in vids]
+    queries += [Topic(regex_string) for regex_string in topics]
+    queries += [Keyword(regex_string) for regex_string in keywords]
+    queries += [Words(words_string) for words_string in words]
+    for package in packages:
+        if '~' in package:
+            name = package.split('~')[0]
+            version = package.split('~')[1]
+        else:
+            name = package
+            version = ''
+        queries.append(Package(name, version, regex_names=regex_names))
+    for reference in references:
+        if '~' in reference:
+            source = reference.split('~')[0]
+            identifier = reference.split('~')[1]
+        else:
+            source = ''
+            identifier = reference
+        queries.append(Reference(source, identifier))
+    queries += [Date("discovery", date) for date in discovery_dates]
+    queries += [Date("entry", date) for date in entry_dates]
+    queries += [Date("modified", date) for date in modified_dates]
+    if since or until:
+        queries.append(Or(DateRange("entry", since, until), DateRange("modified", since, until)))
+
+    return queries
+
+
+####################################################################################################
+def search_vulns(vuxml, query):
+    """ Return a list of VID matching a query, in the VuXML data structure order """
+    if not vuxml:
+        return []
+
+    with _phase("search"):
+        database = _get_database(vuxml)
+        vulns = query.evaluate(database)
+
+        return [vid for vid in database if vid in vulns]
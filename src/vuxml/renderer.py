@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML vulnerabilities renderer
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+"""
+
+import json
+import sys
+
+from .stats import _phase # pylint: disable=W0212
+
+# Output formats supported by VulnRenderer
+OUTPUT_FORMATS = ("text", "json", "ndjson")
+
+_colorama_initialized = False # pylint: disable=C0103
+
+
+####################################################################################################
+def _initialize_colorama():
+    """ Initialize colorama, once """
+    global _colorama_initialized # pylint: disable=C0103, W0603
+    import colorama # pylint: disable=C0415
+
+    if not _colorama_initialized:
+        colorama.init()
+        _colorama_initialized = True
+
+
+####################################################################################################
+class VulnRenderer:
+    """ A vulnerabilities printer, writing text, JSON or NDJSON to a stream one at a time """
+
+    def __init__(self, stream=None, output_format="text", show_description=False, colors=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_format = output_format
+        self.show_description = show_description
+
+        # Colors are only used on terminals, like colorama does when it strips them
+        if stream is None:
+            stream = sys.stdout
+        if colors is None:
+            colors = output_format == "text" and hasattr(stream, "isatty") and stream.isatty()
+        if colors:
+            # colorama and html2text are only imported when used, for a faster startup
+            import colorama # pylint: disable=C0415
+
+            if stream is sys.stdout:
+                _initialize_colorama()
+                stream = sys.stdout
+            self._bright = colorama.Style.BRIGHT
+            self._red = colorama.Fore.RED
+            self._red_bg = colorama.Back.RED
+            self._normal = colorama.Style.RESET_ALL
+        else:
+            self._bright = self._red = self._red_bg = self._normal = ""
+        self.stream = stream
+
+        self._text_maker = None
+        self._vulns_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    ################################################################################################
+    def _get_description_text(self, description):
+        """ Return a text rendering of an HTML description """
+        if self._text_maker is None:
+            import html2text # pylint: disable=C0415
+
+            self._text_maker = html2text.HTML2Text()
+            self._text_maker.ignore_links = True
+            self._text_maker.bypass_tables = False
+
+        return self._text_maker.handle(description)
+
+    ################################################################################################
+    def _get_text(self, vid, vuln):
+        """ Return the text rendering of a vulnerability """
+        bright = self._bright
+        red = self._red
+        red_bg = self._red_bg
+        normal = self._normal
+
+        lines = [f"{bright}Vulnerability ID:{normal} {vid}"]
+        if "topic" in vuln:
+            lines.append(f"  {bright}Topic:{normal} {red_bg}{vuln['topic']}{normal}")
+        if "affects" in vuln:
+            lines.append(f"  {bright}Affects:{normal}")
+            for package_name, package_version_ranges in vuln["affects"].items():
+                lines.append(f"    {bright}{red}{package_name}{normal}:")
+                for package_version_range in package_version_ranges:
+                    conditions = "".join(
+                        f"{condition[0]} {condition[1]} ; " for condition in package_version_range
+                    )
+                    lines.append(f"      {conditions}")
+        if self.show_description and "description" in vuln:
+            lines.append(f"  {bright}Description:{normal}")
+            text = self._get_description_text(vuln["description"])
+            for line in text.split('\n'):
+                if line:
+                    lines.append(f"    {line}")
+                else:
+                    lines.append("")
+        if "references" in vuln:
+            if len(vuln["references"]):
+                lines.append(f"  {bright}References:{normal}")
+                for reference in vuln["references"]:
+                    for key, value in reference.items():
+                        lines.append(f"    {key}: {value}")
+        if "dates" in vuln:
+            if "discovery" in vuln["dates"]:
+                lines.append(f"  {bright}Discovery date:{normal} {vuln['dates']['discovery']}")
+            if "entry" in vuln["dates"]:
+                lines.append(f"  {bright}Entry date:{normal} {vuln['dates']['entry']}")
+            if "modified" in vuln["dates"]:
+                lines.append(f"  {bright}Modified date:{normal} {vuln['dates']['modified']}")
+        lines.append("")
+
+        return "\n".join(lines) + "\n"
+
+    ################################################################################################
+    def _get_record(self, vid, vuln, extra_fields):
+        """ Return a JSON serializable dictionary from a vulnerability """
+        record = {"vid": vid}
+        record.update(extra_fields)
+        # Known keys are tested one by one, to avoid reading descriptions which are not shown
+        for key in ("topic", "affects", "description", "references", "dates"):
+            if key in vuln and (key != "description" or self.show_description):
+                record[key] = vuln[key]
+
+        return record
+
+    ################################################################################################
+    def render(self, vid, vuln, **extra_fields):
+        """ Write a vulnerability, with optional extra fields (such as the package or reference
+        it was found for) in JSON and NDJSON formats """
+        with _phase("rendering"):
+            if self.output_format == "text":
+                self.stream.write(self._get_text(vid, vuln))
+            else:
+                record = json.dumps(self._get_record(vid, vuln, extra_fields))
+                if self.output_format == "ndjson":
+                    self.stream.write(record + "\n")
+                elif self._vulns_count:
+                    self.stream.write(",\n" + record)
+                else:
+                    self.stream.write("[\n" + record)
+        self._vulns_count += 1
+
+    ################################################################################################
+    def write_text(self, text=""):
+        """ Write a line of text, in text format only """
+        if self.output_format == "text":
+            self.stream.write(text + "\n")
+
+    ################################################################################################
+    def close(self):
+        """ Terminate the output and flush the stream """
+        if self.output_format == "json":
+            if self._vulns_count:
+                self.stream.write("\n]\n")
+            else:
+                self.stream.write("[]\n")
+            self._vulns_count = 0
+        self.stream.flush()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML query server and client
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+The server loads the VuXML database once, builds all its indexes, and answers
+HTTP requests on a UNIX-domain socket, or on a localhost TCP port when its
+address is a port number (or when UNIX-domain sockets are not available):
+    GET /search?package=openssl~3.0.1&since=2024&combination=all&desc
+    POST /audit, with a "name version" or "name-version" packages list body
+    POST /references, with a references list body
+    GET /sources
+    GET /changes
+    GET /status
+
+Search parameters are named after the command line long options (id, topic,
+keyword, word, package, re-names, ref, discovery, entry, modified, since and
+until) and can be repeated. The combination parameter can be "all" or "any";
+without it, the results of each search are concatenated, like the command
+line does. The desc parameter adds descriptions to the vulnerabilities,
+which are returned as NDJSON records, while errors are returned as a JSON
+{"error": message} object.
+
+The cached VuXML file is checked for updates every check_interval seconds.
+When it changed, a new database is loaded and indexed before replacing the
+current one, so that requests are always answered from a complete database.
+"""
+
+import functools
+import io
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+
+import libpnu
+
+from .library import CACHE_MAX_AGE, parse_packages_list, parse_references_list, audit_packages, \
+                     resolve_references, get_vulns_by_references, get_vuxml_changes, \
+                     is_valid_date
+from .query import And, Or, get_criteria_queries, search_vulns
+from .renderer import VulnRenderer
+from .shared import SharedVuXML
+
+# TCP port used when UNIX-domain sockets are not available
+DEFAULT_PORT = 8742
+
+# Number of seconds between the checks for VuXML database updates
+CHECK_INTERVAL = 60
+
+# Number of seconds a client waits for the server
+CLIENT_TIMEOUT = 60
+
+_SEARCH_PARAMETERS = (
+    "id", "topic", "keyword", "word", "package", "ref", "discovery", "entry", "modified", "since",
+    "until"
+)
+_FLAG_PARAMETERS = ("re-names", "desc")
+
+
+####################################################################################################
+def get_default_address():
+    """ Return the default server address: a UNIX-domain socket path, or a TCP port number """
+    if not hasattr(socket, "AF_UNIX"):
+        return str(DEFAULT_PORT)
+
+    directory = libpnu.get_caching_directory("vuxml")
+    if directory:
+        return directory + os.sep + "vuxml.sock"
+    return "vuxml.sock"
+
+
+####################################################################################################
+def _is_port(address):
+    """ Return True if a server address is a TCP port number """
+    return address.isdigit()
+
+
+####################################################################################################
+def _get_flag(arguments, name):
+    """ Return the value of a flag parameter, which is True if present without a false value """
+    if name not in arguments:
+        return False
+    return arguments[name][-1].lower() not in ("0", "false", "no")
+
+
+####################################################################################################
+def _get_search_queries(arguments):
+    """ Return a list of queries from search parameters, raising ValueError on invalid ones """
+    for name, values in arguments.items():
+        if name not in _SEARCH_PARAMETERS + _FLAG_PARAMETERS + ("combination",):
+            raise ValueError(f"Unknown parameter: {name}")
+        for value in values:
+            if name == "id":
+                try:
+                    _ = uuid.UUID(value)
+                except ValueError:
+                    raise ValueError("id parameter is not a valid UUID") from None
+            elif name in ("topic", "keyword"):
+                try:
+                    _ = re.compile(value)
+                except re.error as error:
+                    raise ValueError(
+                        f"{name} parameter is not a valid regular expression: {error}"
+                    ) from None
+            elif name == "word" and not re.search(r"\w", value):
+                raise ValueError("word parameter contains no word")
+            elif name in ("package", "ref") and len(value.split('~')) > 2:
+                raise ValueError(f"{name} parameter can contain only one '~' character")
+            elif name in ("discovery", "entry", "modified", "since", "until") \
+            and not is_valid_date(value):
+                raise ValueError(f"{name} parameter is not a valid date")
+
+    return get_criteria_queries(
+        vids=[str(uuid.UUID(vid)) for vid in arguments.get("id", [])],
+        topics=arguments.get("topic", []),
+        keywords=arguments.get("keyword", []),
+        words=arguments.get("word", []),
+        packages=arguments.get("package", []),
+        regex_names=_get_flag(arguments, "re-names"),
+        references=arguments.get("ref", []),
+        discovery_dates=arguments.get("discovery", []),
+        entry_dates=arguments.get("entry", []),
+        modified_dates=arguments.get("modified", []),
+        since=arguments.get("since", [""])[-1],
+        until=arguments.get("until", [""])[-1]
+    )
+
+
+####################################################################################################
+def _check_updates(holder, check_interval, stop_event):
+    """ Reload the served database when the cached VuXML file changes, until stop_event is set """
+    while not stop_event.wait(check_interval):
+        try:
+            if holder.reload():
+                logging.info("VuXML database reloaded from '%s'", holder.filename)
+        except Exception as error: # pylint: disable=W0703
+            # Keep serving the current database
+            logging.error("Error while reloading the VuXML database: %s", error)
+
+
+####################################################################################################
+class _RequestHandlerMixin:
+    """ HTTP requests handler methods of the query server, mixed in a http.server request handler
+    by _get_server_classes() """
+    server_version = "vuxml"
+
+    def address_string(self):
+        # UNIX-domain sockets clients have no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return "local"
+
+    def log_message(self, format, *args): # pylint: disable=W0622
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+    ################################################################################################
+    def _send_json(self, code, data):
+        """ Send a JSON response """
+        body = (json.dumps(data) + "\n").encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    ################################################################################################
+    def _send_vulns(self, database, vulns, show_description):
+        """ Send a NDJSON response from a list of (VID, extra fields) """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        stream = io.TextIOWrapper(self.wfile, encoding="utf-8")
+        renderer = VulnRenderer(stream, output_format="ndjson", show_description=show_description)
+        try:
+            for vid, extra_fields in vulns:
+                renderer.render(vid, database[vid], **extra_fields)
+            renderer.close()
+        except ConnectionError:
+            logging.debug("%s - Client disconnected", self.address_string())
+            return
+        stream.detach()
+
+    ################################################################################################
+    def _search(self, database, arguments):
+        """ Answer a search request """
+        try:
+            queries = _get_search_queries(arguments)
+        except ValueError as error:
+            self._send_json(400, {"error": str(error)})
+            return
+
+        combination = arguments.get("combination", [""])[-1]
+        if combination == "all":
+            vulns = search_vulns(database, And(*queries)) if queries else []
+        elif combination == "any":
+            vulns = search_vulns(database, Or(*queries))
+        elif not combination:
+            vulns = []
+            for query in queries:
+                vulns += search_vulns(database, query)
+        else:
+            self._send_json(400, {"error": "combination parameter is not all or any"})
+            return
+
+        self._send_vulns(database, [(vid, {}) for vid in vulns], _get_flag(arguments, "desc"))
+
+    ################################################################################################
+    def do_GET(self): # pylint: disable=C0103
+        """ Answer GET requests """
+        url = urllib.parse.urlsplit(self.path)
+        arguments = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        database = self.server.holder.database
+
+        if url.path == "/search":
+            self._search(database, arguments)
+        elif url.path == "/sources":
+            self._send_json(200, list(get_vulns_by_references(database)))
+        elif url.path == "/changes":
+            self._send_json(200, get_vuxml_changes(database))
+        elif url.path == "/status":
+            self._send_json(
+                200,
+                {
+                    "filename": self.server.holder.filename,
+                    "loaded": time.strftime(
+                        "%Y-%m-%dT%H:%M:%S", time.localtime(self.server.holder.loaded)
+                    ),
+                    "vulnerabilities": len(database),
+                }
+            )
+        else:
+            self._send_json(404, {"error": f"Unknown path: {url.path}"})
+
+    ################################################################################################
+    def do_POST(self): # pylint: disable=C0103
+        """ Answer POST requests """
+        url = urllib.parse.urlsplit(self.path)
+        arguments = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        database = self.server.holder.database
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            length = 0
+        lines = self.rfile.read(length).decode("utf-8", errors="ignore").splitlines()
+
+        if url.path == "/audit":
+            results = audit_packages(database, parse_packages_list(lines))
+            field = "package"
+        elif url.path == "/references":
+            results = resolve_references(database, parse_references_list(lines))
+            field = "reference"
+        else:
+            self._send_json(404, {"error": f"Unknown path: {url.path}"})
+            return
+
+        vulns = [(vid, {field: key}) for key, vids in results.items() for vid in vids]
+        self._send_vulns(database, vulns, _get_flag(arguments, "desc"))
+
+
+####################################################################################################
+@functools.lru_cache(maxsize=None)
+def _get_server_classes():
+    """ Return the request handler, TCP server and UNIX-domain socket server (or None) classes,
+    defined on first use so that the HTTP modules are only imported by servers """
+    import http.server # pylint: disable=C0415
+    import socketserver # pylint: disable=C0415
+
+    class _RequestHandler(_RequestHandlerMixin, http.server.BaseHTTPRequestHandler):
+        """ HTTP requests handler of the query server """
+
+    class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+        """ A TCP server handling each request in a thread """
+        allow_reuse_address = True
+        daemon_threads = True
+
+    unix_server_class = None
+    if hasattr(socket, "AF_UNIX"):
+        class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            """ A UNIX-domain socket server handling each request in a thread """
+            daemon_threads = True
+
+        unix_server_class = _UnixServer
+
+    return _RequestHandler, _TCPServer, unix_server_class
+
+
+####################################################################################################
+def _create_server(address):
+    """ Return a server listening on address, or None """
+    request_handler_class, tcp_server_class, unix_server_class = _get_server_classes()
+    if _is_port(address):
+        try:
+            return tcp_server_class(("127.0.0.1", int(address)), request_handler_class)
+        except OSError as error:
+            logging.error("Cannot listen on port %s: %s", address, error)
+            return None
+
+    if unix_server_class is None:
+        logging.error("UNIX-domain sockets are not available: use a TCP port number")
+        return None
+
+    # Remove the socket left by a server which didn't terminate properly
+    if os.path.exists(address):
+        if VuXMLClient(address, timeout=1).get_status(log_errors=False) is not None:
+            logging.error("A VuXML server is already listening on '%s'", address)
+            return None
+        try:
+            os.remove(address)
+        except OSError as error:
+            logging.error("Cannot remove the '%s' socket: %s", address, error)
+            return None
+
+    # The socket is only accessible to its owner
+    umask = os.umask(0o177)
+    try:
+        return unix_server_class(address, request_handler_class)
+    except OSError as error:
+        logging.error("Cannot listen on '%s': %s", address, error)
+        return None
+    finally:
+        os.umask(umask)
+
+
+####################################################################################################
+def serve(
+    address="",
+    max_age=CACHE_MAX_AGE,
+    offline=False,
+    check_interval=CHECK_INTERVAL,
+    jobs=1
+):
+    """ Answer queries on a UNIX-domain socket path or TCP port number, until interrupted """
+    if not address:
+        address = get_default_address()
+
+    holder = SharedVuXML(max_age, offline, check_interval, jobs)
+    holder.reload()
+    if not holder.database:
+        logging.error("No VuXML database to serve")
+        return
+
+    server = _create_server(address)
+    if server is None:
+        return
+    server.holder = holder
+
+    stop_event = threading.Event()
+    checker = threading.Thread(
+        target=_check_updates,
+        args=(holder, check_interval, stop_event),
+        daemon=True
+    )
+    checker.start()
+    logging.info("Serving %d vulnerabilities on '%s'", len(holder.database), address)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        server.server_close()
+        if not _is_port(address):
+            try:
+                os.remove(address)
+            except OSError:
+                pass
+
+
+####################################################################################################
+@functools.lru_cache(maxsize=None)
+def _get_unix_connection_class():
+    """ Return the class of HTTP connections over a UNIX-domain socket, defined on first use """
+    import http.client # pylint: disable=C0415
+
+    class _UnixHTTPConnection(http.client.HTTPConnection):
+        """ An HTTP connection over a UNIX-domain socket """
+
+        def __init__(self, path, timeout=CLIENT_TIMEOUT):
+            super().__init__("localhost", timeout=timeout)
+            self.path = path
+
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(self.path)
+
+    return _UnixHTTPConnection
+
+
+####################################################################################################
+class VuXMLClient:
+    """ A client of the query server, whose methods return None on errors """
+
+    def __init__(self, address="", timeout=CLIENT_TIMEOUT):
+        if not address:
+            address = get_default_address()
+        self.address = address
+        self.timeout = timeout
+
+    ################################################################################################
+    def _request(self, method, path, body=None, log_errors=True):
+        """ Return the response body of a server request, or None """
+        import http.client # pylint: disable=C0415
+
+        if _is_port(self.address):
+            connection = http.client.HTTPConnection(
+                "127.0.0.1",
+                int(self.address),
+                timeout=self.timeout
+            )
+        elif not hasattr(socket, "AF_UNIX"):
+            if log_errors:
+                logging.error("UNIX-domain sockets are not available: use a TCP port number")
+            return None
+        else:
+            connection = _get_unix_connection_class()(self.address, timeout=self.timeout)
+
+        try:
+            if body is None:
+                connection.request(method, path)
+            else:
+                connection.request(
+                    method,
+                    path,
+                    body=body.encode("utf-8"),
+                    headers={"Content-Type": "text/plain; charset=utf-8"}
+                )
+            response = connection.getresponse()
+            data = response.read().decode("utf-8")
+        except (OSError, http.client.HTTPException) as error:
+            if log_errors:
+                logging.error("Cannot query the VuXML server at '%s': %s", self.address, error)
+            return None
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            if log_errors:
+                try:
+                    message = json.loads(data)["error"]
+                except (ValueError, KeyError, TypeError):
+                    message = response.reason
+                logging.error("VuXML server error: %s", message)
+            return None
+
+        return data
+
+    ################################################################################################
+    def _request_vulns(self, method, path, body=None):
+        """ Return the list of vulnerabilities records of a server request, or None """
+        data = self._request(method, path, body)
+        if data is None:
+            return None
+
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    ################################################################################################
+    def search(self, criteria, combination="", show_description=False):
+        """ Return a list of vulnerabilities records from a dictionary of lists of values by search
+        parameters, concatenated or combined with "all" or "any" """
+        arguments = []
+        for name, values in criteria.items():
+            if name in _FLAG_PARAMETERS:
+                if values:
+                    arguments.append((name, "1"))
+            else:
+                arguments += [(name, value) for value in values]
+        if combination:
+            arguments.append(("combination", combination))
+        if show_description:
+            arguments.append(("desc", "1"))
+
+        return self._request_vulns("GET", "/search?" + urllib.parse.urlencode(arguments))
+
+    ################################################################################################
+    def audit_packages(self, packages, show_description=False):
+        """ Return a list of vulnerabilities records, with a "package" field, from a list of
+        (name, version) """
+        body = "".join(f"{name}~{version}\n" for name, version in packages)
+        path = "/audit?desc=1" if show_description else "/audit"
+
+        return self._request_vulns("POST", path, body)
+
+    ################################################################################################
+    def resolve_references(self, references, show_description=False):
+        """ Return a list of vulnerabilities records, with a "reference" field, from a list of
+        identifiers or source~identifier """
+        body = "".join(f"{reference}\n" for reference in references)
+        path = "/references?desc=1" if show_description else "/references"
+
+        return self._request_vulns("POST", path, body)
+
+    ################################################################################################
+    def get_sources(self):
+        """ Return the list of references sources """
+        data = self._request("GET", "/sources")
+        if data is None:
+            return None
+
+        return json.loads(data)
+
+    ################################################################################################
+    def get_changes(self):
+        """ Return a dictionary of the VID lists "added", "modified" and "removed" by the last
+        update of the served database """
+        data = self._request("GET", "/changes")
+        if data is None:
+            return None
+
+        return json.loads(data)
+
+    ################################################################################################
+    def get_status(self, log_errors=True):
+        """ Return a dictionary describing the served database """
+        data = self._request("GET", "/status", log_errors=log_errors)
+        if data is None:
+            return None
+
+        return json.loads(data)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML database shared by threads
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+A SharedVuXML object loads the VuXML database once, with all its indexes,
+for all the threads of a process. When it was checked more than ttl seconds
+ago, a background thread checks if the cached VuXML file changed and, if it
+did, loads and indexes a new database before replacing the current one.
+Readers thus never wait for a reload, nor see an incomplete database, and
+keep using the database they got until they ask for it again:
+    vuxml = get_shared_vuxml()
+    vulns = audit_packages(vuxml, packages)
+"""
+
+import logging
+import os
+import threading
+import time
+
+from .library import CACHE_MAX_AGE, _download_vuxml, load_vuxml # pylint: disable=W0212
+
+# Number of seconds after which the shared databases are checked for updates
+SHARED_TTL = 60
+
+# Shared databases, by loading parameters
+_shared_databases = {}
+_shared_databases_lock = threading.Lock()
+
+
+####################################################################################################
+class SharedVuXML:
+    """ A VuXML database shared by threads, replaced by a new one when the cached VuXML file
+    changes """
+
+    def __init__(self, max_age=CACHE_MAX_AGE, offline=False, ttl=SHARED_TTL, jobs=1):
+        self.max_age = max_age
+        self.offline = offline
+        self.ttl = ttl
+        self.jobs = jobs
+        self.database = {}
+        self.filename = ""
+        self.loaded = 0
+        self._file_state = None
+        self._checked = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    ################################################################################################
+    def _load_if_changed(self):
+        """ Load the database again if the cached VuXML file changed. Return True if it did """
+        filename = _download_vuxml(max_age=self.max_age, offline=self.offline)
+        if not filename:
+            return False
+
+        try:
+            stat = os.stat(filename)
+        except OSError as error:
+            logging.error("Cannot access the VuXML database: %s", error)
+            return False
+        file_state = (filename, stat.st_size, stat.st_mtime_ns)
+        if file_state == self._file_state:
+            return False
+
+        database = load_vuxml(
+            filename=filename,
+            lazy_descriptions=True,
+            compact=True,
+            jobs=self.jobs
+        )
+        database.build_indexes()
+
+        # Readers keep using the database they got
+        self.database = database
+        self.filename = filename
+        self.loaded = time.time()
+        self._file_state = file_state
+
+        return True
+
+    ################################################################################################
+    def reload(self):
+        """ Load the database again if the cached VuXML file changed. Return True if it did """
+        with self._lock:
+            try:
+                return self._load_if_changed()
+            finally:
+                # Until then, the threads getting the database for the first time wait for it
+                self._checked = time.monotonic()
+
+    ################################################################################################
+    def _refresh(self):
+        """ Reload the database, keeping the current one on errors """
+        try:
+            if self.reload():
+                logging.debug("VuXML database reloaded from '%s'", self.filename)
+        except Exception as error: # pylint: disable=W0703
+            logging.error("Error while reloading the VuXML database: %s", error)
+        finally:
+            self._refresh_lock.release()
+
+    ################################################################################################
+    def get_database(self):
+        """ Return the current database, loading it on the first call,
+        and reloading it in the background if it was checked more than ttl seconds ago """
+        if self._checked is None:
+            self.reload()
+        elif time.monotonic() - self._checked >= self.ttl \
+        and self._refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh, daemon=True).start()
+
+        return self.database
+
+
+####################################################################################################
+def get_shared_vuxml(max_age=CACHE_MAX_AGE, offline=False, ttl=SHARED_TTL, jobs=1):
+    """ Return the current VuXMLDatabase shared by the threads of the process for these
+    parameters, loading it on the first call """
+    with _shared_databases_lock:
+        key = (max_age, offline, ttl, jobs)
+        if key not in _shared_databases:
+            _shared_databases[key] = SharedVuXML(max_age, offline, ttl, jobs)
+        shared = _shared_databases[key]
+
+    return shared.get_database()
@@ -0,0 +1,690 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML SQLite storage
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+The parsed database can be saved in a SQLite file, whose tables are:
+    vulns(id, vid, topic, description), the id being the VuXML data order
+    affects(id, vuln, name), with an index on the package name
+    ranges(affect, range_number, operator, version)
+    refs(vuln, source, identifier), with indexes on the source and identifier
+    dates(vuln, discovery, entry, modified), with an index on each date
+    words(word, field, vuln), the words of topics, descriptions text and markup
+    metadata(name, value), the schema version and the source VuXML file key
+
+A SQLiteDatabase opens this file read-only, and answers the searches of a
+VuXMLDatabase with indexed SQL queries, so that only the needed rows are read.
+The file is replaced as a whole when the source VuXML file changes, and can be
+queried concurrently by other programs.
+"""
+
+import collections.abc
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+
+# urllib.request's pathname2url() function, without importing the HTTP modules it also uses
+if os.name == "nt":
+    from nturl2path import pathname2url
+else:
+    from urllib.parse import quote as pathname2url
+
+from .library import CACHE_MAX_AGE, _download_vuxml, _get_file_key, _get_temporary_filename, \
+                     _read_index_cache, _get_required_literals, _get_version_interval, \
+                     _add_vuln_words, _WORD_REGEX, load_vuxml, is_valid_date # pylint: disable=W0212
+from .pkgversion import get_cached_version_key
+
+# Version of the tables schema
+SCHEMA_VERSION = 1
+
+_DATE_KINDS = ("discovery", "entry", "modified")
+
+_SCHEMA = """
+CREATE TABLE metadata (name TEXT PRIMARY KEY, value);
+CREATE TABLE vulns (id INTEGER PRIMARY KEY, vid TEXT NOT NULL UNIQUE, topic TEXT, description TEXT);
+CREATE TABLE affects (id INTEGER PRIMARY KEY, vuln INTEGER NOT NULL, name TEXT NOT NULL);
+CREATE TABLE ranges (affect INTEGER NOT NULL, range_number INTEGER NOT NULL, operator TEXT, version TEXT);
+CREATE TABLE refs (vuln INTEGER NOT NULL, source TEXT NOT NULL, identifier TEXT NOT NULL);
+CREATE TABLE dates (vuln INTEGER PRIMARY KEY, discovery TEXT, entry TEXT, modified TEXT);
+CREATE TABLE words (
+    word TEXT NOT NULL, field TEXT NOT NULL, vuln INTEGER NOT NULL, PRIMARY KEY (word, field, vuln)
+) WITHOUT ROWID;
+CREATE INDEX affects_vuln ON affects (vuln);
+CREATE INDEX affects_name ON affects (name);
+CREATE INDEX ranges_affect ON ranges (affect);
+CREATE INDEX refs_vuln ON refs (vuln);
+CREATE INDEX refs_source ON refs (source);
+CREATE INDEX refs_identifier ON refs (identifier);
+CREATE INDEX dates_discovery ON dates (discovery);
+CREATE INDEX dates_entry ON dates (entry);
+CREATE INDEX dates_modified ON dates (modified);
+"""
+
+
+####################################################################################################
+@functools.lru_cache(maxsize=None)
+def _get_sqlite3():
+    """ Return Python's sqlite3 module, only imported when used for a faster startup,
+    or None if it's not available """
+    try:
+        import sqlite3 # pylint: disable=C0415
+    except ImportError: # Python's sqlite3 module is packaged apart on some systems
+        return None
+
+    return sqlite3
+
+
+####################################################################################################
+def save_vuxml_sqlite(vuxml, sqlite_filename, key=None):
+    """ Save a VuXML data structure in a SQLite file, with the (size, mtime, hash) key of the
+    VuXML file it comes from. Return False if it couldn't be saved """
+    sqlite3 = _get_sqlite3()
+    if sqlite3 is None:
+        logging.error("SQLite storage needs Python's sqlite3 module")
+        return False
+
+    temporary_filename = _get_temporary_filename(sqlite_filename)
+    try:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        connection = sqlite3.connect(temporary_filename)
+        try:
+            connection.executescript(_SCHEMA)
+            _insert_vuxml(connection, vuxml, key)
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(temporary_filename, sqlite_filename)
+    except (OSError, sqlite3.Error) as error:
+        logging.error("Unable to write SQLite file '%s': %s", sqlite_filename, error)
+        try:
+            os.remove(temporary_filename)
+        except OSError:
+            pass
+        return False
+
+    return True
+
+
+####################################################################################################
+def _insert_vuxml(connection, vuxml, key):
+    """ Insert a VuXML data structure in the tables of a SQLite connection """
+    metadata = [("version", SCHEMA_VERSION)]
+    if key is not None:
+        metadata += [("size", key[0]), ("mtime", key[1]), ("hash", key[2])]
+    connection.executemany("INSERT INTO metadata VALUES (?, ?)", metadata)
+
+    words = {"topic": {}, "description": {}, "markup": {}}
+    affect_id = 0
+    for vuln_id, (vuln_vid, vuln_data) in enumerate(vuxml.items(), start=1):
+        connection.execute(
+            "INSERT INTO vulns VALUES (?, ?, ?, ?)",
+            (vuln_id, vuln_vid, vuln_data.get("topic"), vuln_data.get("description"))
+        )
+
+        for package_name, version_ranges in vuln_data.get("affects", {}).items():
+            affect_id += 1
+            connection.execute(
+                "INSERT INTO affects VALUES (?, ?, ?)", (affect_id, vuln_id, package_name)
+            )
+            ranges = []
+            for range_number, version_range in enumerate(version_ranges):
+                if version_range:
+                    ranges += [
+                        (affect_id, range_number, operator, version)
+                        for operator, version in version_range
+                    ]
+                else:
+                    # A range without conditions matches all versions
+                    ranges.append((affect_id, range_number, None, None))
+            connection.executemany("INSERT INTO ranges VALUES (?, ?, ?, ?)", ranges)
+
+        connection.executemany(
+            "INSERT INTO refs VALUES (?, ?, ?)",
+            [
+                (vuln_id, source, identifier)
+                for reference in vuln_data.get("references", [])
+                for source, identifier in reference.items()
+            ]
+        )
+
+        dates = vuln_data.get("dates", {})
+        connection.execute(
+            "INSERT INTO dates VALUES (?, ?, ?, ?)",
+            (vuln_id,) + tuple(dates.get(kind) for kind in _DATE_KINDS)
+        )
+
+        _add_vuln_words(words, vuln_id, vuln_data)
+
+    for field, field_words in words.items():
+        connection.executemany(
+            "INSERT INTO words VALUES (?, ?, ?)",
+            [
+                (word, field, vuln_id)
+                for word, vuln_ids in field_words.items()
+                for vuln_id in vuln_ids
+            ]
+        )
+
+
+####################################################################################################
+def _regexp(regex_string, value):
+    """ Implement the SQL REGEXP operator """
+    if value is None:
+        return False
+    return re.search(regex_string, value) is not None
+
+
+####################################################################################################
+def _is_in_interval(key, interval):
+    """ Return True if a version key is in a (lower key, lower included, upper key,
+    upper included) interval """
+    lower_key, lower_included, upper_key, upper_included = interval
+    if lower_key is not None:
+        if key < lower_key or (key == lower_key and not lower_included):
+            return False
+    if upper_key is not None:
+        if key > upper_key or (key == upper_key and not upper_included):
+            return False
+
+    return True
+
+
+####################################################################################################
+class SQLiteDatabase(collections.abc.Mapping):
+    """ A read-only VuXML data structure stored in a SQLite file, with the search methods of
+    a VuXMLDatabase, which can be used by several threads """
+
+    def __init__(self, sqlite_filename):
+        uri = "file:" + pathname2url(os.path.abspath(sqlite_filename)) + "?mode=ro"
+        self.filename = sqlite_filename
+        # The connection is shared by the threads, one query at a time
+        self._connection = _get_sqlite3().connect(uri, uri=True, check_same_thread=False)
+        self._connection.create_function("REGEXP", 2, _regexp)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def __getitem__(self, vid):
+        row = self._execute_one(
+            "SELECT id, topic, description FROM vulns WHERE vid = ?", (vid,)
+        )
+        if row is None:
+            raise KeyError(vid)
+        vuln_id, topic, description = row
+
+        vuln_data = {}
+        if topic is not None:
+            vuln_data["topic"] = topic
+        vuln_data["affects"] = self._get_affects(vuln_id)
+        if description is not None:
+            vuln_data["description"] = description
+        vuln_data["references"] = [
+            {source: identifier}
+            for source, identifier in self._execute(
+                "SELECT source, identifier FROM refs WHERE vuln = ? ORDER BY rowid", (vuln_id,)
+            )
+        ]
+        vuln_data["dates"] = {}
+        row = self._execute_one(
+            "SELECT discovery, entry, modified FROM dates WHERE vuln = ?", (vuln_id,)
+        )
+        if row is not None:
+            for kind, date in zip(_DATE_KINDS, row):
+                if date is not None:
+                    vuln_data["dates"][kind] = date
+
+        return vuln_data
+
+    def __iter__(self):
+        for (vid,) in self._execute("SELECT vid FROM vulns ORDER BY id"):
+            yield vid
+
+    def __len__(self):
+        return self._execute_one("SELECT COUNT(*) FROM vulns")[0]
+
+    def __contains__(self, vid):
+        return self._execute_one(
+            "SELECT 1 FROM vulns WHERE vid = ?", (vid,)
+        ) is not None
+
+    ################################################################################################
+    def _execute(self, sql, parameters=()):
+        """ Return the list of rows of a SQL query, all read before another thread's query """
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    ################################################################################################
+    def _execute_one(self, sql, parameters=()):
+        """ Return the first row of a SQL query, or None """
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchone()
+
+    ################################################################################################
+    def close(self):
+        """ Close the SQLite file """
+        with self._lock:
+            self._connection.close()
+
+    ################################################################################################
+    def get_metadata(self):
+        """ Return a dictionary of the schema version and source VuXML file key """
+        return dict(self._execute("SELECT name, value FROM metadata"))
+
+    ################################################################################################
+    def get_changes(self):
+        """ Return a dictionary of the VID lists "added", "modified" and "removed" (including the
+        cancelled ones) by the last update of the VuXML file the SQLite file was saved from """
+        metadata = self.get_metadata()
+        changes = None
+        if self.filename.endswith(".sqlite") and "hash" in metadata:
+            key = (metadata["size"], metadata["mtime"], metadata["hash"])
+            changes = _read_index_cache(f"{self.filename[:-7]}.changes", key)
+        if changes is None:
+            return {"added": [], "modified": [], "removed": []}
+
+        return changes
+
+    ################################################################################################
+    def _get_affects(self, vuln_id):
+        """ Return the affects dictionary of a vulnerability """
+        affects = {}
+        rows = self._execute(
+            "SELECT affects.name, ranges.range_number, ranges.operator, ranges.version"
+            " FROM affects LEFT JOIN ranges ON ranges.affect = affects.id"
+            " WHERE affects.vuln = ? ORDER BY affects.id, ranges.rowid",
+            (vuln_id,)
+        )
+        for name, range_number, operator, version in rows:
+            version_ranges = affects.setdefault(name, [])
+            if range_number is None:
+                continue
+            if len(version_ranges) <= range_number:
+                version_ranges.append([])
+            if operator is not None:
+                version_ranges[range_number].append([operator, version])
+
+        return affects
+
+    ################################################################################################
+    def get_vulns_by_topics(self):
+        """ Return a dictionary of VID by topics """
+        topics = {}
+        for topic, vid in self._execute("SELECT topic, vid FROM vulns ORDER BY id"):
+            topics.setdefault(topic, []).append(vid)
+
+        return topics
+
+    ################################################################################################
+    def get_vulns_by_packages(self):
+        """ Return a dictionary of VID by packages/versions """
+        packages = {}
+        ranges = {}
+        rows = self._execute(
+            "SELECT affects.id, affects.name, vulns.vid, ranges.range_number, ranges.operator,"
+            " ranges.version FROM affects JOIN vulns ON vulns.id = affects.vuln"
+            " JOIN ranges ON ranges.affect = affects.id ORDER BY affects.vuln, ranges.rowid"
+        )
+        for affect_id, name, vid, range_number, operator, version in rows:
+            if (affect_id, range_number) not in ranges:
+                ranges[(affect_id, range_number)] = []
+                packages.setdefault(name, []).append([ranges[(affect_id, range_number)], vid])
+            if operator is not None:
+                ranges[(affect_id, range_number)].append([operator, version])
+
+        return packages
+
+    ################################################################################################
+    def get_vulns_by_references(self):
+        """ Return a dictionary of VID by category/reference """
+        return self._get_references(
+            "SELECT refs.source, refs.identifier, vulns.vid FROM refs"
+            " JOIN vulns ON vulns.id = refs.vuln ORDER BY refs.vuln, refs.rowid",
+            ()
+        )
+
+    ################################################################################################
+    def get_references_sources(self):
+        """ Return the list of references sources """
+        return [
+            source
+            for source, in self._execute(
+                "SELECT source FROM refs GROUP BY source ORDER BY MIN(rowid)"
+            )
+        ]
+
+    ################################################################################################
+    def _get_references(self, sql, sql_parameters):
+        """ Return a dictionary of VID by category/reference from a (source, identifier, VID)
+        SQL query """
+        references = {}
+        for source, identifier, vid in self._execute(sql, sql_parameters):
+            references.setdefault(source, {}).setdefault(identifier, []).append(vid)
+
+        return references
+
+    ################################################################################################
+    def get_vulns_by_identifiers(self):
+        """ Return a dictionary of (source, VID) lists by reference identifier """
+        identifiers = {}
+        rows = self._execute(
+            "SELECT refs.identifier, refs.source, vulns.vid FROM refs"
+            " JOIN vulns ON vulns.id = refs.vuln ORDER BY refs.vuln, refs.rowid"
+        )
+        for identifier, source, vid in rows:
+            identifiers.setdefault(identifier, []).append((source, vid))
+
+        return identifiers
+
+    ################################################################################################
+    def get_vulns_by_dates(self, kind):
+        """ Return a dictionary of VID by discovery, entry or modified dates """
+        if kind not in _DATE_KINDS:
+            return {}
+
+        dates = {}
+        rows = self._execute(
+            f"SELECT dates.{kind}, vulns.vid FROM dates JOIN vulns ON vulns.id = dates.vuln"
+            f" WHERE dates.{kind} IS NOT NULL ORDER BY dates.vuln"
+        )
+        for date, vid in rows:
+            dates.setdefault(date, []).append(vid)
+
+        return dates
+
+    ################################################################################################
+    def _get_words_sql(self, word, fields, prefix=False):
+        """ Return the SQL query and parameters selecting the vulnerabilities ids by word,
+        or word prefix, in words fields """
+        fields_sql = ", ".join("?" for _ in fields)
+        if prefix:
+            return (
+                f"SELECT vuln FROM words WHERE word >= ? AND word < ? AND field IN ({fields_sql})",
+                [word, word + chr(sys.maxunicode)] + fields
+            )
+        return (
+            f"SELECT vuln FROM words WHERE word = ? AND field IN ({fields_sql})",
+            [word] + fields
+        )
+
+    ################################################################################################
+    def search_vulns_by_words(self, words, in_topics=True, in_descriptions=True):
+        """ Return a list of VID by words, or words prefixes ending with '*',
+        all present in topics and/or descriptions """
+        fields = []
+        if in_topics:
+            fields.append("topic")
+        if in_descriptions:
+            fields.append("description")
+        if isinstance(words, str):
+            words = words.split()
+        if not fields:
+            return []
+
+        queries = []
+        sql_parameters = []
+        for word in words:
+            prefix = word.endswith("*")
+            parts = [part.casefold() for part in _WORD_REGEX.findall(word)]
+            for part_number, part in enumerate(parts):
+                part_prefix = prefix and part_number == len(parts) - 1
+                sql, part_parameters = self._get_words_sql(part, fields, prefix=part_prefix)
+                queries.append(sql)
+                sql_parameters += part_parameters
+        if not queries:
+            return []
+
+        return [
+            vid
+            for (vid,) in self._execute(
+                f"SELECT vid FROM vulns WHERE id IN ({' INTERSECT '.join(queries)}) ORDER BY id",
+                sql_parameters
+            )
+        ]
+
+    ################################################################################################
+    def search_vulns_by_regex(self, regex_string, in_topics=True, in_descriptions=True):
+        """ Return a list of VID by regex in topics and/or descriptions """
+        try:
+            _ = re.compile(regex_string)
+        except re.error as error:
+            logging.error(
+                "search_vulns_by_regex() argument is not a valid regular expression: %s",
+                error
+            )
+            return []
+
+        conditions = []
+        sql_parameters = []
+        if in_topics:
+            conditions.append("topic REGEXP ?")
+            sql_parameters.append(regex_string)
+        if in_descriptions:
+            conditions.append("description REGEXP ?")
+            sql_parameters.append(regex_string)
+        if not conditions:
+            return []
+        sql = f"SELECT vid FROM vulns WHERE ({' OR '.join(conditions)})"
+
+        # Only check the vulnerabilities containing the words required by the regex
+        fields = []
+        if in_topics:
+            fields.append("topic")
+        if in_descriptions:
+            fields += ["description", "markup"]
+        fields_sql = ", ".join("?" for _ in fields)
+        for literal in _get_required_literals(regex_string):
+            parts = [part.casefold() for part in _WORD_REGEX.findall(literal)]
+            if parts:
+                sql += f" AND id IN (SELECT vuln FROM words WHERE instr(word, ?) > 0" \
+                       f" AND field IN ({fields_sql}))"
+                sql_parameters += [max(parts, key=len)] + fields
+
+        return [
+            vid for (vid,) in self._execute(sql + " ORDER BY id", sql_parameters)
+        ]
+
+    ################################################################################################
+    def search_vulns_by_reference(self, source, identifier):
+        """ Return a list of VID by source & identifier in references """
+        if identifier:
+            sql = "SELECT vulns.vid FROM refs JOIN vulns ON vulns.id = refs.vuln" \
+                  " WHERE refs.identifier = ?"
+            sql_parameters = [identifier]
+            if source:
+                sql += " AND refs.source = ?"
+                sql_parameters.append(source)
+            return [
+                vid
+                for (vid,) in self._execute(
+                    sql + " ORDER BY refs.vuln, refs.rowid", sql_parameters
+                )
+            ]
+
+        sql = "SELECT refs.source, refs.identifier, vulns.vid FROM refs" \
+              " JOIN vulns ON vulns.id = refs.vuln"
+        sql_parameters = []
+        if source:
+            sql += " WHERE refs.source = ?"
+            sql_parameters.append(source)
+        references = self._get_references(sql + " ORDER BY refs.vuln, refs.rowid", sql_parameters)
+
+        vulns = []
+        for value in references.values():
+            for subvalue in value.values():
+                vulns += subvalue
+
+        return vulns
+
+    ################################################################################################
+    def resolve_references(self, references):
+        """ Return a dictionary of VID lists by reference from a list of "identifier"
+        or "source~identifier" strings """
+        results = {}
+        for reference in references:
+            source, separator, identifier = reference.partition("~")
+            if not separator or not re.fullmatch(r"\w*", source):
+                source = ""
+                identifier = reference
+            vulns = []
+            if identifier:
+                vulns = self.search_vulns_by_reference(source, identifier)
+            results[reference] = list(dict.fromkeys(vulns))
+
+        return results
+
+    ################################################################################################
+    def search_vulns_by_package(self, package_name, package_version, regex_names=False):
+        """ Return a list of VID by name & version in affects """
+        if regex_names:
+            try:
+                _ = re.compile(package_name)
+            except re.error as error:
+                logging.error("Package name is not a valid regular expression: %s", error)
+                return []
+            names = [
+                name
+                for (name,) in self._execute(
+                    "SELECT name FROM affects WHERE name REGEXP ? OR name = ?"
+                    " GROUP BY name ORDER BY MIN(id)",
+                    (package_name, package_name)
+                )
+            ]
+        else:
+            names = [package_name]
+
+        version_key = None
+        if package_version:
+            version_key = get_cached_version_key(package_version)
+
+        vulns = []
+        for name in names:
+            ranges = {}
+            rows = self._execute(
+                "SELECT vulns.vid, affects.id, ranges.range_number, ranges.operator,"
+                " ranges.version FROM affects JOIN vulns ON vulns.id = affects.vuln"
+                " JOIN ranges ON ranges.affect = affects.id WHERE affects.name = ?"
+                " ORDER BY affects.vuln, ranges.rowid",
+                (name,)
+            )
+            for vid, affect_id, range_number, operator, version in rows:
+                conditions = ranges.setdefault((affect_id, range_number), (vid, []))[1]
+                if operator is not None:
+                    conditions.append((operator, version))
+
+            # If no version is specified, we return all the VID for the name
+            for vid, conditions in ranges.values():
+                if version_key is not None:
+                    interval = _get_version_interval(conditions)
+                    if interval is None or not _is_in_interval(version_key, interval):
+                        continue
+                vulns.append(vid)
+
+        return list(dict.fromkeys(vulns))
+
+    ################################################################################################
+    def audit_packages(self, packages):
+        """ Return a dictionary of VID lists by "name-version" from a list of (name, version) """
+        results = {}
+        for name, version in packages:
+            if version:
+                results[f"{name}-{version}"] = self.search_vulns_by_package(name, version)
+            else:
+                results[name] = self.search_vulns_by_package(name, version)
+
+        return results
+
+    ################################################################################################
+    def search_vulns_by_date(self, kind, date):
+        """ Return a list of VID by date in discovery, entry or modified dates,
+        in the data structure order """
+        if kind not in _DATE_KINDS or not is_valid_date(date):
+            return []
+
+        # All the dates starting with date sort between date and date followed by the last character
+        return self._search_dates(kind, date, date + chr(sys.maxunicode), "dates.vuln")
+
+    ################################################################################################
+    def search_vulns_by_date_range(self, kind, since="", until=""):
+        """ Return a list of VID by discovery, entry or modified dates in the [since, until) range,
+        in chronological order """
+        if kind not in _DATE_KINDS \
+        or (since and not is_valid_date(since)) \
+        or (until and not is_valid_date(until)):
+            return []
+
+        return self._search_dates(kind, since, until, f"dates.{kind}, dates.vuln")
+
+    ################################################################################################
+    def _search_dates(self, kind, since, until, order):
+        """ Return a list of VID by kind dates in the [since, until) range, in the given order """
+        sql = f"SELECT vulns.vid FROM dates JOIN vulns ON vulns.id = dates.vuln" \
+              f" WHERE dates.{kind} IS NOT NULL"
+        sql_parameters = []
+        if since:
+            sql += f" AND dates.{kind} >= ?"
+            sql_parameters.append(since)
+        if until:
+            sql += f" AND dates.{kind} < ?"
+            sql_parameters.append(until)
+
+        return [
+            vid
+            for (vid,) in self._execute(
+                sql + f" ORDER BY {order}", sql_parameters
+            )
+        ]
+
+
+####################################################################################################
+def _is_sqlite_current(sqlite_filename, filename):
+    """ Return True if a SQLite file was saved from the current version of a VuXML file """
+    sqlite3 = _get_sqlite3()
+    try:
+        with SQLiteDatabase(sqlite_filename) as database:
+            metadata = database.get_metadata()
+        stat = os.stat(filename)
+    except (OSError, sqlite3.Error):
+        return False
+
+    if metadata.get("version") != SCHEMA_VERSION or metadata.get("size") != stat.st_size:
+        return False
+    if metadata.get("mtime") == stat.st_mtime_ns:
+        return True
+
+    # The source file was rewritten. Check if its contents really changed
+    return metadata.get("hash") == _get_file_key(filename)[2]
+
+
+####################################################################################################
+def load_vuxml_sqlite(filename="", max_age=CACHE_MAX_AGE, offline=False, jobs=1):
+    """ Return a SQLiteDatabase from a FreeBSD VuXML file, saving it next to this file first
+    if it's missing or outdated (parsing it with up to jobs processes) """
+    sqlite3 = _get_sqlite3()
+    if sqlite3 is None:
+        logging.error("SQLite storage needs Python's sqlite3 module")
+        return {}
+
+    if not filename:
+        filename = _download_vuxml(max_age=max_age, offline=offline)
+        if not filename:
+            return {}
+
+    sqlite_filename = filename + ".sqlite"
+    if not _is_sqlite_current(sqlite_filename, filename):
+        vuxml = load_vuxml(filename=filename, jobs=jobs)
+        if not save_vuxml_sqlite(vuxml, sqlite_filename, _get_file_key(filename)):
+            return {}
+
+    try:
+        return SQLiteDatabase(sqlite_filename)
+    except sqlite3.Error as error:
+        logging.error("Unable to open SQLite file '%s': %s", sqlite_filename, error)
+        return {}
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+""" vuxml - FreeBSD VuXML library instrumentation
+License: 3-clause BSD (see https://opensource.org/licenses/BSD-3-Clause)
+Author: Hubert Tournier
+
+The library reports the durations of its main phases (download check, parse,
+cache reads and writes, indexes building, package searches, rendering...)
+and counters (cache hits and misses, vulnerabilities parsed, invalid version
+ranges...) as (kind, name, value) events to the hooks registered with
+add_stats_hook(), kind being "phase" (with a duration in seconds) or
+"counter" (with a number to add).
+
+Phases can be nested: for example, "parse" happens during "update".
+Nothing is measured while no hook is registered.
+
+A VuXMLStats object is such a hook, which totals these events and reports
+them with the wall time, the versions keys cache use and the peak memory.
+"""
+
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Not available under Windows
+    resource = None
+
+from .pkgversion import get_cached_version_key
+
+_hooks = []
+
+
+####################################################################################################
+def add_stats_hook(hook):
+    """ Register a function called with (kind, name, value) instrumentation events """
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+####################################################################################################
+def remove_stats_hook(hook):
+    """ Unregister an instrumentation events function """
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+####################################################################################################
+def _emit(kind, name, value):
+    """ Send an instrumentation event to the registered hooks """
+    for hook in list(_hooks):
+        hook(kind, name, value)
+
+
+####################################################################################################
+def _count(name, value=1):
+    """ Add a value to an instrumentation counter """
+    if _hooks:
+        _emit("counter", name, value)
+
+
+####################################################################################################
+class _Phase:
+    """ A context manager measuring the duration of an instrumentation phase """
+
+    def __init__(self, name):
+        self.name = name
+        self._start = None
+
+    def __enter__(self):
+        if _hooks:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if self._start is not None and _hooks:
+            _emit("phase", self.name, time.perf_counter() - self._start)
+
+
+####################################################################################################
+def _phase(name):
+    """ Return a context manager measuring the duration of an instrumentation phase """
+    return _Phase(name)
+
+
+####################################################################################################
+def get_peak_memory():
+    """ Return the peak resident set size of the process in bytes, or None if not available """
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss
+    return max_rss * 1024
+
+
+####################################################################################################
+class VuXMLStats:
+    """ An instrumentation hook totalling phases durations and counters """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+
+    def __call__(self, kind, name, value):
+        if kind == "phase":
+            calls, seconds = self.phases.get(name, (0, 0.0))
+            self.phases[name] = (calls + 1, seconds + value)
+        elif kind == "counter":
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    ################################################################################################
+    def get_report(self):
+        """ Return a dictionary of the wall time, phases calls and durations, counters,
+        versions keys cache hits and misses, and peak memory in bytes (or None) """
+        cache_info = get_cached_version_key.cache_info()
+        return {
+            "wall time": time.perf_counter() - self.start,
+            "phases": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in self.phases.items()
+            },
+            "counters": dict(self.counters),
+            "version keys cache": {"hits": cache_info.hits, "misses": cache_info.misses},
+            "peak memory": get_peak_memory(),
+        }
+
+    ################################################################################################
+    def print_report(self, stream=None):
+        """ Print the report, to stderr by default """
+        if stream is None:
+            stream = sys.stderr
+
+        report = self.get_report()
+        print(f"Wall time: {report['wall time']:.3f} s", file=stream)
+        for name, phase in report["phases"].items():
+            print(f"  {name}: {phase['seconds']:.3f} s ({phase['calls']} calls)", file=stream)
+        for name, value in report["counters"].items():
+            print(f"{name.capitalize()}: {value}", file=stream)
+        print(
+            f"Version keys cache: {report['version keys cache']['hits']} hits, "
+            f"{report['version keys cache']['misses']} misses",
+            file=stream
+        )
+        if report["peak memory"] is not None:
+            print(f"Peak memory: {report['peak memory'] / 2 ** 20:.1f} MiB", file=stream)
@@ -0,0 +1,103 @@
+""" pytest configuration: test the sources tree rather than an installed package,
+with a small VuXML file served by a local HTTP server """
+
+import http.server
+import lzma
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+SOURCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SOURCES)
+
+VUXML = """<?xml version="1.0" encoding="utf-8"?>
+<vuxml xmlns="http://www.vuxml.org/apps/vuxml-1">
+  <vuln vid="00000000-0000-0000-0000-000000000001">
+    <topic>foo -- first vulnerability</topic>
+    <affects>
+      <package>
+        <name>foo</name>
+        <range><lt>1.2</lt></range>
+      </package>
+    </affects>
+    <description>
+      <body xmlns="http://www.w3.org/1999/xhtml"><p>Foo is vulnerable.</p></body>
+    </description>
+    <references><cvename>CVE-2024-0001</cvename></references>
+    <dates><discovery>2024-01-01</discovery><entry>2024-01-02</entry></dates>
+  </vuln>
+  <vuln vid="00000000-0000-0000-0000-000000000002">
+    <topic>foo -- second vulnerability</topic>
+    <affects>
+      <package>
+        <name>foo</name>
+        <range><ge>1.0</ge><lt>1.5</lt></range>
+      </package>
+    </affects>
+    <description>
+      <body xmlns="http://www.w3.org/1999/xhtml"><p>Foo is vulnerable again.</p></body>
+    </description>
+    <references><cvename>CVE-2024-0002</cvename></references>
+    <dates><discovery>2024-02-01</discovery><entry>2024-02-02</entry></dates>
+  </vuln>
+</vuxml>
+"""
+
+# Last-Modified header of the served file
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+####################################################################################################
+class _VuXMLHandler(http.server.BaseHTTPRequestHandler):
+    """ Send the xz VuXML file in two parts, so that concurrent downloads overlap,
+    or a bare 304 answer to a request conditional on its Last-Modified date """
+
+    def do_GET(self): # pylint: disable=C0103
+        """ Answer a GET request """
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        data = self.server.data
+        self.send_response(200)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data[:len(data) // 2])
+        self.wfile.flush()
+        time.sleep(0.5)
+        self.wfile.write(data[len(data) // 2:])
+
+    def log_message(self, *args): # pylint: disable=W0221
+        """ Don't log the requests """
+
+
+####################################################################################################
+@pytest.fixture(name="vuxml_server")
+def fixture_vuxml_server():
+    """ A local HTTP server of the VuXML file, with its URL and the list of requests headers """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _VuXMLHandler)
+    server.data = lzma.compress(VUXML.encode("utf-8"))
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/vuln.xml.xz"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+####################################################################################################
+@pytest.fixture(name="cache_directory")
+def fixture_cache_directory(tmp_path, monkeypatch):
+    """ An empty caching directory, used by this process and the ones it starts """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("LOCALAPPDATA", str(tmp_path))
+    if os.name == "nt":
+        return os.path.join(str(tmp_path), "cache", "vuxml")
+    return os.path.join(str(tmp_path), ".cache", "vuxml")
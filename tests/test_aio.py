@@ -0,0 +1,39 @@
+""" Tests of the asyncio API """
+
+import asyncio
+import os
+
+from vuxml.aio import load_vuxml_async
+from vuxml.stats import add_stats_hook, remove_stats_hook
+
+
+####################################################################################################
+def test_concurrent_loads(vuxml_server, cache_directory):
+    """ Concurrent loads with the same arguments download and parse the database once """
+    events = []
+
+    def hook(kind, name, value):
+        events.append((kind, name, value))
+
+    async def load_twice():
+        return await asyncio.gather(
+            load_vuxml_async(url=vuxml_server.url),
+            load_vuxml_async(url=vuxml_server.url)
+        )
+
+    add_stats_hook(hook)
+    loop = asyncio.new_event_loop()
+    try:
+        databases = loop.run_until_complete(load_twice())
+    finally:
+        loop.close()
+        remove_stats_hook(hook)
+
+    assert databases[0] is databases[1]
+    assert list(databases[0]) == [
+        "00000000-0000-0000-0000-000000000001",
+        "00000000-0000-0000-0000-000000000002",
+    ]
+    assert os.path.isfile(os.path.join(cache_directory, "vuln.xml"))
+    assert len(vuxml_server.requests) == 1
+    assert [name for kind, name, _ in events if kind == "phase"].count("parse") == 1
@@ -0,0 +1,70 @@
+""" Tests of the cached database download """
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from conftest import SOURCES, VUXML # pylint: disable=E0401
+from vuxml.library import _download_vuxml # pylint: disable=W0212
+
+# Number of processes downloading the database at the same time
+_PROCESSES = 2
+
+# A program downloading the database, and printing the number of vulnerabilities in it
+_DOWNLOAD = """
+import sys
+from vuxml.library import _download_vuxml, load_vuxml
+print(len(load_vuxml(filename=_download_vuxml(url=sys.argv[1]), use_cache=False)))
+"""
+
+
+####################################################################################################
+def test_concurrent_downloads(vuxml_server, cache_directory):
+    """ Processes updating the cache at the same time download the database once,
+    and all use the complete file """
+    environment = dict(os.environ, PYTHONPATH=SOURCES)
+    processes = [
+        subprocess.Popen( # pylint: disable=R1732
+            [sys.executable, "-c", _DOWNLOAD, vuxml_server.url],
+            env=environment,
+            stdout=subprocess.PIPE,
+            universal_newlines=True
+        )
+        for _ in range(_PROCESSES)
+    ]
+    outputs = [process.communicate(timeout=60)[0] for process in processes]
+
+    assert [process.returncode for process in processes] == [0] * _PROCESSES
+    assert outputs == ["2\n"] * _PROCESSES
+    assert len(vuxml_server.requests) == 1
+
+    with open(os.path.join(cache_directory, "vuln.xml"), encoding="utf-8") as file:
+        assert file.read().rstrip("\n") == VUXML.rstrip("\n")
+    assert sorted(os.listdir(cache_directory)) == [
+        "vuln.xml", "vuln.xml.lock", "vuln.xml.validators"
+    ]
+
+
+####################################################################################################
+def test_conditional_refresh(vuxml_server, cache_directory):
+    """ A database which didn't change isn't downloaded again, and keeps its validators """
+    filename = _download_vuxml(url=vuxml_server.url)
+    validators_filename = filename + ".validators"
+    with open(validators_filename, encoding="utf-8") as file:
+        validators = json.load(file)
+    assert "Last-Modified" in validators
+    mtime = os.stat(filename).st_mtime_ns
+
+    # The server doesn't repeat the validators in its 304 answers
+    for _ in range(2):
+        time.sleep(0.01)
+        assert _download_vuxml(url=vuxml_server.url, max_age=0) == filename
+        assert vuxml_server.requests[-1].get("If-Modified-Since") == validators["Last-Modified"]
+        with open(validators_filename, encoding="utf-8") as file:
+            assert json.load(file) == validators
+
+    assert len(vuxml_server.requests) == 3
+    assert os.stat(filename).st_mtime_ns == mtime
+    assert os.path.dirname(filename) == cache_directory
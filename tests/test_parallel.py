@@ -0,0 +1,49 @@
+""" Tests of the parallel parsing """
+
+import re
+
+from vuxml import library
+from vuxml.benchmark import generate_vuxml
+
+# Number of vulnerabilities in the generated file
+_COUNT = 300
+
+
+####################################################################################################
+def _write_vuxml(filename):
+    """ Write a generated VuXML file with cancelled vulnerabilities, and VIDs appearing several
+    times: modified, cancelled, or cancelled then added again further in the file """
+    generate_vuxml(filename, _COUNT)
+    with open(filename, encoding="utf-8") as file:
+        contents = file.read()
+
+    vulns = re.findall(r"  <vuln vid=.*?</vuln>\n", contents, re.S)
+    cancelled = [vuln.replace("    <topic>", "    <cancelled/>\n    <topic>", 1) for vuln in vulns]
+    repeated = [vuln.replace("<topic>", "<topic>Repeated ", 1) for vuln in vulns]
+    elements = [cancelled[number] if number % 7 == 0 else vuln for number, vuln in enumerate(vulns)]
+    elements += [repeated[number] for number in range(1, _COUNT, 11)]
+    elements += [cancelled[number] for number in range(2, _COUNT, 13)]
+    for number in range(3, _COUNT, 17):
+        elements += [cancelled[number], repeated[number]]
+
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write(contents[:contents.index(vulns[0])])
+        file.write("".join(elements))
+        file.write("</vuxml>\n")
+
+
+####################################################################################################
+def test_parallel_parse(tmp_path, monkeypatch):
+    """ Parsing in several processes gives the same data, in the same order, as a serial parse """
+    filename = str(tmp_path / "vuln.xml")
+    _write_vuxml(filename)
+    monkeypatch.setattr(library, "_PARALLEL_MIN_VULNS", 10)
+    assert library._parse_vuxml_parallel(filename, 2) is not None # pylint: disable=W0212
+
+    serial = library.load_vuxml(filename=filename, use_cache=False, jobs=1)
+    parallel = library.load_vuxml(filename=filename, use_cache=False, jobs=2)
+
+    assert parallel == serial
+    assert list(parallel) == list(serial)
+    assert len(serial) < _COUNT
+    assert any(vuln["topic"].startswith("Repeated ") for vuln in serial.values())
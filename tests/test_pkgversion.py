@@ -0,0 +1,40 @@
+""" Tests of the FreeBSD ports versions comparison library """
+
+import pytest
+
+from vuxml.pkgversion import compare_versions
+
+
+####################################################################################################
+@pytest.mark.parametrize("lower, higher", [
+    ("1.0", "1.1"),
+    ("1.0", "1.0.1"),
+    ("1.0_1", "1.0_2"),
+    ("2.0", "1.0,1"),
+    ("1.0.b1", "1.0"),
+    ("1.0", "1.0b1"),
+    ("1.0a1", "1.0a2"),
+    ("1.0a2", "1.0b1"),
+    ("2.0alpha9", "2.0beta1"),
+    ("2.0beta3", "2.0rc1"),
+    ("2.0pre2", "2.0rc1"),
+    ("1.0", "1.0pl1"),
+    ("*", "0"),
+])
+def test_compare_versions(lower, higher):
+    """ Versions are ordered like pkg(8) does """
+    assert compare_versions(lower, higher) == -1
+    assert compare_versions(higher, lower) == 1
+
+
+####################################################################################################
+@pytest.mark.parametrize("version1, version2", [
+    ("1.0", "1.0"),
+    ("1.0", "1.0.0"),
+    ("1.0", "1.0_0"),
+    ("1.0", "1.0,0"),
+    ("2.0beta1", "2.0b1"),
+])
+def test_equal_versions(version1, version2):
+    """ Equivalent versions compare as equal """
+    assert compare_versions(version1, version2) == 0
@@ -0,0 +1,81 @@
+""" Tests of the query server and its client """
+
+import os
+import socket
+import threading
+
+import pytest
+
+from conftest import VUXML # pylint: disable=E0401
+from vuxml.server import VuXMLClient, _create_server, _get_server_classes # pylint: disable=W0212
+from vuxml.shared import SharedVuXML
+
+
+####################################################################################################
+@pytest.fixture(name="client", params=["unix", "tcp"])
+def fixture_client(request, cache_directory):
+    """ A client of a server of the cached VuXML file, on a UNIX-domain socket or a TCP port """
+    if request.param == "unix" and not hasattr(socket, "AF_UNIX"):
+        pytest.skip("UNIX-domain sockets are not available")
+
+    os.makedirs(cache_directory)
+    with open(os.path.join(cache_directory, "vuln.xml"), "w", encoding="utf-8") as file:
+        file.write(VUXML)
+    holder = SharedVuXML(offline=True)
+    holder.reload()
+
+    address = "0" if request.param == "tcp" else os.path.join(cache_directory, "vuxml.sock")
+    server = _create_server(address)
+    assert server is not None
+    server.holder = holder
+    if request.param == "tcp":
+        address = str(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield VuXMLClient(address, timeout=10)
+
+    server.shutdown()
+    server.server_close()
+
+
+####################################################################################################
+def test_search(client):
+    """ Searches are answered with vulnerabilities records """
+    vulns = client.search({"package": ["foo~1.3"]})
+    assert [vuln["vid"] for vuln in vulns] == ["00000000-0000-0000-0000-000000000002"]
+    assert vulns[0]["topic"] == "foo -- second vulnerability"
+    assert "description" not in vulns[0]
+
+    vulns = client.search({"package": ["foo~1.1"], "word": ["again"]}, "all", True)
+    assert [vuln["vid"] for vuln in vulns] == ["00000000-0000-0000-0000-000000000002"]
+    assert vulns[0]["description"] == "<p>Foo is vulnerable again.</p>"
+
+    assert client.search({"package": ["bar"]}) == []
+    assert client.search({"discovery": ["not a date"]}) is None
+
+
+####################################################################################################
+def test_audit(client):
+    """ Packages audits are answered with vulnerabilities records and their package """
+    vulns = client.audit_packages([("foo", "1.1"), ("foo", "1.3"), ("bar", "1.0")])
+    assert [(vuln["package"], vuln["vid"]) for vuln in vulns] == [
+        ("foo-1.1", "00000000-0000-0000-0000-000000000001"),
+        ("foo-1.1", "00000000-0000-0000-0000-000000000002"),
+        ("foo-1.3", "00000000-0000-0000-0000-000000000002"),
+    ]
+    assert client.get_status()["vulnerabilities"] == 2
+
+
+####################################################################################################
+def test_no_unix_sockets(monkeypatch, tmp_path):
+    """ Without UNIX-domain sockets, socket paths are reported as errors """
+    _get_server_classes()
+    monkeypatch.delattr(socket, "AF_UNIX", raising=False)
+    monkeypatch.setattr(
+        "vuxml.server._get_server_classes",
+        lambda: _get_server_classes()[:2] + (None,)
+    )
+
+    assert _create_server(str(tmp_path / "vuxml.sock")) is None
+    assert VuXMLClient(str(tmp_path / "vuxml.sock")).get_status(log_errors=False) is None
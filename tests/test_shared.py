@@ -0,0 +1,92 @@
+""" Tests of the database shared by threads """
+
+import os
+import re
+import threading
+import time
+
+from conftest import VUXML # pylint: disable=E0401
+from vuxml import library
+from vuxml.library import search_vulns_by_words
+from vuxml.shared import SharedVuXML
+
+# Number of threads reading each shared database
+_READERS = 4
+
+# The next version of the VuXML file, with a modified and an added vulnerability
+_ADDED_VULN = VUXML[VUXML.index("  <vuln"):VUXML.index("  </vuln>") + len("  </vuln>\n")]
+_NEW_VUXML = VUXML.replace("second vulnerability", "second vulnerability, updated").replace(
+    "</vuxml>", _ADDED_VULN.replace("-000000000001", "-000000000003") + "</vuxml>"
+)
+
+# VIDs and words search results of the old and new versions
+_OLD_SNAPSHOT = (
+    ["00000000-0000-0000-0000-000000000001", "00000000-0000-0000-0000-000000000002"],
+    [],
+)
+_NEW_SNAPSHOT = (
+    _OLD_SNAPSHOT[0] + ["00000000-0000-0000-0000-000000000003"],
+    ["00000000-0000-0000-0000-000000000002"],
+)
+
+
+####################################################################################################
+def test_reload(cache_directory, monkeypatch):
+    """ Threads reading databases reloaded with a tiny TTL see a complete old or new version,
+    and the databases reloading at the same time don't share their temporary files """
+    os.makedirs(cache_directory)
+    filename = os.path.join(cache_directory, "vuln.xml")
+    with open(filename, "w", encoding="utf-8") as file:
+        file.write(VUXML)
+    # The threads each temporary file name was given to
+    temporary_filenames = {}
+    get_temporary_filename = library._get_temporary_filename # pylint: disable=W0212
+
+    def record_temporary_filename(filename):
+        temporary_filename = get_temporary_filename(filename)
+        temporary_filenames.setdefault(temporary_filename, set()).add(threading.get_ident())
+        return temporary_filename
+
+    monkeypatch.setattr(library, "_get_temporary_filename", record_temporary_filename)
+    holders = [SharedVuXML(offline=True, ttl=0.01) for _ in range(2)]
+    for holder in holders:
+        holder.reload()
+
+    snapshots = []
+    errors = []
+
+    def read(holder):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                database = holder.get_database()
+                snapshot = (list(database), search_vulns_by_words(database, "updated"))
+                assert snapshot in (_OLD_SNAPSHOT, _NEW_SNAPSHOT)
+                assert all(vuln["description"] for vuln in database.values())
+            except Exception as error: # pylint: disable=W0703
+                errors.append(error)
+                return
+            snapshots.append(snapshot)
+            if snapshot == _NEW_SNAPSHOT:
+                return
+            time.sleep(0.001)
+
+    threads = [
+        threading.Thread(target=read, args=(holder,)) for holder in holders for _ in range(_READERS)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+
+    # Like a download, the new version replaces the old one at once
+    with open(filename + ".new", "w", encoding="utf-8") as file:
+        file.write(_NEW_VUXML)
+    os.replace(filename + ".new", filename)
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert _OLD_SNAPSHOT in snapshots
+    assert snapshots.count(_NEW_SNAPSHOT) == len(threads)
+    assert all(len(idents) == 1 for idents in temporary_filenames.values())
+    assert not [name for name in os.listdir(cache_directory) if re.search(r"\.\d+\.\d+$", name)]
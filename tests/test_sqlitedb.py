@@ -0,0 +1,60 @@
+""" Tests of the SQLite storage """
+
+import threading
+
+import pytest
+
+from conftest import VUXML # pylint: disable=E0401
+from vuxml.library import load_vuxml, search_vulns_by_package
+from vuxml.sqlitedb import SQLiteDatabase, save_vuxml_sqlite
+
+
+####################################################################################################
+@pytest.fixture(name="database")
+def fixture_database(tmp_path):
+    """ A SQLiteDatabase saved from a small VuXML file """
+    filename = tmp_path / "vuln.xml"
+    filename.write_text(VUXML, encoding="utf-8")
+    sqlite_filename = str(tmp_path / "vuln.xml.sqlite")
+    assert save_vuxml_sqlite(load_vuxml(filename=str(filename), use_cache=False), sqlite_filename)
+
+    with SQLiteDatabase(sqlite_filename) as database:
+        yield database
+
+
+####################################################################################################
+def test_search(database):
+    """ The package searches match the versions ranges """
+    assert search_vulns_by_package(database, "foo", "1.1") == [
+        "00000000-0000-0000-0000-000000000001",
+        "00000000-0000-0000-0000-000000000002",
+    ]
+    assert search_vulns_by_package(database, "foo", "1.3") == [
+        "00000000-0000-0000-0000-000000000002",
+    ]
+
+
+####################################################################################################
+def test_other_threads(database):
+    """ The database can be queried from other threads than the one which opened it """
+    results = []
+    errors = []
+
+    def query():
+        try:
+            for _ in range(50):
+                results.append(search_vulns_by_package(database, "foo", "1.3"))
+                results.append(list(database))
+        except Exception as error: # pylint: disable=W0703
+            errors.append(error)
+
+    threads = [threading.Thread(target=query) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(results) == 400
+    assert ["00000000-0000-0000-0000-000000000002"] in results
+    assert len(database) == 2